@@ -0,0 +1,160 @@
+import json
+import struct
+import zlib
+import numpy as np
+from typing import Dict, Optional
+from brickbuilder.core.chunk import Chunk, ChunkKey, CHUNK_SIZE
+from brickbuilder.core.json_format import ProgressCallback
+from brickbuilder.core.palette import Palette
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional, zlib is always available
+    zstandard = None
+
+# Layout (little-endian):
+#   header       MAGIC, version u16, flags u16, palette count u32, brick count u64, chunk count u32
+#   palette      (P, 3) float32 RGB, then u32 length + UTF-8 JSON list of names (null = unnamed)
+#   chunk table  CHUNK_TABLE_DTYPE x chunk count
+#   chunk data   per chunk: (N,) uint16 palette indices then (N, 3) uint8 local positions,
+#                stored raw or compressed as a whole according to the chunk's codec
+MAGIC = b"BRKB"
+FORMAT_VERSION = 1
+EXTENSION = ".bbm"
+
+_HEADER = struct.Struct("<4sHHIQI")
+
+CODEC_RAW = 0
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+CODECS = {"none": CODEC_RAW, "zlib": CODEC_ZLIB, "zstd": CODEC_ZSTD}
+
+CHUNK_TABLE_DTYPE = np.dtype([
+    ("key", "<i4", (3,)),
+    ("count", "<u4"),
+    ("offset", "<u8"),
+    ("size", "<u8"),
+    ("codec", "u1"),
+    ("reserved", "u1", (7,)),
+])
+
+
+def is_binary_model(filename: str) -> bool:
+    with open(filename, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def _compress(data: bytes, codec: int) -> bytes:
+    if codec == CODEC_ZLIB:
+        return zlib.compress(data, 6)
+    if codec == CODEC_ZSTD:
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return data
+
+
+def _decompress(data, codec: int) -> bytes:
+    if codec == CODEC_RAW:
+        return data
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(data)
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise ValueError("File uses zstd compression, but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    raise ValueError(f"Unknown chunk codec {codec}")
+
+
+def save_binary(model, filename: str, compression: str = "zlib",
+                progress: Optional[ProgressCallback] = None) -> None:
+    if compression not in CODECS:
+        raise ValueError(f"Unknown compression '{compression}'")
+    codec = CODECS[compression]
+    if codec == CODEC_ZSTD and zstandard is None:
+        raise ValueError("zstd compression needs the zstandard package")
+
+    palette = model.palette
+    names = json.dumps([entry.get("name") for entry in palette.to_list()]).encode("utf-8")
+    chunks = [model.chunks[key] for key in sorted(model.chunks)]
+    table = np.zeros(len(chunks), dtype=CHUNK_TABLE_DTYPE)
+
+    with open(filename, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, 0, len(palette), model.brick_count, len(chunks)))
+        f.write(np.ascontiguousarray(palette.colors, dtype="<f4").tobytes())
+        f.write(struct.pack("<I", len(names)))
+        f.write(names)
+
+        # Reserve the table, stream the chunk payloads, then come back and fill it in
+        table_offset = f.tell()
+        f.write(table.tobytes())
+
+        for i, chunk in enumerate(chunks):
+            positions, color_index = chunk.arrays()
+            local = (positions - chunk.origin).astype(np.uint8)
+            raw = color_index.astype("<u2").tobytes() + local.tobytes()
+            data = _compress(raw, codec)
+            chunk_codec = codec
+            if len(data) >= len(raw):
+                # Not worth it for this chunk, keep it directly mappable
+                data = raw
+                chunk_codec = CODEC_RAW
+            table[i]["key"] = chunk.key
+            table[i]["count"] = chunk.count
+            table[i]["offset"] = f.tell()
+            table[i]["size"] = len(data)
+            table[i]["codec"] = chunk_codec
+            f.write(data)
+            if progress:
+                progress(i + 1, len(chunks))
+
+        f.seek(table_offset)
+        f.write(table.tobytes())
+
+
+def load_binary(filename: str, progress: Optional[ProgressCallback] = None):
+    # Returns (palette, chunks). Raw chunks are read straight out of a memory map and
+    # compressed ones through frombuffer; no Python object is created per brick.
+    data = np.memmap(filename, dtype=np.uint8, mode="r")
+    if len(data) < _HEADER.size:
+        raise ValueError("File is too short to be a BrickBuilder model")
+    magic, version, _flags, palette_count, brick_count, chunk_count = _HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a BrickBuilder binary model")
+    if version > FORMAT_VERSION:
+        raise ValueError(f"Unsupported binary model version {version}")
+
+    offset = _HEADER.size
+    colors = np.frombuffer(data, dtype="<f4", count=palette_count * 3, offset=offset).reshape(-1, 3)
+    offset += colors.nbytes
+    (names_length,) = struct.unpack_from("<I", data, offset)
+    offset += 4
+    names = json.loads(bytes(data[offset:offset + names_length]).decode("utf-8"))
+    offset += names_length
+    palette = Palette.from_list([
+        {"r": float(r), "g": float(g), "b": float(b), "name": name}
+        for (r, g, b), name in zip(colors.tolist(), names)
+    ])
+
+    table = np.frombuffer(data, dtype=CHUNK_TABLE_DTYPE, count=chunk_count, offset=offset)
+    chunks: Dict[ChunkKey, Chunk] = {}
+    total = 0
+    for key, count, chunk_offset, size, codec in zip(
+            table["key"].tolist(), table["count"].tolist(), table["offset"].tolist(),
+            table["size"].tolist(), table["codec"].tolist()):
+        payload = _decompress(data[chunk_offset:chunk_offset + size], codec)
+        color_index = np.frombuffer(payload, dtype="<u2", count=count)
+        local = np.frombuffer(payload, dtype=np.uint8, count=count * 3, offset=count * 2).reshape(-1, 3)
+        if count and (local.max() >= CHUNK_SIZE or color_index.max() >= palette_count):
+            raise ValueError("Corrupt chunk in binary model")
+
+        chunk = Chunk(tuple(key))
+        chunk.insert_many(local.astype(np.int32) + chunk.origin, color_index)
+        if int((chunk.slots >= 0).sum()) != count:
+            raise ValueError("Corrupt chunk in binary model (duplicate cells)")
+        chunks[chunk.key] = chunk
+        total += count
+        if progress:
+            progress(len(chunks), chunk_count)
+
+    if total != brick_count:
+        raise ValueError("Brick count does not match header")
+    return palette, chunks
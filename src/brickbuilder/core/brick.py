@@ -1,6 +1,11 @@
 import glm
 
 class Brick:
-    def __init__(self, position: glm.ivec3, color: glm.vec3):
+    # Lightweight view handed out by Model; the model itself stores bricks as arrays
+    # with a palette index per brick.
+    __slots__ = ("position", "color", "color_index")
+
+    def __init__(self, position: glm.ivec3, color: glm.vec3, color_index: int = -1):
         self.position = position
         self.color = color
+        self.color_index = color_index
@@ -1,83 +1,182 @@
 import glm
 import math
+from brickbuilder.core.frustum import frustum_planes
 
 class Camera:
     def __init__(self):
+        # Bumped by every method that moves the camera. Derived matrices are cached
+        # against it, and renderers/pickers can compare it to know nothing moved.
+        self.revision = 0
+        self._cache_revision = -1
         self.reset()
-        
+
     def reset(self):
         self.target = glm.vec3(0.0, 0.0, 0.0)
         self.distance = 50.0 # Keep camera far enough back
         self.yaw = -math.pi / 4  # 45 degrees
         self.pitch = math.pi / 6 # 30 degrees
         self.scale = 20.0
-        
+
         # Up vector for the world (Z-up)
         self.world_up = glm.vec3(0.0, 0.0, 1.0) # Z is up
-        
+
         self.aspect_ratio = 16/9
         self.near_plane = 0.1
         self.far_plane = 500.0
-        
-    def get_view_matrix(self):
-        x = self.distance * math.cos(self.pitch) * math.cos(self.yaw)
-        y = self.distance * math.cos(self.pitch) * math.sin(self.yaw)
-        z = self.distance * math.sin(self.pitch)
-        
-        eye = self.target + glm.vec3(x, y, z)
-        return glm.lookAt(eye, self.target, self.world_up)
+        self.mark_changed()
+
+    def copy(self):
+        # Independent camera with the same view, e.g. for a render on another thread
+        other = Camera()
+        other.target = glm.vec3(self.target)
+        other.distance = self.distance
+        other.yaw = self.yaw
+        other.pitch = self.pitch
+        other.scale = self.scale
+        other.world_up = glm.vec3(self.world_up)
+        other.aspect_ratio = self.aspect_ratio
+        other.near_plane = self.near_plane
+        other.far_plane = self.far_plane
+        other.mark_changed()
+        return other
+
+    def mark_changed(self):
+        # Call after assigning camera fields directly
+        self.revision += 1
+
+    def _update(self):
+        if self._cache_revision == self.revision:
+            return
+        cos_pitch = math.cos(self.pitch)
+        # Unit vector from the target towards the eye
+        offset = glm.vec3(cos_pitch * math.cos(self.yaw), cos_pitch * math.sin(self.yaw), math.sin(self.pitch))
+
+        self._eye = self.target + offset * self.distance
+        self._view = glm.lookAt(self._eye, self.target, self.world_up)
 
-    def get_projection_matrix(self):
         # logical_width = self.scale * self.aspect_ratio
         # logical_height = self.scale
-        
         w = self.scale * self.aspect_ratio
         h = self.scale
-        
-        return glm.ortho(-w/2, w/2, -h/2, h/2, self.near_plane, self.far_plane)
+        self._projection = glm.ortho(-w/2, w/2, -h/2, h/2, self.near_plane, self.far_plane)
+
+        self._view_projection = self._projection * self._view
+        self._inverse_view = glm.affineInverse(self._view)
+        self._inverse_view_projection = glm.inverse(self._view_projection)
+        self._frustum_planes = frustum_planes(self._view_projection)
+
+        # Columns of the inverse view are the eye axes in world space:
+        # Col 0 = Right, Col 1 = Up, Col 2 = Back
+        self._right = glm.vec3(self._inverse_view[0])
+        self._up = glm.vec3(self._inverse_view[1])
+        self._forward = -glm.vec3(self._inverse_view[2])
+
+        # Rotation-only view for the orientation gizmo: same angles, fixed distance
+        self._gizmo_view = glm.lookAt(offset * 3.0, glm.vec3(0, 0, 0), self.world_up)
+        self._cache_revision = self.revision
+
+    @property
+    def eye(self):
+        self._update()
+        return self._eye
+
+    @property
+    def view_matrix(self):
+        self._update()
+        return self._view
+
+    @property
+    def projection_matrix(self):
+        self._update()
+        return self._projection
+
+    @property
+    def view_projection_matrix(self):
+        self._update()
+        return self._view_projection
+
+    @property
+    def inverse_view_matrix(self):
+        self._update()
+        return self._inverse_view
+
+    @property
+    def inverse_view_projection_matrix(self):
+        self._update()
+        return self._inverse_view_projection
+
+    @property
+    def frustum_planes(self):
+        # (6, 4) world-space clip planes, see core.frustum
+        self._update()
+        return self._frustum_planes
+
+    @property
+    def right(self):
+        self._update()
+        return self._right
+
+    @property
+    def up(self):
+        self._update()
+        return self._up
+
+    @property
+    def forward(self):
+        self._update()
+        return self._forward
+
+    @property
+    def gizmo_view_matrix(self):
+        self._update()
+        return self._gizmo_view
+
+    def window_projection(self, x0, y0, x1, y1, width, height):
+        # Ortho projection of the sub-frustum seen by pixels x0..x1, y0..y1 (y down
+        # from the top row) of a width x height image of this view, for tiled renders
+        w = self.scale * self.aspect_ratio
+        h = self.scale
+        left = -w / 2 + w * x0 / width
+        right = -w / 2 + w * x1 / width
+        top = h / 2 - h * y0 / height
+        bottom = h / 2 - h * y1 / height
+        return glm.ortho(left, right, bottom, top, self.near_plane, self.far_plane)
+
+    def get_view_matrix(self):
+        return glm.mat4(self.view_matrix)
+
+    def get_projection_matrix(self):
+        return glm.mat4(self.projection_matrix)
 
     def set_aspect_ratio(self, aspect):
-        self.aspect_ratio = aspect
+        if aspect != self.aspect_ratio:
+            self.aspect_ratio = aspect
+            self.mark_changed()
 
     def orbit(self, delta_yaw, delta_pitch):
         # Rotate around World Z (Yaw)
         self.yaw += delta_yaw
-        
+
         # Rotate around Local X (Pitch)
         self.pitch += delta_pitch
-        
+
         # Clamp pitch to avoid gimbal lock/flipping
         limit = math.pi / 2 - 0.01
         self.pitch = max(-limit, min(limit, self.pitch))
+        self.mark_changed()
 
     def zoom(self, delta):
         # For ortho, zoom means changing the scale (view size)
         sensitivity = 2.0
         self.scale -= delta * sensitivity
         self.scale = max(0.1, min(self.scale, 500.0))
+        self.mark_changed()
 
     def pan(self, dx, dy):
-        # Calculate right and up vectors relative to camera
-        view = self.get_view_matrix()
-        # View matrix (row-major in memory if we just look at indices from glm if not transposed? 
-        # Wait, glm objects in python are accessible [col][row].
-        # view[0] is col 0 (Right vector).
-        # view[1] is col 1 (Up vector).
-        # view[2] is col 2 (Forward vector).
-        # Since view matrix transforms World -> Eye.
-        # The rows of the rotation part are the basis vectors of World expressed in Eye space?
-        # Inverse of view matrix (Eye -> World) has the basis vectors of Eye expressed in World space as Columns.
-        
-        # Let's extract Right and Up from the inverse view matrix to move in world space relative to screen.
-        inv_view = glm.inverse(view)
-        
-        # In GLM/OpenGL:
-        # Col 0 = Right
-        # Col 1 = Up
-        # Col 2 = Back
-        right = glm.vec3(inv_view[0])
-        up = glm.vec3(inv_view[1])
-        
+        # Move the target in the screen plane, using the cached eye axes in world space
+        right = self.right
+        up = self.up
+
         # Using scale for ortho panning
-        self.target -= right * dx * self.scale
-        self.target -= up * dy * self.scale
+        self.target = self.target - right * dx * self.scale - up * dy * self.scale
+        self.mark_changed()
@@ -0,0 +1,54 @@
+import numpy as np
+from typing import Callable, Optional
+from brickbuilder.core.chunk import affected_chunk_keys
+
+# Palette index used for "no brick" in before/after columns
+EMPTY = -1
+
+
+class ChangeBatch:
+    # One model edit as parallel columns: the cells touched and their palette index
+    # before and after (EMPTY = no brick). A cell is added when before is EMPTY,
+    # removed when after is EMPTY and recoloured otherwise. A reset batch carries no
+    # cells and means the whole model was replaced (load, clear).
+    def __init__(self, positions: np.ndarray, before: np.ndarray, after: np.ndarray,
+                 revision: int = 0, reset: bool = False) -> None:
+        self.positions = np.asarray(positions, dtype=np.int32).reshape(-1, 3)
+        self.before = np.asarray(before, dtype=np.int32)
+        self.after = np.asarray(after, dtype=np.int32)
+        self.revision = revision
+        self.reset = reset
+        self._chunk_keys: Optional[np.ndarray] = None
+
+    @classmethod
+    def full_reset(cls, revision: int) -> "ChangeBatch":
+        empty = np.zeros(0, np.int32)
+        return cls(np.zeros((0, 3), np.int32), empty, empty, revision, reset=True)
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    @property
+    def added(self) -> np.ndarray:
+        return (self.before == EMPTY) & (self.after != EMPTY)
+
+    @property
+    def removed(self) -> np.ndarray:
+        return (self.before != EMPTY) & (self.after == EMPTY)
+
+    @property
+    def recolored(self) -> np.ndarray:
+        return (self.before != EMPTY) & (self.after != EMPTY)
+
+    def inverse(self) -> "ChangeBatch":
+        # The batch that undoes this one
+        return ChangeBatch(self.positions, self.after, self.before)
+
+    def affected_chunks(self) -> np.ndarray:
+        # (K, 3) keys of chunks whose mesh can change, including neighbours of border cells
+        if self._chunk_keys is None:
+            self._chunk_keys = affected_chunk_keys(self.positions)
+        return self._chunk_keys
+
+
+ChangeListener = Callable[[ChangeBatch], None]
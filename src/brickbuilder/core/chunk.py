@@ -0,0 +1,232 @@
+import numpy as np
+from typing import Iterator, Optional, Tuple
+
+# Chunks are CHUNK_SIZE^3 cells; cell -> chunk is a shift, cell -> local index a mask.
+CHUNK_SHIFT = 4
+CHUNK_SIZE = 1 << CHUNK_SHIFT
+CHUNK_MASK = CHUNK_SIZE - 1
+
+ChunkKey = Tuple[int, int, int]
+
+# Cells are packed into one int64 (21 bits per axis) for sorting and lookups
+_PACK_BITS = 21
+_PACK_OFFSET = 1 << (_PACK_BITS - 1)
+_PACK_MASK = (1 << _PACK_BITS) - 1
+
+_INITIAL_CAPACITY = 8
+
+# The 27 chunk offsets of a 3x3x3 neighbourhood
+_NEIGHBOUR_OFFSETS = np.array([(x, y, z) for x in (-1, 0, 1) for y in (-1, 0, 1) for z in (-1, 0, 1)], dtype=np.int32)
+
+
+def chunk_key(x: int, y: int, z: int) -> ChunkKey:
+    return (x >> CHUNK_SHIFT, y >> CHUNK_SHIFT, z >> CHUNK_SHIFT)
+
+
+def chunk_keys(positions: np.ndarray) -> np.ndarray:
+    # Vectorized version of chunk_key for (N, 3) int arrays
+    return positions >> CHUNK_SHIFT
+
+
+def pack_positions(positions: np.ndarray) -> np.ndarray:
+    p = positions.astype(np.int64) + _PACK_OFFSET
+    return (p[:, 0] << (2 * _PACK_BITS)) | (p[:, 1] << _PACK_BITS) | p[:, 2]
+
+
+def unpack_positions(keys: np.ndarray) -> np.ndarray:
+    out = np.empty((len(keys), 3), dtype=np.int32)
+    out[:, 0] = ((keys >> (2 * _PACK_BITS)) & _PACK_MASK) - _PACK_OFFSET
+    out[:, 1] = ((keys >> _PACK_BITS) & _PACK_MASK) - _PACK_OFFSET
+    out[:, 2] = (keys & _PACK_MASK) - _PACK_OFFSET
+    return out
+
+
+def group_by_chunk(positions: np.ndarray) -> Iterator[Tuple[ChunkKey, np.ndarray]]:
+    # Yields (chunk key, indices into positions) for every chunk the positions fall in
+    if len(positions) == 0:
+        return
+    packed = pack_positions(chunk_keys(positions))
+    order = np.argsort(packed, kind="stable")
+    packed = packed[order]
+    starts = np.flatnonzero(np.r_[True, packed[1:] != packed[:-1]])
+    ends = np.r_[starts[1:], len(order)]
+    keys = unpack_positions(packed[starts]).tolist()
+    for key, s, e in zip(keys, starts.tolist(), ends.tolist()):
+        yield tuple(key), order[s:e]
+
+
+def affected_chunk_keys(positions: np.ndarray) -> np.ndarray:
+    # Unique (K, 3) keys of the chunks holding the cells plus every neighbouring chunk
+    # whose faces/edges can change because a cell sits on its border
+    if len(positions) == 0:
+        return np.zeros((0, 3), dtype=np.int32)
+    positions = np.asarray(positions, dtype=np.int32)
+    local = positions & CHUNK_MASK
+    if len(positions) > 1:
+        # Cells in the same chunk touching the same borders affect the same chunks,
+        # so only one cell per (chunk, border side per axis) needs expanding
+        side = (local == 0) + 2 * (local == CHUNK_MASK)
+        code = pack_positions(chunk_keys(positions)) * 27 + (side[:, 0] * 9 + side[:, 1] * 3 + side[:, 2])
+        _, first = np.unique(code, return_index=True)
+        positions, local = positions[first], local[first]
+    lower = (local == 0)[:, None, :]
+    upper = (local == CHUNK_MASK)[:, None, :]
+    offsets = _NEIGHBOUR_OFFSETS[None, :, :]
+    valid = ((offsets == 0) | ((offsets < 0) & lower) | ((offsets > 0) & upper)).all(axis=2)
+    rows, which = np.nonzero(valid)
+    keys = chunk_keys(positions)[rows] + _NEIGHBOUR_OFFSETS[which]
+    if len(positions) == 1:
+        return keys
+    return unpack_positions(np.unique(pack_positions(keys)))
+
+
+class Chunk:
+    # Columnar brick storage for one CHUNK_SIZE^3 region.
+    # positions/color_index hold `count` packed rows; `slots` maps every local cell to
+    # its row (-1 when empty) and doubles as the occupancy grid. Removal swaps the last
+    # row into the hole, so rows stay dense.
+    def __init__(self, key: ChunkKey) -> None:
+        self.key = key
+        self.origin = np.array(key, dtype=np.int32) * CHUNK_SIZE
+        self.slots = np.full((CHUNK_SIZE,) * 3, -1, dtype=np.int16)
+        self.positions = np.empty((_INITIAL_CAPACITY, 3), dtype=np.int32)
+        self.color_index = np.empty(_INITIAL_CAPACITY, dtype=np.uint16)
+        self.count = 0
+        # Model revision of the last change that affects this chunk (including
+        # edits on a neighbouring chunk's border). Consumers compare it against the
+        # revision they last built from, so each one keeps its own dirty state.
+        self.revision = 0
+        self._bounds: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        self._bounds_valid = True
+
+    @property
+    def occupancy(self) -> np.ndarray:
+        return self.slots >= 0
+
+    @property
+    def nbytes(self) -> int:
+        return self.slots.nbytes + self.positions.nbytes + self.color_index.nbytes
+
+    def _reserve(self, needed: int) -> None:
+        capacity = len(self.color_index)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        positions = np.empty((capacity, 3), dtype=np.int32)
+        positions[:self.count] = self.positions[:self.count]
+        color_index = np.empty(capacity, dtype=np.uint16)
+        color_index[:self.count] = self.color_index[:self.count]
+        self.positions = positions
+        self.color_index = color_index
+
+    def get(self, lx: int, ly: int, lz: int) -> int:
+        # Palette index of the cell, or -1 if empty
+        row = self.slots[lx, ly, lz]
+        if row < 0:
+            return -1
+        return int(self.color_index[row])
+
+    def set(self, lx: int, ly: int, lz: int, color_index: int) -> bool:
+        if self.slots[lx, ly, lz] >= 0:
+            return False
+        self._reserve(self.count + 1)
+        row = self.count
+        self.positions[row] = (self.origin[0] + lx, self.origin[1] + ly, self.origin[2] + lz)
+        self.color_index[row] = color_index
+        self.slots[lx, ly, lz] = row
+        self.count += 1
+        if self._bounds_valid:
+            local = np.array((lx, ly, lz), dtype=np.int32)
+            if self._bounds is None:
+                self._bounds = (local, local.copy())
+            else:
+                self._bounds = (np.minimum(self._bounds[0], local), np.maximum(self._bounds[1], local))
+        return True
+
+    def recolor(self, lx: int, ly: int, lz: int, color_index: int) -> bool:
+        row = self.slots[lx, ly, lz]
+        if row < 0:
+            return False
+        self.color_index[row] = color_index
+        return True
+
+    def clear_cell(self, lx: int, ly: int, lz: int) -> bool:
+        row = int(self.slots[lx, ly, lz])
+        if row < 0:
+            return False
+        last = self.count - 1
+        if row != last:
+            moved = self.positions[last]
+            self.positions[row] = moved
+            self.color_index[row] = self.color_index[last]
+            m = moved - self.origin
+            self.slots[m[0], m[1], m[2]] = row
+        self.slots[lx, ly, lz] = -1
+        self.count -= 1
+        # Shrinking needs a rescan, do it lazily
+        self._bounds_valid = False
+        return True
+
+    def insert_many(self, positions: np.ndarray, color_index: np.ndarray) -> None:
+        # Append cells that are known to be empty and unique (callers filter first)
+        k = len(positions)
+        if k == 0:
+            return
+        self._reserve(self.count + k)
+        rows = np.arange(self.count, self.count + k)
+        self.positions[rows] = positions
+        self.color_index[rows] = color_index
+        local = positions - self.origin
+        self.slots[local[:, 0], local[:, 1], local[:, 2]] = rows
+        self.count += k
+        self._bounds_valid = False
+
+    def recolor_many(self, local: np.ndarray, color_index: np.ndarray) -> None:
+        # Recolour (K, 3) local cells that are known to be occupied
+        rows = self.slots[local[:, 0], local[:, 1], local[:, 2]]
+        self.color_index[rows] = color_index
+
+    def remove_many(self, local: np.ndarray) -> None:
+        # Remove (K, 3) local cells that are known to be occupied and unique,
+        # compacting the remaining rows in one pass
+        if len(local) == 0:
+            return
+        keep = np.ones(self.count, dtype=bool)
+        keep[self.slots[local[:, 0], local[:, 1], local[:, 2]]] = False
+        self.slots[local[:, 0], local[:, 1], local[:, 2]] = -1
+        count = int(keep.sum())
+        self.positions[:count] = self.positions[:self.count][keep]
+        self.color_index[:count] = self.color_index[:self.count][keep]
+        self.count = count
+        moved = self.positions[:count] - self.origin
+        self.slots[moved[:, 0], moved[:, 1], moved[:, 2]] = np.arange(count)
+        self._bounds_valid = False
+
+    def bounds(self) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        # Inclusive (min, max) of occupied cells in world coordinates
+        if not self._bounds_valid:
+            if self.count == 0:
+                self._bounds = None
+            else:
+                p = self.positions[:self.count] - self.origin
+                self._bounds = (p.min(axis=0), p.max(axis=0))
+            self._bounds_valid = True
+        if self._bounds is None:
+            return None
+        return self._bounds[0] + self.origin, self._bounds[1] + self.origin
+
+    def copy(self) -> "Chunk":
+        other = Chunk(self.key)
+        other.slots = self.slots.copy()
+        other.positions = self.positions.copy()
+        other.color_index = self.color_index.copy()
+        other.count = self.count
+        other.revision = self.revision
+        other._bounds = self._bounds
+        other._bounds_valid = self._bounds_valid
+        return other
+
+    def arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        # Views of the (N, 3) int32 positions and (N,) uint16 palette indices; do not mutate
+        return self.positions[:self.count], self.color_index[:self.count]
@@ -0,0 +1,28 @@
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from typing import Iterator
+
+
+@contextmanager
+def replacing_file(filename: str) -> Iterator[str]:
+    # Yields a temporary path next to `filename` to write to. On success the temporary
+    # file takes over the target's permissions (0644 for a new file) and is renamed over
+    # it, so a failed or cancelled write never leaves a truncated file behind.
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, temp = tempfile.mkstemp(prefix=".", suffix=".tmp", dir=directory)
+    os.close(fd)
+    try:
+        yield temp
+        if os.path.exists(filename):
+            shutil.copymode(filename, temp)
+        else:
+            os.chmod(temp, 0o644)
+        os.replace(temp, filename)
+    except BaseException:
+        try:
+            os.remove(temp)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,122 @@
+import numpy as np
+from typing import Optional, Tuple
+from brickbuilder.core.chunk import pack_positions, unpack_positions
+
+# The 6 face neighbours of a cell
+FACE_OFFSETS = np.array([(1, 0, 0), (-1, 0, 0), (0, 1, 0), (0, -1, 0), (0, 0, 1), (0, 0, -1)], dtype=np.int32)
+
+# Breadth-first levels before switching to whole-candidate labelling
+BFS_LEVELS = 32
+
+
+def face_neighbours(positions: np.ndarray) -> np.ndarray:
+    # (N, 3) cells -> (N * 6, 3) neighbours, 6 consecutive rows per cell
+    return (positions[:, None, :] + FACE_OFFSETS[None, :, :]).reshape(-1, 3)
+
+
+def exposed(model, positions: np.ndarray, known: Optional[np.ndarray] = None) -> np.ndarray:
+    # True for cells with at least one empty face neighbour (visible surface).
+    # Neighbours found in the sorted packed keys `known` count as occupied without
+    # a model lookup.
+    neighbours = face_neighbours(positions)
+    if known is None or not len(known):
+        return (model.lookup(neighbours) < 0).reshape(-1, 6).any(axis=1)
+    _, occupied = _find(known, neighbours)
+    unknown = ~occupied
+    occupied[unknown] = model.lookup(neighbours[unknown]) >= 0
+    return ~occupied.reshape(-1, 6).all(axis=1)
+
+
+def _candidates(model, color_index: int, max_layer: Optional[int]) -> np.ndarray:
+    # Sorted packed keys of every brick with the given color
+    parts = []
+    for positions, colors in model.iter_arrays():
+        selected = colors == color_index
+        if max_layer is not None:
+            selected &= positions[:, 2] <= max_layer
+        if selected.any():
+            parts.append(pack_positions(positions[selected]))
+    if not parts:
+        return np.zeros(0, dtype=np.int64)
+    return np.sort(np.concatenate(parts))
+
+
+def _find(keys: np.ndarray, positions: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # Index into sorted keys of each position, and which positions were found
+    packed = pack_positions(positions)
+    index = np.minimum(np.searchsorted(keys, packed), len(keys) - 1)
+    found = keys[index] == packed
+    return index[found], found
+
+
+def _components(keys: np.ndarray) -> np.ndarray:
+    # Connected-component root per sorted key (6-connectivity), by repeatedly hooking
+    # the larger root of every edge onto the smaller one and then compressing paths.
+    # Each round is a handful of vectorized passes; long thin shapes take O(log n) rounds.
+    cells = unpack_positions(keys)
+    a, b = [], []
+    for offset in FACE_OFFSETS[::2]:
+        index, found = _find(keys, cells + offset)
+        a.append(np.flatnonzero(found))
+        b.append(index)
+    a, b = np.concatenate(a), np.concatenate(b)
+    parent = np.arange(len(keys))
+    while len(a):
+        pa, pb = parent[a], parent[b]
+        open_edges = pa != pb
+        a, b, pa, pb = a[open_edges], b[open_edges], pa[open_edges], pb[open_edges]
+        if not len(a):
+            break
+        np.minimum.at(parent, np.maximum(pa, pb), np.minimum(pa, pb))
+        while True:
+            grand = parent[parent]
+            if (grand == parent).all():
+                break
+            parent = grand
+    return parent
+
+
+def connected_region(model, start, surface_only: bool = False, max_layer: Optional[int] = None) -> np.ndarray:
+    # (N, 3) cells 6-connected to `start` through bricks of the same color.
+    # With surface_only, only bricks with an exposed face are filled or crossed;
+    # max_layer ignores bricks above that Z layer (section view).
+    # Small regions are grown breadth-first, one vectorized step per level, looking
+    # neighbours up in the sorted keys of the candidate bricks. Regions still growing
+    # after BFS_LEVELS switch to labelling all candidates at once, so the cost does
+    # not depend on the region's length. Memory stays O(same-colored bricks).
+    start = np.array([tuple(start)], dtype=np.int32)
+    color_index = int(model.lookup(start)[0])
+    if color_index < 0 or (max_layer is not None and start[0, 2] > max_layer):
+        return np.zeros((0, 3), dtype=np.int32)
+    if surface_only and not exposed(model, start)[0]:
+        return np.zeros((0, 3), dtype=np.int32)
+    keys = _candidates(model, color_index, max_layer)
+    # Seen cells are not looked at again; filled is seen and part of the region
+    seen = np.zeros(len(keys), dtype=bool)
+    filled = np.zeros(len(keys), dtype=bool)
+    start_index, _ = _find(keys, start)
+    seen[start_index] = filled[start_index] = True
+    frontier = start
+    for _ in range(BFS_LEVELS):
+        if not len(frontier):
+            return unpack_positions(keys[filled])
+        cells = face_neighbours(frontier)
+        index, found = _find(keys, cells)
+        cells = cells[found]
+        new = ~seen[index]
+        index, first = np.unique(index[new], return_index=True)
+        cells = cells[new][first]
+        seen[index] = True
+        if surface_only and len(cells):
+            keep = exposed(model, cells, keys)
+            index, cells = index[keep], cells[keep]
+        filled[index] = True
+        frontier = cells
+    if not len(frontier):
+        return unpack_positions(keys[filled])
+
+    if surface_only:
+        keys = keys[exposed(model, unpack_positions(keys), keys)]
+        start_index, _ = _find(keys, start)
+    roots = _components(keys)
+    return unpack_positions(keys[roots == roots[start_index[0]]])
@@ -0,0 +1,60 @@
+import OpenGL.GL as gl
+
+
+class Framebuffer:
+    # Offscreen colour + depth target that can be blitted onto another framebuffer.
+    # The depth attachment is packed depth/stencil so it matches QOpenGLWidget's own
+    # framebuffer, which glBlitFramebuffer requires for depth copies.
+    def __init__(self) -> None:
+        self.fbo = 0
+        self.color = 0
+        self.depth = 0
+        self.width = 0
+        self.height = 0
+
+    @staticmethod
+    def is_supported() -> bool:
+        # Framebuffer objects and blits are GL 3.0 / ARB_framebuffer_object, exposed by
+        # most 2.1 compatibility contexts as well
+        return bool(gl.glGenFramebuffers) and bool(gl.glBlitFramebuffer)
+
+    def resize(self, width: int, height: int) -> bool:
+        # (Re)allocate storage; returns False if the framebuffer is unusable
+        if self.fbo and (width, height) == (self.width, self.height):
+            return True
+        self.release()
+        self.fbo = gl.glGenFramebuffers(1)
+        self.color, self.depth = gl.glGenRenderbuffers(2)
+        gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, self.fbo)
+        gl.glBindRenderbuffer(gl.GL_RENDERBUFFER, self.color)
+        gl.glRenderbufferStorage(gl.GL_RENDERBUFFER, gl.GL_RGBA8, width, height)
+        gl.glFramebufferRenderbuffer(gl.GL_FRAMEBUFFER, gl.GL_COLOR_ATTACHMENT0, gl.GL_RENDERBUFFER, self.color)
+        gl.glBindRenderbuffer(gl.GL_RENDERBUFFER, self.depth)
+        gl.glRenderbufferStorage(gl.GL_RENDERBUFFER, gl.GL_DEPTH24_STENCIL8, width, height)
+        gl.glFramebufferRenderbuffer(gl.GL_FRAMEBUFFER, gl.GL_DEPTH_ATTACHMENT, gl.GL_RENDERBUFFER, self.depth)
+        gl.glFramebufferRenderbuffer(gl.GL_FRAMEBUFFER, gl.GL_STENCIL_ATTACHMENT, gl.GL_RENDERBUFFER, self.depth)
+        gl.glBindRenderbuffer(gl.GL_RENDERBUFFER, 0)
+        complete = gl.glCheckFramebufferStatus(gl.GL_FRAMEBUFFER) == gl.GL_FRAMEBUFFER_COMPLETE
+        self.width = width
+        self.height = height
+        if not complete:
+            self.release()
+        return complete
+
+    def bind(self) -> None:
+        gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, self.fbo)
+
+    def blit_to(self, target: int) -> None:
+        # Copies colour and depth; leaves `target` bound for drawing
+        gl.glBindFramebuffer(gl.GL_READ_FRAMEBUFFER, self.fbo)
+        gl.glBindFramebuffer(gl.GL_DRAW_FRAMEBUFFER, target)
+        gl.glBlitFramebuffer(0, 0, self.width, self.height, 0, 0, self.width, self.height,
+                             gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT, gl.GL_NEAREST)
+        gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, target)
+
+    def release(self) -> None:
+        if self.fbo:
+            gl.glDeleteFramebuffers(1, [self.fbo])
+            gl.glDeleteRenderbuffers(2, [self.color, self.depth])
+        self.fbo = self.color = self.depth = 0
+        self.width = self.height = 0
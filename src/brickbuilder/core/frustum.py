@@ -0,0 +1,22 @@
+import numpy as np
+
+
+def frustum_planes(view_projection) -> np.ndarray:
+    # (6, 4) planes (a, b, c, d) of the clip volume in world space, inside where
+    # a*x + b*y + c*z + d >= 0; left, right, bottom, top, near, far.
+    # Gribb/Hartmann: each plane is row 3 of the matrix plus or minus row 0..2.
+    m = np.array(view_projection, dtype=np.float64)  # numpy copies of glm matrices are row-major
+    planes = np.empty((6, 4))
+    for i in range(3):
+        planes[2 * i] = m[3] + m[i]
+        planes[2 * i + 1] = m[3] - m[i]
+    return planes
+
+
+def boxes_visible(planes: np.ndarray, lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+    # Vectorized AABB test for (N, 3) min/max corners. A box is culled when its
+    # corner furthest along a plane's normal is still outside that plane.
+    normals = planes[:, :3]
+    far_corner = np.where(normals[None, :, :] >= 0, hi[:, None, :], lo[:, None, :])
+    distance = np.einsum("npk,pk->np", far_corner, normals) + planes[:, 3]
+    return (distance >= 0).all(axis=1)
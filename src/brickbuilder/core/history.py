@@ -0,0 +1,145 @@
+import numpy as np
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+from brickbuilder.core.changes import ChangeBatch
+from brickbuilder.core.chunk import pack_positions
+
+# Undo memory budget (both stacks together); oldest steps are dropped beyond it
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+class HistoryStep:
+    # One undoable action as columns: cells with their palette index before and
+    # after the action (EMPTY = no brick). About 20 bytes per touched cell.
+    def __init__(self, label: str, positions: np.ndarray, before: np.ndarray, after: np.ndarray) -> None:
+        self.label = label
+        self.positions = positions
+        self.before = before
+        self.after = after
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    @property
+    def nbytes(self) -> int:
+        return self.positions.nbytes + self.before.nbytes + self.after.nbytes
+
+
+def merge_batches(label: str, batches: List[ChangeBatch]) -> Optional[HistoryStep]:
+    # Collapse the batches of one action into a step: per cell, the first `before`
+    # and the last `after`. Cells that end up unchanged are dropped.
+    if len(batches) == 1:
+        positions, before, after = batches[0].positions, batches[0].before, batches[0].after
+    else:
+        positions = np.concatenate([b.positions for b in batches])
+        before = np.concatenate([b.before for b in batches])
+        after = np.concatenate([b.after for b in batches])
+        packed = pack_positions(positions)
+        order = np.argsort(packed, kind="stable")
+        packed = packed[order]
+        starts = np.flatnonzero(np.r_[True, packed[1:] != packed[:-1]])
+        ends = np.r_[starts[1:], len(packed)] - 1
+        positions = positions[order[starts]]
+        before = before[order[starts]]
+        after = after[order[ends]]
+    changed = before != after
+    if not changed.any():
+        return None
+    return HistoryStep(label, positions[changed].copy(), before[changed].copy(), after[changed].copy())
+
+
+class History:
+    # Undo/redo for a Model, recorded from its change journal. Batches emitted
+    # inside action() become one step; anything else is a step of its own.
+    # Undo and redo write a whole step back with a single Model._apply_cells call.
+    def __init__(self, model, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.model = model
+        self.max_bytes = max_bytes
+        self.undo_steps: List[HistoryStep] = []
+        self.redo_steps: List[HistoryStep] = []
+        self.nbytes = 0
+        self._pending: Optional[List[ChangeBatch]] = None
+        self._replaying = False
+        model.subscribe(self._record)
+
+    def detach(self) -> None:
+        self.model.unsubscribe(self._record)
+        self.clear()
+
+    def clear(self) -> None:
+        self.undo_steps = []
+        self.redo_steps = []
+        self.nbytes = 0
+
+    @contextmanager
+    def action(self, label: str = "") -> Iterator[None]:
+        # Group every edit made inside the block into one undo step. Nested blocks
+        # fold into the outer one.
+        if self._pending is not None:
+            yield
+            return
+        self._pending = []
+        try:
+            yield
+        finally:
+            batches, self._pending = self._pending, None
+            if batches:
+                self._push(merge_batches(label, batches))
+
+    def _record(self, batch: ChangeBatch) -> None:
+        if self._replaying:
+            return
+        if batch.reset:
+            # Load/clear replace the whole model; earlier steps no longer apply
+            self.clear()
+            if self._pending is not None:
+                self._pending = []
+            return
+        if self._pending is not None:
+            self._pending.append(batch)
+        else:
+            self._push(merge_batches("", [batch]))
+
+    def _push(self, step: Optional[HistoryStep]) -> None:
+        if step is None:
+            return
+        self.nbytes -= sum(s.nbytes for s in self.redo_steps)
+        self.redo_steps = []
+        self.undo_steps.append(step)
+        self.nbytes += step.nbytes
+        self._evict()
+
+    def _evict(self) -> None:
+        while self.nbytes > self.max_bytes and self.undo_steps:
+            self.nbytes -= self.undo_steps.pop(0).nbytes
+
+    @property
+    def can_undo(self) -> bool:
+        return bool(self.undo_steps)
+
+    @property
+    def can_redo(self) -> bool:
+        return bool(self.redo_steps)
+
+    def undo(self) -> bool:
+        if not self.undo_steps:
+            return False
+        step = self.undo_steps.pop()
+        self._replay(step.positions, step.before)
+        self.redo_steps.append(step)
+        return True
+
+    def redo(self) -> bool:
+        if not self.redo_steps:
+            return False
+        step = self.redo_steps.pop()
+        self._replay(step.positions, step.after)
+        self.undo_steps.append(step)
+        return True
+
+    def _replay(self, positions: np.ndarray, values: np.ndarray) -> None:
+        self._replaying = True
+        try:
+            self.model._apply_cells(positions, values)
+        finally:
+            self._replaying = False
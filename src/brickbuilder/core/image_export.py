@@ -0,0 +1,331 @@
+import numpy as np
+from typing import Callable, List, Optional, Tuple
+from brickbuilder.core.camera import Camera
+from brickbuilder.core.chunk import pack_positions
+from brickbuilder.core.files import replacing_file
+from brickbuilder.core.mesh import FACE_DIRECTIONS, SortedCellIndex, build_feature_edges
+from brickbuilder.core.model import Model
+from brickbuilder.core.png import PngWriter
+from brickbuilder.core.software_renderer import AMBIENT, BACKGROUND, LINE_WIDTH, render_model
+
+# Image export of the current view, raster or vector.
+# PNGs can have any resolution: the image is rendered in square tiles, each through
+# its own sub-frustum of the camera, and rows go to the PNG encoder a band of tiles
+# at a time, so memory is bounded by TILE_SIZE rows of the image rather than by the
+# whole image.
+# SVGs hold only the exposed faces turned towards the camera, in back-to-front order
+# (see _face_order), so the file needs no depth test and grows with the visible
+# surface rather than the brick count.
+
+# Tile edge in pixels
+TILE_SIZE = 512
+# SVG coordinates are written with this many decimals (pixels)
+SVG_DECIMALS = 2
+# Faces are stroked in their own color this wide, closing the hairline gaps that
+# anti-aliasing leaves between abutting polygons
+SVG_SEAM_WIDTH = 0.5
+
+# Polygon tracing: directed unit edges around a cell, counter-clockwise in (u, v).
+# Direction k runs along _EDGE_STEPS[k]; a left turn from k is (k + 1) % 4.
+_EDGE_STEPS = np.array([(1, 0), (0, 1), (-1, 0), (0, -1)], dtype=np.int64)
+# Start corner of the edge on side k of cell (u, v), and the neighbour across it
+_EDGE_STARTS = np.array([(0, 0), (1, 0), (1, 1), (0, 1)], dtype=np.int64)
+_EDGE_NEIGHBOURS = np.array([(0, -1), (1, 0), (0, 1), (-1, 0)], dtype=np.int64)
+_TRACE_BITS = 21
+_TRACE_OFFSET = 1 << (_TRACE_BITS - 1)
+# FACE_DIRECTIONS index by (axis, positive)
+_DIRECTION_INDEX = np.array([(4, 5), (2, 3), (1, 0)])
+# The two axes spanning a face, by normal axis
+_FACE_PLANE_AXES = np.array([(1, 2), (0, 2), (0, 1)])
+
+
+def export_png(model: Model, camera: Camera, filename: str, width: int, height: int,
+               section_z: Optional[float] = None, background=BACKGROUND, tile_size: int = TILE_SIZE,
+               progress: Optional[Callable[[int, int], None]] = None) -> None:
+    # Write the view of `camera` as a width x height PNG, widened or narrowed to the
+    # image's aspect ratio (the visible height is kept). Tiles are pixel-identical to
+    # the same pixels of a single render at that size. progress(done, total) counts
+    # tiles and may raise to cancel.
+    view = camera.copy()
+    view.set_aspect_ratio(width / height)
+    columns = range(0, width, tile_size)
+    rows = range(0, height, tile_size)
+    total = len(columns) * len(rows)
+    # Chunk meshes only depend on the zoom level, which is the same for every tile
+    meshes = {}
+    with replacing_file(filename) as temp, open(temp, "wb") as f:
+        writer = PngWriter(f, width, height)
+        done = 0
+        for y0 in rows:
+            band_height = min(tile_size, height - y0)
+            band = np.empty((band_height, width, 4), dtype=np.uint8)
+            for x0 in columns:
+                window = (x0, y0, min(tile_size, width - x0), band_height)
+                tile, _ = render_model(model, view, width, height, background, section_z=section_z,
+                                       meshes=meshes, window=window)
+                band[:, x0:x0 + window[2]] = tile
+                done += 1
+                if progress:
+                    progress(done, total)
+            writer.write_rows(band)
+        writer.close()
+
+
+def _trace_polygons(group: np.ndarray, u: np.ndarray, v: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    # Outlines of the union of unit cells (u, v) of each group, as closed loops of
+    # corners with collinear points dropped: counter-clockwise around the outside,
+    # clockwise around holes (fill with the nonzero rule). Cells that only touch at a
+    # corner get separate loops. Returns the group of each loop, each loop's first
+    # vertex index and the vertex u and v; loops come in ascending group order.
+    def pack(g, a, b):
+        return (g << (2 * _TRACE_BITS)) | ((a + _TRACE_OFFSET) << _TRACE_BITS) | (b + _TRACE_OFFSET)
+
+    group, u, v = group.astype(np.int64), u.astype(np.int64), v.astype(np.int64)
+    cells = np.sort(pack(group, u, v))
+    # Boundary edges: cell sides with no cell of the same group across them
+    parts = []
+    for k in range(4):
+        key = pack(group, u + _EDGE_NEIGHBOURS[k, 0], v + _EDGE_NEIGHBOURS[k, 1])
+        boundary = cells[np.minimum(np.searchsorted(cells, key), len(cells) - 1)] != key
+        parts.append((group[boundary], u[boundary] + _EDGE_STARTS[k, 0], v[boundary] + _EDGE_STARTS[k, 1],
+                      np.full(int(boundary.sum()), k)))
+    g, su, sv, k = (np.concatenate([p[i] for p in parts]) for i in range(4))
+    n = len(g)
+    if n == 0:
+        empty = np.zeros(0, np.int64)
+        return empty, empty, empty, empty
+    start = pack(g, su, sv)
+    order = np.lexsort((k, start))
+    g, su, sv, k, start = g[order], su[order], sv[order], k[order], start[order]
+
+    # Successor: the edge leaving this edge's end corner. Two leave it where cells
+    # touch diagonally; taking the left turn keeps such cells in separate loops.
+    end = pack(g, su + _EDGE_STEPS[k, 0], sv + _EDGE_STEPS[k, 1])
+    succ = np.searchsorted(start, end)
+    two = np.flatnonzero(np.searchsorted(start, end, side="right") - succ == 2)
+    succ[two] += k[succ[two]] != (k[two] + 1) % 4
+
+    # Label every loop by its smallest edge index, then rank edges by their distance
+    # to the loop's last edge (pointer jumping, O(log n) vectorized rounds each)
+    rounds = max(1, n.bit_length())
+    label = np.arange(n)
+    jump = succ
+    for _ in range(rounds):
+        label = np.minimum(label, label[jump])
+        jump = jump[jump]
+    last = succ == label
+    distance = (~last).astype(np.int64)
+    jump = np.where(last, np.arange(n), succ)
+    for _ in range(rounds):
+        distance += distance[jump]
+        jump = jump[jump]
+    order = np.lexsort((-distance, label))
+    g, su, sv, k, label = g[order], su[order], sv[order], k[order], label[order]
+
+    # A corner is kept where the direction changes from the previous edge of the loop
+    first = np.flatnonzero(np.r_[True, label[1:] != label[:-1]])
+    previous = np.arange(n) - 1
+    previous[first] = np.r_[first[1:], n] - 1
+    corner = k != k[previous]
+    offsets = np.cumsum(corner) - corner
+    return g[first], offsets[first], su[corner], sv[corner]
+
+
+def _face_order(cells: np.ndarray, axis: np.ndarray, eye: np.ndarray, merged_axis: int) -> np.ndarray:
+    # Painter's order of front-facing unit faces under an orthographic view, as a
+    # dense rank (0 = drawn first). `eye` points from the scene towards the camera.
+    # Cells are visited back to front slab by slab (Z layers), and within a slab
+    # column by column along merged_axis (X or Y): first the column's faces along
+    # the other horizontal axis, cell by cell back to front, then all its faces along
+    # merged_axis, which share a plane and one rank. A slab's horizontal faces share
+    # its last rank. Nothing can be hidden by a face drawn before it: a face is only
+    # covered by cells beyond its own plane, which come later in every one of these
+    # orders. Faces sharing a rank lie in one plane and may be merged.
+    other_axis = 1 - merged_axis
+    sign = np.where(eye >= 0, 1, -1)
+    horizontal = axis == 2
+    side = ~horizontal
+    columns = np.where(side, cells[:, merged_axis] * sign[merged_axis], 0)
+    along_other = side & (axis == other_axis)
+    keys = np.stack([
+        cells[:, 2] * sign[2],
+        horizontal,
+        columns,
+        axis == merged_axis,
+        np.where(along_other, cells[:, other_axis] * sign[other_axis], 0),
+    ], axis=1).astype(np.int64)
+    _, rank = np.unique(keys, axis=0, return_inverse=True)
+    return rank.reshape(-1)
+
+
+def _hex_colors(colors: np.ndarray) -> List[str]:
+    rgb = np.round(np.clip(colors, 0.0, 1.0) * 255).astype(np.int64)
+    return [f"#{r:02x}{g:02x}{b:02x}" for r, g, b in rgb.tolist()]
+
+
+def export_svg(model: Model, camera: Camera, filename: str, width: int, height: int,
+               section_z: Optional[float] = None, background=BACKGROUND, outlines: bool = True,
+               progress: Optional[Callable[[int, int], None]] = None) -> None:
+    # Write the view of `camera` as a width x height SVG (one unit per pixel), shaded
+    # like the viewport. Exposed front faces are merged into one polygon per plane,
+    # color and draw rank; outlines are the viewport's feature edges, each written
+    # once, right after the last face it borders so later faces in front cover it.
+    # progress(done, total) counts written elements and may raise to cancel.
+    view = camera.copy()
+    view.set_aspect_ratio(width / height)
+    positions, color_index = model.get_arrays()
+    if section_z is not None:
+        below = positions[:, 2] <= int(np.ceil(section_z)) - 1
+        positions, color_index = positions[below], color_index[below]
+    color_ids = color_index.astype(np.int32)
+    lookup = SortedCellIndex(positions, color_ids).lookup
+    eye = -np.array(view.forward, dtype=np.float64)
+    view_projection = np.array(view.view_projection_matrix, dtype=np.float64)
+
+    def project(points):
+        clip = points @ view_projection[:, :3].T + view_projection[:, 3]
+        return (clip[:, 0] / clip[:, 3] + 1) * 0.5 * width, (1 - clip[:, 1] / clip[:, 3]) * 0.5 * height
+
+    # Exposed faces turned towards the camera and near the image; a face reaches at
+    # most one brick's width of pixels from its center
+    reach = height / view.scale
+    cells, directions = [], []
+    for d, normal in enumerate(FACE_DIRECTIONS):
+        if normal @ eye <= 1e-9:
+            continue
+        exposed = positions[lookup(positions + normal) < 0]
+        x, y = project(exposed + 0.5 * normal + (0.0, 0.0, 0.5))
+        near = (x > -reach) & (x < width + reach) & (y > -reach) & (y < height + reach)
+        cells.append(exposed[near])
+        directions.append(np.full(int(near.sum()), d))
+    cells = np.concatenate(cells) if cells else np.zeros((0, 3), np.int32)
+    directions = np.concatenate(directions) if directions else np.zeros(0, np.int64)
+    axis = np.abs(FACE_DIRECTIONS[directions]).argmax(axis=1) if len(cells) else np.zeros(0, np.int64)
+    colors = lookup(cells)
+    # Merge whichever side family has more faces
+    merged_axis = 0 if (axis == 0).sum() >= (axis == 1).sum() else 1
+    rank = _face_order(cells, axis, eye, merged_axis)
+
+    # One polygon group per (rank, color); groups are numbered in drawing order
+    group_keys, face_group = np.unique(rank.astype(np.int64) << 16 | colors, return_inverse=True)
+    face_group = face_group.reshape(-1)
+    first_face = np.unique(face_group, return_index=True)[1]
+    group_rank = rank[first_face]
+    group_direction = directions[first_face]
+    group_cell = cells[first_face]
+    uv_axes = _FACE_PLANE_AXES[axis]
+    u = cells[np.arange(len(cells)), uv_axes[:, 0]]
+    v = cells[np.arange(len(cells)), uv_axes[:, 1]]
+    loop_group, loop_start, corner_u, corner_v = _trace_polygons(face_group, u, v)
+
+    # Loop corners back to world space: cell corners are at -0.5, bricks lifted by 0.5
+    vertex_group = np.repeat(loop_group, np.diff(np.r_[loop_start, len(corner_u)]))
+    normal = FACE_DIRECTIONS[group_direction[vertex_group]]
+    normal_axis = np.abs(normal).argmax(axis=1)
+    corners = np.empty((len(vertex_group), 3), dtype=np.float64)
+    rows = np.arange(len(vertex_group))
+    corners[rows, normal_axis] = group_cell[vertex_group, normal_axis] + 0.5 * normal[rows, normal_axis]
+    vertex_axes = _FACE_PLANE_AXES[normal_axis]
+    corners[rows, vertex_axes[:, 0]] = corner_u - 0.5
+    corners[rows, vertex_axes[:, 1]] = corner_v - 0.5
+    corners[:, 2] += 0.5
+    px, py = project(corners)
+    points = [f"{x:.{SVG_DECIMALS}f} {y:.{SVG_DECIMALS}f}" for x, y in zip(px.tolist(), py.tolist())]
+
+    shade = AMBIENT + FACE_DIRECTIONS[group_direction] @ eye
+    fills = _hex_colors(model.palette.colors[colors[first_face]] * shade[:, None])
+    bounds = np.r_[loop_start, len(points)].tolist()
+    paths = {}
+    for i, group in enumerate(loop_group.tolist()):
+        paths.setdefault(group, []).append("M" + " ".join(points[bounds[i]:bounds[i + 1]]) + "Z")
+    elements = [(2 * int(group_rank[group]), f'<path fill="{fills[group]}" stroke="{fills[group]}" d="{"".join(loops)}"/>')
+                for group, loops in paths.items()]
+
+    if outlines and len(cells):
+        elements += _outline_elements(positions, color_ids, lookup, cells, directions, rank, project)
+    elements.sort(key=lambda element: element[0])
+
+    background_hex = _hex_colors(np.array([background[:3]]))[0]
+    total = len(elements)
+    with replacing_file(filename) as temp, open(temp, "wb") as f:
+        f.write((f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+                 f'viewBox="0 0 {width} {height}">\n'
+                 f'<style>.e{{fill:none;stroke:#000;stroke-width:{LINE_WIDTH};stroke-linecap:round}}</style>\n'
+                 f'<rect width="{width}" height="{height}" fill="{background_hex}" fill-opacity="{background[3]:g}"/>\n'
+                 f'<g stroke-width="{SVG_SEAM_WIDTH}" stroke-linejoin="round">\n').encode())
+        for done in range(0, total, 1024):
+            f.write("".join(text + "\n" for _, text in elements[done:done + 1024]).encode())
+            if progress:
+                progress(min(done + 1024, total), total)
+        f.write(b"</g>\n</svg>\n")
+
+
+def _outline_elements(positions, color_ids, lookup, cells, directions, rank, project) -> List[Tuple[int, str]]:
+    # Feature edges split into unit segments, each given the rank of the last visible
+    # face it borders (segments bordering none are hidden), then re-joined into runs
+    # per rank and written as one path per rank, sorting right after that rank's faces
+    edges = build_feature_edges(positions, color_ids, lookup)
+    if not len(edges):
+        return []
+    run = np.repeat(np.arange(len(edges)), edges.length)
+    step = np.arange(len(run)) - np.repeat(np.cumsum(edges.length) - edges.length, edges.length)
+    edge_axis = edges.axis[run].astype(np.int64)
+    start = edges.start[run].astype(np.int64)
+    start[np.arange(len(run)), edge_axis] += step
+
+    # Visible faces by direction, as sorted packed cells with their ranks
+    tables = []
+    for d in range(6):
+        mine = directions == d
+        keys = pack_positions(cells[mine])
+        order = np.argsort(keys)
+        tables.append((keys[order], rank[mine][order]))
+    # The 4 cells around a segment at corner q: q minus 0 or 1 on both other axes.
+    # Each has one face on each of those axes containing the segment.
+    edge_rank = np.full(len(run), -1, dtype=np.int64)
+    others = _FACE_PLANE_AXES[edge_axis]
+    rows = np.arange(len(run))
+    for db in (1, 0):
+        for dc in (1, 0):
+            cell = start.copy()
+            cell[rows, others[:, 0]] -= db
+            cell[rows, others[:, 1]] -= dc
+            for other, delta in ((others[:, 0], db), (others[:, 1], dc)):
+                # The cell below the corner (delta 1) borders it with its + face
+                direction = _DIRECTION_INDEX[other, delta]
+                for d in range(6):
+                    keys, ranks = tables[d]
+                    mine = np.flatnonzero(direction == d)
+                    if not len(keys) or not len(mine):
+                        continue
+                    packed = pack_positions(cell[mine])
+                    index = np.minimum(np.searchsorted(keys, packed), len(keys) - 1)
+                    found = keys[index] == packed
+                    edge_rank[mine[found]] = np.maximum(edge_rank[mine[found]], ranks[index[found]])
+    visible = edge_rank >= 0
+    edge_rank, edge_axis, start = edge_rank[visible], edge_axis[visible], start[visible]
+    if not len(edge_rank):
+        return []
+
+    # Re-join consecutive unit segments of the same rank into runs
+    order = np.lexsort((start[:, 2], start[:, 1], start[:, 0], edge_axis, edge_rank))
+    edge_rank, edge_axis, start = edge_rank[order], edge_axis[order], start[order]
+    rows = np.arange(len(start))
+    along = start[rows, edge_axis]
+    fixed = start.copy()
+    fixed[rows, edge_axis] = 0
+    brk = np.r_[True, (edge_rank[1:] != edge_rank[:-1]) | (edge_axis[1:] != edge_axis[:-1])
+                | (fixed[1:] != fixed[:-1]).any(axis=1) | (along[1:] != along[:-1] + 1)]
+    first = np.flatnonzero(brk)
+    last = np.r_[first[1:], len(start)] - 1
+    a = start[first].astype(np.float64)
+    b = a.copy()
+    b[np.arange(len(first)), edge_axis[first]] += along[last] - along[first] + 1
+    ax, ay = project(a - 0.5 + (0.0, 0.0, 0.5))
+    bx, by = project(b - 0.5 + (0.0, 0.0, 0.5))
+    segments = [f"M{x0:.{SVG_DECIMALS}f} {y0:.{SVG_DECIMALS}f}L{x1:.{SVG_DECIMALS}f} {y1:.{SVG_DECIMALS}f}"
+                for x0, y0, x1, y1 in zip(ax.tolist(), ay.tolist(), bx.tolist(), by.tolist())]
+    run_rank = edge_rank[first]
+    bounds = np.flatnonzero(np.r_[True, run_rank[1:] != run_rank[:-1]]).tolist() + [len(first)]
+    return [(2 * int(run_rank[s]) + 1, f'<path class="e" d="{"".join(segments[s:e])}"/>')
+            for s, e in zip(bounds[:-1], bounds[1:])]
@@ -0,0 +1,181 @@
+import multiprocessing
+import os
+import numpy as np
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, Dict, List, Optional, Tuple
+import glm
+from brickbuilder.core.camera import Camera
+from brickbuilder.core.model import Model
+from brickbuilder.core.palette import Palette
+from brickbuilder.core.png import write_png
+from brickbuilder.core.software_renderer import render_model
+
+# Build instructions: one page per Z layer, that layer in full color, the layers
+# below dimmed and everything above cut away, all from one fixed camera framing
+# the whole model. Pages are rendered by the software renderer, so this runs in
+# worker processes without a display.
+
+PAGE_WIDTH = 1024
+PAGE_HEIGHT = 768
+# Free space around the model, as a fraction of the page
+FIT_MARGIN = 0.05
+# Pages in flight per worker; keeps the queue short so cancelling is quick
+TASKS_PER_WORKER = 2
+
+CameraState = Tuple[Tuple[float, float, float], float, float, float, float, float, float]
+
+
+def fit_camera(model: Model, width: int, height: int, camera: Optional[Camera] = None) -> Camera:
+    # Camera with the orientation of `camera` (or the default view) that frames the
+    # whole model on a width x height page
+    fitted = Camera()
+    if camera is not None:
+        fitted.yaw, fitted.pitch = camera.yaw, camera.pitch
+    fitted.aspect_ratio = width / height
+    bounds = model.bounds()
+    if bounds is not None:
+        # Bricks span x/y +-0.5 around their cell and z .. z + 1
+        lo = bounds[0].astype(np.float64) - (0.5, 0.5, 0.0)
+        hi = bounds[1].astype(np.float64) + (0.5, 0.5, 1.0)
+        center = (lo + hi) / 2
+        corners = np.array([[x, y, z] for x in (lo[0], hi[0]) for y in (lo[1], hi[1]) for z in (lo[2], hi[2])]) - center
+        right = np.array(fitted.right, dtype=np.float64)
+        up = np.array(fitted.up, dtype=np.float64)
+        extent_x = 2 * np.abs(corners @ right).max()
+        extent_y = 2 * np.abs(corners @ up).max()
+        fitted.scale = max(extent_y, extent_x / fitted.aspect_ratio, 1.0) * (1 + 2 * FIT_MARGIN)
+        fitted.target = glm.vec3(*center)
+        # Keep the whole model between the near and far planes
+        radius = float(np.linalg.norm(hi - lo)) / 2
+        fitted.distance = radius + 1.0
+        fitted.far_plane = max(fitted.far_plane, 2 * radius + 2.0)
+    fitted.mark_changed()
+    return fitted
+
+
+def _camera_state(camera: Camera) -> CameraState:
+    return (tuple(camera.target), camera.distance, camera.yaw, camera.pitch, camera.scale,
+            camera.aspect_ratio, camera.far_plane)
+
+
+def _camera_from_state(state: CameraState) -> Camera:
+    camera = Camera()
+    target, camera.distance, camera.yaw, camera.pitch, camera.scale, camera.aspect_ratio, camera.far_plane = state
+    camera.target = glm.vec3(*target)
+    camera.mark_changed()
+    return camera
+
+
+def page_layers(model: Model) -> List[int]:
+    # Z layers that get a page, bottom first
+    return sorted(z for z, count in model.layer_counts.items() if count > 0)
+
+
+def page_filename(directory: str, step: int) -> str:
+    return os.path.join(directory, f"layer_{step:03d}.png")
+
+
+def render_page(model: Model, camera: Camera, layer: int, width: int, height: int,
+                meshes: Optional[Dict] = None) -> np.ndarray:
+    # (height, width, 4) RGBA page for one layer
+    image, _ = render_model(model, camera, width, height, section_z=layer + 1, highlight_layer=layer, meshes=meshes)
+    return image
+
+
+# Per-process state of export workers, set up once by _init_worker
+_worker = {}
+
+
+def _init_worker(names: Tuple[str, str], count: int, palette: list, camera: CameraState,
+                 width: int, height: int) -> None:
+    # Rebuild the model from the shared brick arrays. The arrays are copied into the
+    # worker's chunks once; tasks then only carry a layer number.
+    blocks = [SharedMemory(name=name, track=False) for name in names]
+    try:
+        positions = np.ndarray((count, 3), dtype=np.int32, buffer=blocks[0].buf)
+        color_index = np.ndarray(count, dtype=np.uint16, buffer=blocks[1].buf)
+        model = Model()
+        model.palette = Palette.from_list(palette)
+        model._insert_arrays(positions, color_index)
+        model._finish_load()
+        del positions, color_index
+    finally:
+        for block in blocks:
+            block.close()
+    _worker.update(model=model, camera=_camera_from_state(camera), width=width, height=height, meshes={})
+
+
+def _export_page(layer: int, filename: str) -> str:
+    # Meshes do not depend on the layer, so each worker builds every chunk's once
+    image = render_page(_worker["model"], _worker["camera"], layer, _worker["width"], _worker["height"], _worker["meshes"])
+    write_png(filename, image)
+    return filename
+
+
+def _share(array: np.ndarray) -> SharedMemory:
+    block = SharedMemory(create=True, size=max(array.nbytes, 1), track=False)
+    np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+    return block
+
+
+def export_layers(model: Model, directory: str, camera: Optional[Camera] = None,
+                  width: int = PAGE_WIDTH, height: int = PAGE_HEIGHT, workers: Optional[int] = None,
+                  progress: Optional[Callable[[int, int], None]] = None) -> List[str]:
+    # Write one PNG per layer into `directory` and return the filenames, bottom layer
+    # first. Pages are spread over `workers` processes (default: one per CPU); the
+    # bricks are handed over once through shared memory instead of being pickled per
+    # page. Each page is written by the worker that rendered it. progress(done, total)
+    # is called as pages finish and may raise to cancel.
+    os.makedirs(directory, exist_ok=True)
+    camera = fit_camera(model, width, height, camera)
+    layers = page_layers(model)
+    filenames = [page_filename(directory, step) for step in range(1, len(layers) + 1)]
+    total = len(layers)
+    if progress:
+        progress(0, total)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, total))
+
+    if workers == 1:
+        meshes = {}
+        for done, (layer, filename) in enumerate(zip(layers, filenames), 1):
+            write_png(filename, render_page(model, camera, layer, width, height, meshes))
+            if progress:
+                progress(done, total)
+        return filenames
+
+    positions, color_index = model.get_arrays()
+    blocks = [_share(positions), _share(color_index)]
+    try:
+        # Spawned, not forked: the GUI process has Qt and GL threads running
+        context = multiprocessing.get_context("spawn")
+        initargs = (tuple(b.name for b in blocks), len(positions), model.palette.to_list(),
+                    _camera_state(camera), width, height)
+        with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker, initargs=initargs) as pool:
+            try:
+                pages = iter(zip(layers, filenames))
+                running = set()
+                done = 0
+                while True:
+                    for page in pages:
+                        running.add(pool.submit(_export_page, *page))
+                        if len(running) >= workers * TASKS_PER_WORKER:
+                            break
+                    if not running:
+                        break
+                    finished, running = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        future.result()
+                    done += len(finished)
+                    if progress:
+                        progress(done, total)
+            except BaseException:
+                pool.shutdown(wait=True, cancel_futures=True)
+                raise
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+    return filenames
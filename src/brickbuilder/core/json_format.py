@@ -0,0 +1,210 @@
+import codecs
+import json
+import os
+import numpy as np
+from operator import itemgetter
+from typing import Any, Callable, List, Optional
+from brickbuilder.core.palette import Palette
+
+# progress(done, total); may raise to abort the operation
+ProgressCallback = Callable[[int, int], None]
+
+# Bricks written/parsed per batch; bounds the extra memory a save or load needs
+BATCH_SIZE = 16384
+_READ_SIZE = 1 << 20
+
+_BRICK_LINE = '\n        {"x": %d, "y": %d, "z": %d, "c": %d}'
+_get_position = itemgetter("x", "y", "z")
+_get_rgb = itemgetter("r", "g", "b")
+_get_index = itemgetter("c")
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+
+
+def save_json(model, filename: str, progress: Optional[ProgressCallback] = None,
+              batch_size: int = BATCH_SIZE) -> None:
+    # Same document as json.dump(model.to_dict()), but bricks are formatted straight
+    # from the chunk arrays a batch at a time instead of through a list of dicts
+    total = model.brick_count
+    done = 0
+    with open(filename, "w", encoding="utf-8") as f:
+        f.write('{\n    "version": 2,\n    "palette": ')
+        f.write(json.dumps(model.palette.to_list()))
+        f.write(',\n    "bricks": [')
+        separator = ""
+        for key in sorted(model.chunks):
+            positions, color_index = model.chunks[key].arrays()
+            for start in range(0, len(positions), batch_size):
+                rows = np.column_stack((positions[start:start + batch_size],
+                                        color_index[start:start + batch_size])).tolist()
+                f.write(separator)
+                f.write(",".join([_BRICK_LINE % tuple(row) for row in rows]))
+                separator = ","
+                done += len(rows)
+                if progress:
+                    progress(done, total)
+        f.write("\n    ]\n}\n")
+    if progress:
+        progress(total, total)
+
+
+class _Reader:
+    # Incremental view over a UTF-8 file: a text buffer that is refilled on demand
+    def __init__(self, f, progress: Optional[ProgressCallback]) -> None:
+        self.f = f
+        self.size = os.fstat(f.fileno()).st_size
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.progress = progress
+        self.consumed = 0
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        # Drops the consumed prefix and appends more text; False at end of file
+        if self.eof:
+            return False
+        data = self.f.read(_READ_SIZE)
+        self.consumed += len(data)
+        self.eof = not data
+        self.buf = self.buf[self.pos:] + self.decoder.decode(data, final=self.eof)
+        self.pos = 0
+        if self.progress:
+            self.progress(self.consumed, self.size)
+        return True
+
+    def peek(self) -> str:
+        # Next non-whitespace character, '' at end of file
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, char: str) -> None:
+        if self.peek() != char:
+            raise ValueError(f"Malformed model file: expected '{char}'")
+        self.pos += 1
+
+    def value(self) -> Any:
+        # Decodes one complete JSON value, reading more until it fits
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            # A number at the very end of the buffer may continue in the next read
+            if end == len(self.buf) and not self.eof and self.fill():
+                continue
+            self.pos = end
+            return value
+
+    def items(self) -> List[Any]:
+        # Next batch of array elements (after the opening '['); [] once ']' is consumed.
+        # Bricks are flat objects, so everything up to the last '}' in the buffer is
+        # normally a run of whole elements and can be parsed in one C-level call.
+        while True:
+            char = self.peek()
+            if char == ",":
+                self.pos += 1
+                char = self.peek()
+            if char == "]":
+                self.pos += 1
+                return []
+            if char == "":
+                raise ValueError("Malformed model file: unterminated brick list")
+            close = self.buf.find("]", self.pos)
+            end = self.buf.rfind("}", self.pos, close if close >= 0 else len(self.buf))
+            if end >= 0:
+                try:
+                    batch = json.loads("[" + self.buf[self.pos:end + 1] + "]")
+                    self.pos = end + 1
+                    return batch
+                except json.JSONDecodeError:
+                    pass
+                # Irregular content; fall back to one element at a time
+                batch = []
+                while self.peek() not in ("]", ""):
+                    try:
+                        element, stop = _decoder.raw_decode(self.buf, self.pos)
+                    except json.JSONDecodeError:
+                        break
+                    if stop == len(self.buf) and not self.eof:
+                        break
+                    batch.append(element)
+                    self.pos = stop
+                    if self.peek() == ",":
+                        self.pos += 1
+                if batch:
+                    return batch
+            if not self.fill():
+                raise ValueError("Malformed model file: unterminated brick list")
+
+
+def load_json(model, filename: str, progress: Optional[ProgressCallback] = None) -> None:
+    # Streams a version 1 or 2 document into an empty model. The palette and other
+    # small values are decoded whole; the bricks array is parsed in batches and each
+    # batch goes straight into the chunk store.
+    pending: List = []   # index batches seen before the palette (unusual key order)
+    has_palette = False
+    rgb_seen = False
+
+    def insert(batch: List[dict]) -> None:
+        nonlocal rgb_seen
+        positions = np.array([_get_position(b) for b in batch], dtype=np.int32).reshape(-1, 3)
+        if "c" in batch[0]:
+            color_index = np.array([_get_index(b) for b in batch], dtype=np.int64)
+            if not has_palette:
+                pending.append((positions, color_index))
+                return
+            _insert_indexed(model, positions, color_index)
+        else:
+            # Version 1 bricks store RGB; intern them into the palette
+            rgb_seen = True
+            colors = np.array([_get_rgb(b) for b in batch], dtype=np.float32).reshape(-1, 3)
+            model._insert_arrays(positions, model.palette.intern_array(colors))
+
+    with open(filename, "rb") as f:
+        reader = _Reader(f, progress)
+        reader.expect("{")
+        while True:
+            char = reader.peek()
+            if char == ",":
+                reader.pos += 1
+                char = reader.peek()
+            if char == "}":
+                break
+            key = reader.value()
+            reader.expect(":")
+            if key == "bricks":
+                reader.expect("[")
+                while True:
+                    batch = reader.items()
+                    if not batch:
+                        break
+                    insert(batch)
+            elif key == "palette":
+                if rgb_seen:
+                    raise ValueError("Malformed model file: palette after RGB bricks")
+                model.palette = Palette.from_list(reader.value())
+                has_palette = True
+            else:
+                reader.value()
+
+    if pending:
+        if not has_palette:
+            raise ValueError("Bricks reference palette indices but the file has no palette")
+        for positions, color_index in pending:
+            _insert_indexed(model, positions, color_index)
+
+
+def _insert_indexed(model, positions: np.ndarray, color_index: np.ndarray) -> None:
+    if color_index.min() < 0 or color_index.max() >= len(model.palette):
+        raise ValueError("Brick color index out of palette range")
+    model._insert_arrays(positions, color_index.astype(np.uint16))
@@ -0,0 +1,71 @@
+import math
+import numpy as np
+from brickbuilder.core.chunk import Chunk, CHUNK_SIZE
+from brickbuilder.core.mesh import MeshData, DenseCellLookup, build_cap_edges, build_cap_rects, build_chunk_mesh, build_face_rects, build_feature_edges, build_mesh, empty_mesh
+
+# Level L draws blocks of (2^L)^3 bricks. The finest level whose blocks span at
+# least MIN_BLOCK_PIXELS on screen is used. Outlines are dropped once a block is
+# smaller than OUTLINE_MIN_PIXELS, where they would only paint the surface black.
+MAX_LOD_LEVEL = 2
+MIN_BLOCK_PIXELS = 1.5
+OUTLINE_MIN_PIXELS = 4.0
+
+
+def choose_level(pixels_per_unit: float) -> int:
+    # Finest level whose blocks still cover MIN_BLOCK_PIXELS (ortho: same everywhere)
+    if pixels_per_unit >= MIN_BLOCK_PIXELS:
+        return 0
+    level = math.ceil(math.log2(MIN_BLOCK_PIXELS / pixels_per_unit))
+    return min(level, MAX_LOD_LEVEL)
+
+
+def draws_outlines(pixels_per_unit: float, level: int) -> bool:
+    return pixels_per_unit * (1 << level) >= OUTLINE_MIN_PIXELS
+
+
+def downsample(grid: np.ndarray, factor: int) -> np.ndarray:
+    # Voxel mip step: a block is occupied if any of its cells is, and takes the
+    # majority palette index of its occupied cells (ties go to the lower index)
+    shape = tuple(s // factor for s in grid.shape)
+    blocks = grid.reshape(shape[0], factor, shape[1], factor, shape[2], factor)
+    blocks = blocks.transpose(0, 2, 4, 1, 3, 5).reshape(-1, factor ** 3)
+    out = np.full(len(blocks), -1, dtype=np.int32)
+    block_id, cell = np.nonzero(blocks >= 0)
+    if len(block_id):
+        keys = (block_id.astype(np.int64) << 16) | blocks[block_id, cell]
+        unique, counts = np.unique(keys, return_counts=True)
+        block_of, color_of = unique >> 16, unique & 0xFFFF
+        order = np.lexsort((-counts, block_of))
+        block_of, color_of = block_of[order], color_of[order]
+        first = np.r_[True, block_of[1:] != block_of[:-1]]
+        out[block_of[first]] = color_of[first]
+    return out.reshape(shape)
+
+
+def build_chunk_lod_mesh(model, chunk: Chunk, level: int) -> MeshData:
+    # Same as build_chunk_mesh, but on the chunk downsampled by 2^level. The mesh is
+    # built in block coordinates with a one-block apron, then scaled back so each
+    # block covers its bricks exactly.
+    if level == 0 or chunk.count == 0:
+        return build_chunk_mesh(model, chunk)
+    factor = 1 << level
+    size = CHUNK_SIZE // factor
+    region = model.read_region(chunk.origin - factor, (CHUNK_SIZE + 2 * factor,) * 3)
+    coarse = downsample(region, factor)
+    block_origin = chunk.origin // factor - 1
+
+    inner = coarse[1:size + 1, 1:size + 1, 1:size + 1]
+    local = np.argwhere(inner >= 0)
+    if len(local) == 0:
+        return empty_mesh()
+    positions = (local + block_origin + 1).astype(np.int32)
+    color_ids = inner[local[:, 0], local[:, 1], local[:, 2]]
+    lookup = DenseCellLookup(coarse, block_origin)
+    rects = build_face_rects(positions, color_ids, lookup.lookup)
+    edges = build_feature_edges(positions, color_ids, lookup.lookup, layer_scale=factor)
+    caps = build_cap_rects(positions, color_ids, lookup.lookup)
+    cap_edges = build_cap_edges(positions, color_ids, lookup.lookup, layer_scale=factor)
+    mesh = build_mesh(rects, edges, model.palette.colors, caps, layer_scale=factor, cap_edges=cap_edges)
+    # Block b spans bricks b*f .. b*f+f-1, i.e. [b*f - 0.5, b*f + f - 0.5] brick-centred
+    mesh.vertices = mesh.vertices * factor + (factor - 1) / 2.0
+    return mesh
@@ -0,0 +1,401 @@
+import numpy as np
+from typing import Callable, List, Tuple
+from brickbuilder.core.chunk import Chunk, CHUNK_SIZE, pack_positions, unpack_positions
+
+# Face directions in the same order as Renderer.draw_cube:
+# Top, Bottom, Front, Back, Left, Right
+FACE_DIRECTIONS = np.array([
+    (0, 0, 1),
+    (0, 0, -1),
+    (0, -1, 0),
+    (0, 1, 0),
+    (-1, 0, 0),
+    (1, 0, 0),
+], dtype=np.int32)
+
+# (normal axis, u axis, v axis) for each face direction.
+# Side faces use Z as their v axis so horizontal runs are merged first.
+FACE_AXES: List[Tuple[int, int, int]] = [
+    (2, 0, 1), (2, 0, 1),
+    (1, 0, 2), (1, 0, 2),
+    (0, 1, 2), (0, 1, 2),
+]
+
+# A lookup takes (N, 3) cell positions and returns a color id per cell, -1 for empty cells
+CellLookup = Callable[[np.ndarray], np.ndarray]
+
+
+class SortedCellIndex:
+    # Vectorized occupancy/color lookup over a fixed set of cells (binary search on packed keys)
+    def __init__(self, positions: np.ndarray, color_ids: np.ndarray) -> None:
+        keys = pack_positions(positions)
+        order = np.argsort(keys)
+        self.keys = keys[order]
+        self.color_ids = color_ids[order].astype(np.int32)
+
+    def lookup(self, positions: np.ndarray) -> np.ndarray:
+        result = np.full(len(positions), -1, dtype=np.int32)
+        if len(self.keys) == 0 or len(positions) == 0:
+            return result
+        keys = pack_positions(positions)
+        idx = np.searchsorted(self.keys, keys)
+        idx_clipped = np.minimum(idx, len(self.keys) - 1)
+        found = self.keys[idx_clipped] == keys
+        result[found] = self.color_ids[idx_clipped[found]]
+        return result
+
+
+class DenseCellLookup:
+    # Lookup into a dense block of color ids (-1 = empty) whose first cell is at `origin`.
+    # Cells outside the block count as empty.
+    def __init__(self, color_ids: np.ndarray, origin: np.ndarray) -> None:
+        self.color_ids = color_ids
+        self.origin = np.asarray(origin, dtype=np.int32)
+
+    def lookup(self, positions: np.ndarray) -> np.ndarray:
+        rel = positions - self.origin
+        inside = np.all((rel >= 0) & (rel < np.array(self.color_ids.shape)), axis=1)
+        result = np.full(len(positions), -1, dtype=np.int32)
+        r = rel[inside]
+        result[inside] = self.color_ids[r[:, 0], r[:, 1], r[:, 2]]
+        return result
+
+
+class FaceRects:
+    # Axis-aligned face rectangles in cell coordinates.
+    # A rect covers cells u0..u1, v0..v1 (inclusive) of the layer `plane` along the normal axis.
+    def __init__(self, direction: np.ndarray, plane: np.ndarray, u0: np.ndarray, u1: np.ndarray,
+                 v0: np.ndarray, v1: np.ndarray, color: np.ndarray) -> None:
+        self.direction = direction
+        self.plane = plane
+        self.u0 = u0
+        self.u1 = u1
+        self.v0 = v0
+        self.v1 = v1
+        self.color = color
+
+    def __len__(self) -> int:
+        return len(self.direction)
+
+    def take(self, index: np.ndarray) -> "FaceRects":
+        return FaceRects(self.direction[index], self.plane[index], self.u0[index], self.u1[index],
+                         self.v0[index], self.v1[index], self.color[index])
+
+    @property
+    def cell_count(self) -> int:
+        return int(((self.u1 - self.u0 + 1) * (self.v1 - self.v0 + 1)).sum())
+
+
+class EdgeSegments:
+    # Outline segments on the cell-corner lattice: corner index k is at coordinate k - 0.5.
+    # Each segment starts at `start` and runs `length` units along `axis`. `layer` is the
+    # lowest brick layer of the bricks that draw it (see build_feature_edges).
+    def __init__(self, axis: np.ndarray, start: np.ndarray, length: np.ndarray, layer: np.ndarray) -> None:
+        self.axis = axis
+        self.start = start
+        self.length = length
+        self.layer = layer
+
+    def __len__(self) -> int:
+        return len(self.axis)
+
+    def take(self, index: np.ndarray) -> "EdgeSegments":
+        return EdgeSegments(self.axis[index], self.start[index], self.length[index], self.layer[index])
+
+
+class MeshData:
+    # Flat arrays ready for upload into vertex/index buffers.
+    # Quads (two triangles each) and line segments are sorted by layer: the lowest
+    # brick layer (cell z) they belong to. Drawing everything up to a section cut is
+    # then a prefix of the index buffers. Cap quads (tops hidden by the brick above,
+    # shown only when that brick is cut away) follow the face quads in `triangles`, and
+    # cap lines (their outline) follow the outline segments in `lines`.
+    def __init__(self, vertices: np.ndarray, normals: np.ndarray, colors: np.ndarray,
+                 triangles: np.ndarray, lines: np.ndarray, face_layers: np.ndarray = None,
+                 line_layers: np.ndarray = None, cap_layers: np.ndarray = None,
+                 cap_line_layers: np.ndarray = None) -> None:
+        self.vertices = vertices    # (N, 3) float32
+        self.normals = normals      # (N, 3) float32
+        self.colors = colors        # (N, 3) float32
+        self.triangles = triangles  # (T * 3,) uint32
+        self.lines = lines          # (L * 2,) uint32
+        no_layers = np.zeros(0, np.int32)
+        self.face_layers = face_layers if face_layers is not None else no_layers  # (quads,) ascending
+        self.line_layers = line_layers if line_layers is not None else no_layers  # (L,) ascending
+        self.cap_layers = cap_layers if cap_layers is not None else no_layers     # (caps,) ascending
+        self.cap_line_layers = cap_line_layers if cap_line_layers is not None else no_layers  # ascending
+
+    @property
+    def vertex_count(self) -> int:
+        return len(self.vertices)
+
+    def interleaved(self) -> np.ndarray:
+        # position, normal, color -> 9 floats per vertex
+        return np.ascontiguousarray(np.hstack([self.vertices, self.normals, self.colors]), dtype=np.float32)
+
+
+def empty_mesh() -> MeshData:
+    return MeshData(
+        np.zeros((0, 3), np.float32), np.zeros((0, 3), np.float32), np.zeros((0, 3), np.float32),
+        np.zeros(0, np.uint32), np.zeros(0, np.uint32))
+
+
+def exposed_faces(positions: np.ndarray, lookup: CellLookup) -> List[np.ndarray]:
+    # One boolean mask per face direction: True where the neighbouring cell is empty
+    return [lookup(positions + d) < 0 for d in FACE_DIRECTIONS]
+
+
+def _merge_runs(plane, color, u, v):
+    # Merge consecutive cells along u into runs, then stack identical runs along v.
+    n = len(plane)
+    if n == 0:
+        return plane, u, u, v, v, color
+
+    order = np.lexsort((u, v, color, plane))
+    plane, color, u, v = plane[order], color[order], u[order], v[order]
+    brk = np.ones(n, dtype=bool)
+    brk[1:] = (plane[1:] != plane[:-1]) | (color[1:] != color[:-1]) | (v[1:] != v[:-1]) | (u[1:] != u[:-1] + 1)
+    starts = np.flatnonzero(brk)
+    ends = np.append(starts[1:], n) - 1
+    plane, color, v, u0, u1 = plane[starts], color[starts], v[starts], u[starts], u[ends]
+
+    n = len(plane)
+    order = np.lexsort((v, u1, u0, color, plane))
+    plane, color, v, u0, u1 = plane[order], color[order], v[order], u0[order], u1[order]
+    brk = np.ones(n, dtype=bool)
+    brk[1:] = ((plane[1:] != plane[:-1]) | (color[1:] != color[:-1]) | (u0[1:] != u0[:-1])
+               | (u1[1:] != u1[:-1]) | (v[1:] != v[:-1] + 1))
+    starts = np.flatnonzero(brk)
+    ends = np.append(starts[1:], n) - 1
+    return plane[starts], u0[starts], u1[starts], v[starts], v[ends], color[starts]
+
+
+def build_face_rects(positions: np.ndarray, color_ids: np.ndarray, lookup: CellLookup,
+                     merge: bool = True) -> FaceRects:
+    # Drop faces shared by two occupied cells, then merge coplanar same-color faces into rectangles.
+    masks = exposed_faces(positions, lookup)
+    parts = []
+    for d, mask in enumerate(masks):
+        a, u, v = FACE_AXES[d]
+        cells = positions[mask]
+        colors = color_ids[mask]
+        if merge:
+            plane, u0, u1, v0, v1, color = _merge_runs(cells[:, a], colors, cells[:, u], cells[:, v])
+        else:
+            plane, u0, u1, v0, v1, color = cells[:, a], cells[:, u], cells[:, u], cells[:, v], cells[:, v], colors
+        parts.append((np.full(len(plane), d, dtype=np.int8), plane, u0, u1, v0, v1, color))
+
+    return FaceRects(*(np.concatenate([p[i] for p in parts]) for i in range(7)))
+
+
+def build_cap_rects(positions: np.ndarray, color_ids: np.ndarray, lookup: CellLookup,
+                    merge: bool = True) -> FaceRects:
+    # Top faces covered by the brick above. They are never visible normally, but close
+    # the cut surface when a section view removes the layers above.
+    hidden = lookup(positions + FACE_DIRECTIONS[0]) >= 0
+    cells = positions[hidden]
+    colors = color_ids[hidden]
+    a, u, v = FACE_AXES[0]
+    if merge:
+        plane, u0, u1, v0, v1, color = _merge_runs(cells[:, a], colors, cells[:, u], cells[:, v])
+    else:
+        plane, u0, u1, v0, v1, color = cells[:, a], cells[:, u], cells[:, u], cells[:, v], cells[:, v], colors
+    return FaceRects(np.zeros(len(plane), dtype=np.int8), plane, u0, u1, v0, v1, color)
+
+
+def rect_layers(rects: FaceRects, scale: int = 1) -> np.ndarray:
+    # Lowest brick layer each rect belongs to. Cells may be blocks of `scale` bricks
+    # (LOD meshes); a block's top face only belongs to the block's highest layer.
+    layers = np.where(rects.direction >= 2, rects.v0, rects.plane).astype(np.int32) * scale
+    layers[rects.direction == 0] += scale - 1
+    return layers
+
+
+def build_feature_edges(positions: np.ndarray, color_ids: np.ndarray, lookup: CellLookup,
+                        layer_scale: int = 1) -> EdgeSegments:
+    # Outline only where the surface actually breaks: silhouettes, creases and color boundaries.
+    # Edges between coplanar faces of the same color are skipped, which keeps the outline
+    # clean once faces are merged.
+    # Each unit segment belongs to the lowest layer of the bricks drawing it, so a section
+    # cut never shows outlines that only bricks above it produce (e.g. the bottom edges of
+    # an overhang). Edges along the top of a cell also depend on the cell above, so they
+    # belong to the next layer; at a cut, build_cap_edges supplies them instead.
+    # Cells may be blocks of `layer_scale` bricks (LOD meshes).
+    masks = exposed_faces(positions, lookup)
+    per_axis: List[List[np.ndarray]] = [[], [], []]
+    per_axis_layers: List[List[np.ndarray]] = [[], [], []]
+
+    for d, mask in enumerate(masks):
+        if not mask.any():
+            continue
+        a, u, v = FACE_AXES[d]
+        n = FACE_DIRECTIONS[d]
+        cells = positions[mask]
+        colors = color_ids[mask]
+        plane_corner = cells[:, a] + (1 if n[a] > 0 else 0)
+
+        for t_axis, e_axis in ((u, v), (v, u)):
+            for t_sign in (1, -1):
+                t = np.zeros(3, dtype=np.int32)
+                t[t_axis] = t_sign
+                crease = lookup(cells + t + n) >= 0
+                side = lookup(cells + t)
+                draw = crease | (side != colors)
+                if not draw.any():
+                    continue
+                corner = cells[draw].copy()
+                corner[:, a] = plane_corner[draw]
+                corner[:, t_axis] += 1 if t_sign > 0 else 0
+                per_axis[e_axis].append(pack_positions(corner))
+                z = cells[draw, 2]
+                if e_axis != 2:
+                    z = np.maximum(z, corner[:, 2])
+                per_axis_layers[e_axis].append((z * layer_scale).astype(np.int32))
+
+    return _join_edges(per_axis, per_axis_layers)
+
+
+def build_cap_edges(positions: np.ndarray, color_ids: np.ndarray, lookup: CellLookup,
+                    layer_scale: int = 1) -> EdgeSegments:
+    # Outline of each layer's top as seen when everything above is cut away: the rim of
+    # every top face wherever the neighbour in the same layer is empty or another color.
+    # Like cap rects these are only drawn for the layer a section cut lies on.
+    per_axis: List[List[np.ndarray]] = [[], [], []]
+    per_axis_layers: List[List[np.ndarray]] = [[], [], []]
+    for t_axis, e_axis in ((0, 1), (1, 0)):
+        for t_sign in (1, -1):
+            t = np.zeros(3, dtype=np.int32)
+            t[t_axis] = t_sign
+            draw = lookup(positions + t) != color_ids
+            if not draw.any():
+                continue
+            corner = positions[draw].copy()
+            corner[:, 2] += 1
+            corner[:, t_axis] += 1 if t_sign > 0 else 0
+            per_axis[e_axis].append(pack_positions(corner))
+            per_axis_layers[e_axis].append((positions[draw, 2] * layer_scale + layer_scale - 1).astype(np.int32))
+    return _join_edges(per_axis, per_axis_layers)
+
+
+def _join_edges(per_axis: List[List[np.ndarray]], per_axis_layers: List[List[np.ndarray]]) -> EdgeSegments:
+    # Deduplicate packed unit segments per axis and join them into runs
+    axes, starts, lengths, layers = [], [], [], []
+    for e in range(3):
+        if not per_axis[e]:
+            continue
+        # Duplicates come from every face drawing the segment; keep the lowest layer
+        keys, inverse = np.unique(np.concatenate(per_axis[e]), return_inverse=True)
+        layer = np.full(len(keys), np.iinfo(np.int32).max, dtype=np.int32)
+        np.minimum.at(layer, inverse.reshape(-1), np.concatenate(per_axis_layers[e]))
+        corners = unpack_positions(keys)
+        o1, o2 = [i for i in range(3) if i != e]
+        order = np.lexsort((corners[:, e], corners[:, o2], corners[:, o1]))
+        corners, layer = corners[order], layer[order]
+        brk = np.ones(len(corners), dtype=bool)
+        brk[1:] = ((corners[1:, o1] != corners[:-1, o1]) | (corners[1:, o2] != corners[:-1, o2])
+                   | (corners[1:, e] != corners[:-1, e] + 1))
+        if e != 2:
+            # Vertical runs climb one layer per unit and the section clip cuts them;
+            # horizontal runs are split where the layer changes
+            brk[1:] |= layer[1:] != layer[:-1]
+        first = np.flatnonzero(brk)
+        last = np.append(first[1:], len(corners)) - 1
+        starts.append(corners[first])
+        lengths.append(corners[last, e] - corners[first, e] + 1)
+        axes.append(np.full(len(first), e, dtype=np.int8))
+        layers.append(layer[first])
+
+    if not axes:
+        return EdgeSegments(np.zeros(0, np.int8), np.zeros((0, 3), np.int32), np.zeros(0, np.int32), np.zeros(0, np.int32))
+    return EdgeSegments(np.concatenate(axes), np.concatenate(starts), np.concatenate(lengths), np.concatenate(layers))
+
+
+def rect_corners(rects: FaceRects) -> np.ndarray:
+    # (N, 4, 3) float32 quad corners in brick-centred coordinates, counter-clockwise seen from outside
+    n = len(rects)
+    corners = np.zeros((n, 4, 3), dtype=np.float32)
+    for d in range(6):
+        sel = rects.direction == d
+        if not sel.any():
+            continue
+        a, u, v = FACE_AXES[d]
+        sign = FACE_DIRECTIONS[d][a]
+        lo_u = rects.u0[sel] - 0.5
+        hi_u = rects.u1[sel] + 0.5
+        lo_v = rects.v0[sel] - 0.5
+        hi_v = rects.v1[sel] + 0.5
+        uv = [(lo_u, lo_v), (hi_u, lo_v), (hi_u, hi_v), (lo_u, hi_v)]
+        # (u x v) points along +a for X and Z faces and along -a for Y faces
+        handedness = sign * (1 if a != 1 else -1)
+        if handedness < 0:
+            uv = uv[::-1]
+        block = np.zeros((int(sel.sum()), 4, 3), dtype=np.float32)
+        block[:, :, a] = (rects.plane[sel] + 0.5 * sign)[:, None]
+        for i, (cu, cv) in enumerate(uv):
+            block[:, i, u] = cu
+            block[:, i, v] = cv
+        corners[sel] = block
+    return corners
+
+
+def build_mesh(rects: FaceRects, edges: EdgeSegments, palette: np.ndarray,
+               caps: FaceRects = None, layer_scale: int = 1, cap_edges: EdgeSegments = None) -> MeshData:
+    face_layers = rect_layers(rects, layer_scale)
+    order = np.argsort(face_layers, kind="stable")
+    rects, face_layers = rects.take(order), face_layers[order]
+    line_layers = edges.layer
+    order = np.argsort(line_layers, kind="stable")
+    edges, line_layers = edges.take(order), line_layers[order]
+    cap_layers = np.zeros(0, np.int32)
+    if caps is not None and len(caps):
+        cap_layers = rect_layers(caps, layer_scale)
+        order = np.argsort(cap_layers, kind="stable")
+        caps, cap_layers = caps.take(order), cap_layers[order]
+        # Drawn as ordinary top faces; their index range follows the faces
+        rects = FaceRects(*(np.concatenate([getattr(rects, f), getattr(caps, f)])
+                            for f in ("direction", "plane", "u0", "u1", "v0", "v1", "color")))
+    cap_line_layers = np.zeros(0, np.int32)
+    if cap_edges is not None and len(cap_edges):
+        order = np.argsort(cap_edges.layer, kind="stable")
+        cap_edges = cap_edges.take(order)
+        cap_line_layers = cap_edges.layer
+        # Likewise their index range follows the outline segments
+        edges = EdgeSegments(*(np.concatenate([getattr(edges, f), getattr(cap_edges, f)])
+                               for f in ("axis", "start", "length", "layer")))
+
+    n = len(rects)
+    quad_vertices = rect_corners(rects).reshape(-1, 3)
+    quad_normals = np.repeat(FACE_DIRECTIONS[rects.direction].astype(np.float32), 4, axis=0)
+    quad_colors = np.repeat(palette[rects.color].astype(np.float32), 4, axis=0) if n else np.zeros((0, 3), np.float32)
+    base = (np.arange(n, dtype=np.uint32) * 4)[:, None]
+    triangles = (base + np.array([0, 1, 2, 0, 2, 3], dtype=np.uint32)[None, :]).reshape(-1)
+
+    # Outline segments get their own vertices at the end of the buffer
+    m = len(edges)
+    line_start = edges.start.astype(np.float32) - 0.5
+    line_end = line_start.copy()
+    line_end[np.arange(m), edges.axis] += edges.length
+    line_vertices = np.stack([line_start, line_end], axis=1).reshape(-1, 3)
+    lines = np.arange(len(quad_vertices), len(quad_vertices) + 2 * m, dtype=np.uint32)
+
+    vertices = np.concatenate([quad_vertices, line_vertices]).astype(np.float32)
+    normals = np.concatenate([quad_normals, np.zeros((2 * m, 3), np.float32)])
+    colors = np.concatenate([quad_colors, np.zeros((2 * m, 3), np.float32)])
+    return MeshData(vertices, normals, colors, triangles, lines, face_layers, line_layers, cap_layers,
+                    cap_line_layers)
+
+
+def build_chunk_mesh(model, chunk: Chunk, merge: bool = True) -> MeshData:
+    # Mesh a single chunk. Neighbouring chunks are read through a one-cell apron so
+    # faces and outlines on the chunk border are culled/classified correctly.
+    positions, color_index = chunk.arrays()
+    if len(positions) == 0:
+        return empty_mesh()
+    origin = chunk.origin - 1
+    lookup = DenseCellLookup(model.read_region(origin, (CHUNK_SIZE + 2,) * 3), origin)
+    color_ids = color_index.astype(np.int32)
+    rects = build_face_rects(positions, color_ids, lookup.lookup, merge=merge)
+    edges = build_feature_edges(positions, color_ids, lookup.lookup)
+    caps = build_cap_rects(positions, color_ids, lookup.lookup, merge=merge)
+    cap_edges = build_cap_edges(positions, color_ids, lookup.lookup)
+    return build_mesh(rects, edges, model.palette.colors, caps, cap_edges=cap_edges)
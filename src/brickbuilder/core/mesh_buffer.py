@@ -0,0 +1,115 @@
+import ctypes
+import OpenGL.GL as gl
+import numpy as np
+from brickbuilder.core.mesh import MeshData
+
+_FLOAT_SIZE = 4
+_STRIDE = 9 * _FLOAT_SIZE  # position(3) + normal(3) + color(3)
+
+
+class MeshBuffer:
+    # Owns one interleaved vertex buffer plus triangle and line index buffers.
+    # Uses only GL 1.5 buffer objects and client-side array state, so it works
+    # under the 2.1 compatibility profile requested in brickbuilder.main.
+    def __init__(self) -> None:
+        self.vbo = 0
+        self.triangle_ibo = 0
+        self.line_ibo = 0
+        self.triangle_count = 0
+        self.line_count = 0
+        # Per-quad / per-segment layers (ascending) for section views; kept on the CPU
+        # and turned into index ranges with a binary search
+        self.face_layers = np.zeros(0, np.int32)
+        self.line_layers = np.zeros(0, np.int32)
+        self.cap_layers = np.zeros(0, np.int32)
+        self.cap_line_layers = np.zeros(0, np.int32)
+
+    def upload(self, mesh: MeshData) -> None:
+        if not self.vbo:
+            self.vbo, self.triangle_ibo, self.line_ibo = gl.glGenBuffers(3)
+
+        data = mesh.interleaved()
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self.vbo)
+        gl.glBufferData(gl.GL_ARRAY_BUFFER, data.nbytes, data if data.size else None, gl.GL_STATIC_DRAW)
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, 0)
+
+        triangles = np.ascontiguousarray(mesh.triangles, dtype=np.uint32)
+        gl.glBindBuffer(gl.GL_ELEMENT_ARRAY_BUFFER, self.triangle_ibo)
+        gl.glBufferData(gl.GL_ELEMENT_ARRAY_BUFFER, triangles.nbytes, triangles if triangles.size else None, gl.GL_STATIC_DRAW)
+
+        lines = np.ascontiguousarray(mesh.lines, dtype=np.uint32)
+        gl.glBindBuffer(gl.GL_ELEMENT_ARRAY_BUFFER, self.line_ibo)
+        gl.glBufferData(gl.GL_ELEMENT_ARRAY_BUFFER, lines.nbytes, lines if lines.size else None, gl.GL_STATIC_DRAW)
+        gl.glBindBuffer(gl.GL_ELEMENT_ARRAY_BUFFER, 0)
+
+        self.triangle_count = len(triangles)
+        self.line_count = len(lines)
+        self.face_layers = mesh.face_layers
+        self.line_layers = mesh.line_layers
+        self.cap_layers = mesh.cap_layers
+        self.cap_line_layers = mesh.cap_line_layers
+
+    def release(self) -> None:
+        if self.vbo:
+            gl.glDeleteBuffers(3, [self.vbo, self.triangle_ibo, self.line_ibo])
+        self.vbo = self.triangle_ibo = self.line_ibo = 0
+        self.triangle_count = self.line_count = 0
+        self.face_layers = self.line_layers = self.cap_layers = self.cap_line_layers = np.zeros(0, np.int32)
+
+    def _bind(self, with_normals: bool, with_colors: bool) -> None:
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self.vbo)
+        gl.glEnableClientState(gl.GL_VERTEX_ARRAY)
+        gl.glVertexPointer(3, gl.GL_FLOAT, _STRIDE, ctypes.c_void_p(0))
+        if with_normals:
+            gl.glEnableClientState(gl.GL_NORMAL_ARRAY)
+            gl.glNormalPointer(gl.GL_FLOAT, _STRIDE, ctypes.c_void_p(3 * _FLOAT_SIZE))
+        if with_colors:
+            gl.glEnableClientState(gl.GL_COLOR_ARRAY)
+            gl.glColorPointer(3, gl.GL_FLOAT, _STRIDE, ctypes.c_void_p(6 * _FLOAT_SIZE))
+
+    def _unbind(self) -> None:
+        gl.glDisableClientState(gl.GL_COLOR_ARRAY)
+        gl.glDisableClientState(gl.GL_NORMAL_ARRAY)
+        gl.glDisableClientState(gl.GL_VERTEX_ARRAY)
+        gl.glBindBuffer(gl.GL_ELEMENT_ARRAY_BUFFER, 0)
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, 0)
+
+    def _draw_triangles(self, first_quad: int, quad_count: int) -> None:
+        if quad_count <= 0:
+            return
+        self._bind(with_normals=True, with_colors=True)
+        gl.glBindBuffer(gl.GL_ELEMENT_ARRAY_BUFFER, self.triangle_ibo)
+        gl.glDrawElements(gl.GL_TRIANGLES, quad_count * 6, gl.GL_UNSIGNED_INT, ctypes.c_void_p(first_quad * 6 * 4))
+        self._unbind()
+
+    def draw_faces(self, max_layer=None) -> None:
+        # max_layer: only quads belonging to layers <= max_layer (a section cut)
+        count = len(self.face_layers)
+        if max_layer is not None:
+            count = int(np.searchsorted(self.face_layers, max_layer, side="right"))
+        self._draw_triangles(0, count)
+
+    def draw_caps(self, layer: int) -> None:
+        # Cut surface of `layer`: the tops that the (cut away) layer above was covering
+        start, end = np.searchsorted(self.cap_layers, (layer, layer + 1))
+        self._draw_triangles(len(self.face_layers) + int(start), int(end - start))
+
+    def _draw_lines(self, first_segment: int, segment_count: int) -> None:
+        if segment_count <= 0:
+            return
+        self._bind(with_normals=False, with_colors=False)
+        gl.glBindBuffer(gl.GL_ELEMENT_ARRAY_BUFFER, self.line_ibo)
+        gl.glDrawElements(gl.GL_LINES, segment_count * 2, gl.GL_UNSIGNED_INT, ctypes.c_void_p(first_segment * 2 * 4))
+        self._unbind()
+
+    def draw_edges(self, max_layer=None) -> None:
+        # Color comes from the current glColor, so the caller picks the outline color.
+        count = len(self.line_layers)
+        if max_layer is not None:
+            count = int(np.searchsorted(self.line_layers, max_layer, side="right"))
+        self._draw_lines(0, count)
+
+    def draw_cap_edges(self, layer: int) -> None:
+        # Outline of the cut surface of `layer`, to go with draw_caps
+        start, end = np.searchsorted(self.cap_line_layers, (layer, layer + 1))
+        self._draw_lines(len(self.line_layers) + int(start), int(end - start))
@@ -0,0 +1,291 @@
+import os
+import struct
+import numpy as np
+from typing import Callable, Dict, Iterator, Optional, Tuple
+from brickbuilder.core.chunk import Chunk, ChunkKey, CHUNK_SIZE, pack_positions
+from brickbuilder.core.files import replacing_file
+from brickbuilder.core.mesh import FACE_AXES, FACE_DIRECTIONS, DenseCellLookup, build_face_rects
+from brickbuilder.core.model import Model
+
+# Mesh export for other tools: binary STL, or OBJ with an MTL holding one material
+# per palette color. The model is meshed chunk by chunk in key order and each
+# chunk's faces are written before the next chunk is read, so memory follows the
+# largest chunk rather than the model (OBJ also keeps the border vertices of the
+# last slab of chunks, see export_obj). Faces between bricks are dropped, and with
+# `merge` coplanar faces of one color become rectangles. Where a rectangle's edge
+# passes a corner of another face, that corner is added to its outline, so the
+# surface has no T-junctions and is closed. Output only depends on the bricks and
+# palette, never on edit history, so exports of the same model are byte-identical.
+#
+# Vertices are written in the viewport's space: brick (x, y, z) spans x +- 0.5,
+# y +- 0.5 and z .. z + 1, one unit per brick.
+
+STL_EXTENSION = ".stl"
+OBJ_EXTENSION = ".obj"
+
+# 80 header bytes, then the u32 triangle count (patched in at the end)
+_STL_HEADER = b"Binary STL exported by BrickBuilder".ljust(80, b" ")
+_STL_TRIANGLE_DTYPE = np.dtype([
+    ("normal", "<f4", (3,)),
+    ("vertices", "<f4", (3, 3)),
+    ("attributes", "<u2"),
+])
+# Corners of a cell at the chunk box min are at origin, those at the max at origin + this
+_BOX_CORNERS = CHUNK_SIZE
+# OBJ face vertex suffix by face direction (normals 1-6 are FACE_DIRECTIONS)
+_NORMAL_SUFFIXES = np.array([f"//{i}" for i in range(1, 7)])
+_NEIGHBOUR_KEYS = [(x, y, z) for x in (-1, 0, 1) for y in (-1, 0, 1) for z in (-1, 0, 1) if (x, y, z) != (0, 0, 0)]
+
+
+class Polygons:
+    # Faces of one chunk as convex polygons on the corner lattice: corner q is at
+    # brick coordinate q - 0.5. Polygon i has counts[i] vertices, counter-clockwise
+    # seen from outside, starting at row offsets[i] of `corners`.
+    def __init__(self, direction: np.ndarray, color: np.ndarray, counts: np.ndarray, corners: np.ndarray) -> None:
+        self.direction = direction
+        self.color = color
+        self.counts = counts
+        self.offsets = np.cumsum(counts) - counts
+        self.corners = corners
+
+    def __len__(self) -> int:
+        return len(self.direction)
+
+
+def _pack_along(points: np.ndarray, axis: int) -> np.ndarray:
+    # Packed keys sorting points by their two other coordinates, then along `axis`
+    others = [a for a in range(3) if a != axis]
+    return pack_positions(points[:, others + [axis]])
+
+
+def chunk_polygons(model: Model, chunk: Chunk, merge: bool = True) -> Polygons:
+    positions, color_index = chunk.arrays()
+    origin = chunk.origin - 1
+    lookup = DenseCellLookup(model.read_region(origin, (CHUNK_SIZE + 2,) * 3), origin)
+    rects = build_face_rects(positions, color_index.astype(np.int32), lookup.lookup, merge=merge)
+    # Chunk rows are in edit order; sort so the output is not
+    rects = rects.take(np.lexsort((rects.u0, rects.v0, rects.plane, rects.direction, rects.color)))
+    n = len(rects)
+
+    # Rect corners: (u0, v0), (u1, v0), (u1, v1), (u0, v1), walked in that order
+    box = np.zeros((n, 4, 3), dtype=np.int64)
+    walk_axis = np.zeros((n, 4), dtype=np.int64)
+    backwards = np.zeros((n, 4), dtype=bool)
+    flipped = np.zeros(n, dtype=bool)
+    for d in range(6):
+        sel = np.flatnonzero(rects.direction == d)
+        a, u, v = FACE_AXES[d]
+        sign = FACE_DIRECTIONS[d][a]
+        lo_u, hi_u = rects.u0[sel], rects.u1[sel] + 1
+        lo_v, hi_v = rects.v0[sel], rects.v1[sel] + 1
+        box[sel, :, a] = (rects.plane[sel] + (sign > 0))[:, None]
+        for i, (cu, cv) in enumerate(((lo_u, lo_v), (hi_u, lo_v), (hi_u, hi_v), (lo_u, hi_v))):
+            box[sel, i, u] = cu
+            box[sel, i, v] = cv
+        walk_axis[sel] = (u, v, u, v)
+        backwards[sel, 2:] = True
+        # Same handedness rule as mesh.rect_corners
+        flipped[sel] = sign * (1 if a != 1 else -1) < 0
+
+    # Points added inside each side: corners of the chunk's other rects, or every
+    # lattice point when the side lies on the chunk box. Faces of other chunks can
+    # only touch this chunk's sides there, so neighbours agree without seeing each other.
+    start = box.reshape(-1, 3)
+    end = np.roll(box, -1, axis=1).reshape(-1, 3)
+    axis = walk_axis.reshape(-1)
+    backwards = backwards.reshape(-1)
+    lo, hi = np.minimum(start, end), np.maximum(start, end)
+    sides = np.arange(len(start))
+    low = lo[sides, axis]
+    high = hi[sides, axis]
+    local = lo - chunk.origin
+    fixed = np.ones((len(start), 3), dtype=bool)
+    fixed[sides, axis] = False
+    on_box = (fixed & ((local == 0) | (local == _BOX_CORNERS))).any(axis=1)
+
+    counts = np.where(on_box, np.maximum(high - low - 1, 0), 0)
+    first = np.zeros(len(start), dtype=np.int64)
+    lattice_by_axis = []
+    for t in range(3):
+        keys, unique = np.unique(_pack_along(start, t), return_index=True)
+        lattice_by_axis.append(start[unique, t])
+        mine = np.flatnonzero((axis == t) & ~on_box)
+        if not len(mine):
+            continue
+        below = lo[mine].copy()
+        below[:, t] += 1
+        above = hi[mine].copy()
+        above[:, t] -= 1
+        first[mine] = np.searchsorted(keys, _pack_along(below, t))
+        counts[mine] = np.searchsorted(keys, _pack_along(above, t), side="right") - first[mine]
+
+    # Each side contributes its start corner and then its added points in walk order
+    items = counts + 1
+    side = np.repeat(sides, items)
+    step = np.arange(len(side)) - np.repeat(np.cumsum(items) - items, items)
+    corners = start[side].copy()
+    extra = np.flatnonzero(step > 0)
+    s, j = side[extra], step[extra] - 1
+    rank = np.where(backwards[s], counts[s] - 1 - j, j)
+    value = low[s] + 1 + rank
+    from_set = np.flatnonzero(~on_box[s])
+    for t in range(3):
+        mine = from_set[axis[s[from_set]] == t]
+        if len(mine):
+            value[mine] = lattice_by_axis[t][first[s[mine]] + rank[mine]]
+    corners[extra, axis[s]] = value
+
+    polygon_counts = items.reshape(n, 4).sum(axis=1) if n else np.zeros(0, np.int64)
+    polygon = np.repeat(np.arange(n), polygon_counts)
+    if flipped.any():
+        # Clockwise in (u, v) for these directions: walk the outline the other way
+        position = np.arange(len(polygon)) - np.repeat(np.cumsum(polygon_counts) - polygon_counts, polygon_counts)
+        corners = corners[np.lexsort((np.where(flipped[polygon], -position, position), polygon))]
+    return Polygons(rects.direction.astype(np.int64), rects.color.astype(np.int64), polygon_counts, corners)
+
+
+def iter_polygons(model: Model, merge: bool = True,
+                  progress: Optional[Callable[[int, int], None]] = None) -> Iterator[Tuple[Chunk, Polygons]]:
+    # Polygons of every non-empty chunk in key order. progress(done, total) counts
+    # chunks and may raise to cancel.
+    keys = sorted(key for key, chunk in model.chunks.items() if chunk.count)
+    total = len(keys)
+    if progress:
+        progress(0, total)
+    for done, key in enumerate(keys, 1):
+        chunk = model.chunks[key]
+        yield chunk, chunk_polygons(model, chunk, merge)
+        if progress:
+            progress(done, total)
+
+
+def _positions(corners: np.ndarray) -> np.ndarray:
+    # Corner lattice to viewport space (bricks are lifted by 0.5, like the renderers)
+    return corners.astype(np.float64) - (0.5, 0.5, 0.0)
+
+
+def _triangulate(polygons: Polygons) -> Tuple[np.ndarray, np.ndarray]:
+    # Triangles as (T, 3, 3) points plus the polygon of each, in polygon order. A
+    # polygon is fanned from a corner whose two sides have no added points, giving
+    # count - 2 triangles, none degenerate (a plain rectangle becomes two). When
+    # every corner has an added point next to it, the fan starts at the center.
+    points = _positions(polygons.corners)
+    offsets, counts = polygons.offsets, polygons.counts
+    polygon = np.repeat(np.arange(len(polygons)), counts)
+    position = np.arange(len(points)) - offsets[polygon]
+    following = offsets[polygon] + (position + 1) % counts[polygon]
+    preceding = offsets[polygon] + (position - 1) % counts[polygon]
+    turn = np.cross(points - points[preceding], points[following] - points)
+    corner = (turn != 0).any(axis=1)
+    plain = corner & corner[preceding] & corner[following]
+    root = np.minimum.reduceat(np.where(plain, position, counts[polygon]), offsets)
+    rooted = root < counts
+
+    # Corner fans: root, vertex k, vertex k + 1 for k = 1 .. count - 2 steps past the root
+    k = (position - root[polygon]) % counts[polygon]
+    mine = np.flatnonzero(rooted[polygon] & (k >= 1) & (k <= counts[polygon] - 2))
+    corner_fan = np.stack([points[offsets[polygon[mine]] + root[polygon[mine]]], points[mine],
+                           points[following[mine]]], axis=1)
+    # Center fans: center, vertex, next vertex
+    centers = np.add.reduceat(points, offsets) / counts[:, None]
+    rest = np.flatnonzero(~rooted[polygon])
+    center_fan = np.stack([centers[polygon[rest]], points[rest], points[following[rest]]], axis=1)
+
+    triangle_polygon = np.concatenate([polygon[mine], polygon[rest]])
+    order = np.lexsort((np.concatenate([k[mine], position[rest]]), triangle_polygon))
+    return triangle_polygon[order], np.concatenate([corner_fan, center_fan])[order]
+
+
+def export_stl(model: Model, filename: str, merge: bool = True,
+               progress: Optional[Callable[[int, int], None]] = None) -> int:
+    # Binary STL; returns the triangle count
+    count = 0
+    with replacing_file(filename) as temp, open(temp, "wb") as f:
+        f.write(_STL_HEADER + struct.pack("<I", 0))
+        for _, polygons in iter_polygons(model, merge, progress):
+            if not len(polygons):
+                continue
+            triangle_polygon, triangles = _triangulate(polygons)
+            records = np.zeros(len(triangles), dtype=_STL_TRIANGLE_DTYPE)
+            records["normal"] = FACE_DIRECTIONS[polygons.direction[triangle_polygon]]
+            records["vertices"] = triangles
+            f.write(records.tobytes())
+            count += len(records)
+        f.seek(len(_STL_HEADER))
+        f.write(struct.pack("<I", count))
+    return count
+
+
+def export_obj(model: Model, filename: str, merge: bool = True,
+               progress: Optional[Callable[[int, int], None]] = None) -> int:
+    # OBJ plus an MTL next to it (same name, .mtl) with a material per palette color;
+    # returns the face count. Faces are written as polygons, including their added
+    # side points, and share vertices, also across chunks: the border vertices of
+    # chunks that still have unvisited neighbours are kept to look them up.
+    base = filename[:-len(OBJ_EXTENSION)] if filename.lower().endswith(OBJ_EXTENSION) else filename
+    mtl_filename = base + ".mtl"
+    palette = model.palette
+    with replacing_file(mtl_filename) as temp, open(temp, "wb") as f:
+        lines = [f"# BrickBuilder palette, {len(palette)} colors\n"]
+        for i, (r, g, b) in enumerate(palette.colors.tolist()):
+            lines.append(f"\n# {palette.name(i)}\nnewmtl color_{i}\nKa 0 0 0\nKd {r:.6f} {g:.6f} {b:.6f}\nKs 0 0 0\nd 1\nillum 1\n")
+        f.write("".join(lines).encode())
+
+    faces = 0
+    vertex_count = 0
+    # Chunk key -> sorted packed corners on its box and their vertex numbers
+    border: Dict[ChunkKey, Tuple[np.ndarray, np.ndarray]] = {}
+    with replacing_file(filename) as temp, open(temp, "wb") as f:
+        header = [f"# Exported by BrickBuilder\nmtllib {os.path.basename(mtl_filename)}\n"]
+        header += [f"vn {x} {y} {z}\n" for x, y, z in FACE_DIRECTIONS.tolist()]
+        f.write("".join(header).encode())
+        for chunk, polygons in iter_polygons(model, merge, progress):
+            # Drop borders of chunks whose neighbours have all been visited
+            while border and tuple(k + 1 for k in next(iter(border))) < chunk.key:
+                del border[next(iter(border))]
+            if not len(polygons):
+                continue
+            keys, inverse = np.unique(pack_positions(polygons.corners), return_inverse=True)
+            inverse = inverse.reshape(-1)
+            numbers = np.full(len(keys), -1, dtype=np.int64)
+            for offset in _NEIGHBOUR_KEYS:
+                known = border.get(tuple(k + o for k, o in zip(chunk.key, offset)))
+                if known is None or not len(known[0]):
+                    continue
+                index = np.minimum(np.searchsorted(known[0], keys), len(known[0]) - 1)
+                found = (known[0][index] == keys) & (numbers < 0)
+                numbers[found] = known[1][index[found]]
+            new = np.flatnonzero(numbers < 0)
+            numbers[new] = vertex_count + 1 + np.arange(len(new))
+            vertex_count += len(new)
+            corners = np.empty((len(keys), 3), dtype=np.int64)
+            corners[inverse] = polygons.corners
+            local = corners - chunk.origin
+            on_box = ((local == 0) | (local == _BOX_CORNERS)).any(axis=1)
+            border[chunk.key] = (keys[on_box], numbers[on_box])
+
+            lines = [f"v {x:.1f} {y:.1f} {z:.1f}\n" for x, y, z in _positions(corners[new]).tolist()]
+            # Face lines built token by token: " v//n" per vertex, "f" before each
+            # polygon (after a usemtl line where the color changes) and a newline after
+            # (object arrays, so the longer tokens are not cut to a fixed width)
+            polygon = np.repeat(np.arange(len(polygons)), polygons.counts)
+            tokens = np.strings.add(np.strings.add(" ", numbers[inverse].astype(str)),
+                                    _NORMAL_SUFFIXES[polygons.direction[polygon]]).astype(object)
+            color = polygons.color
+            changed = np.r_[True, color[1:] != color[:-1]]
+            prefixes = np.where(changed, np.strings.add(np.strings.add("usemtl color_", color.astype(str)), "\nf"), "f")
+            tokens[polygons.offsets] = prefixes.astype(object) + tokens[polygons.offsets]
+            ends = polygons.offsets + polygons.counts - 1
+            tokens[ends] = tokens[ends] + "\n"
+            lines.append("".join(tokens.tolist()))
+            f.write("".join(lines).encode())
+            faces += len(polygons)
+    return faces
+
+
+def export_mesh(model: Model, filename: str, merge: bool = True,
+                progress: Optional[Callable[[int, int], None]] = None) -> int:
+    # Format by extension: .obj writes OBJ + MTL, anything else binary STL
+    if filename.lower().endswith(OBJ_EXTENSION):
+        return export_obj(model, filename, merge, progress)
+    return export_stl(model, filename, merge, progress)
@@ -1,79 +1,474 @@
-from typing import Dict, Optional, Tuple, List, Any
+from typing import Dict, Optional, Tuple, List, Any, Iterator, Union
 import glm
-import json
+import numpy as np
+from brickbuilder.core import binary_format, json_format
 from brickbuilder.core.brick import Brick
+from brickbuilder.core.changes import EMPTY, ChangeBatch, ChangeListener
+from brickbuilder.core.chunk import Chunk, ChunkKey, CHUNK_MASK, CHUNK_SHIFT, CHUNK_SIZE, chunk_key, group_by_chunk, pack_positions
+from brickbuilder.core.files import replacing_file
+from brickbuilder.core.json_format import ProgressCallback
+from brickbuilder.core.palette import Palette
 
 class Model:
     def __init__(self) -> None:
-        # Store bricks in a dict keyed by position tuple for O(1) lookup
-        # key: (x, y, z), value: Brick
-        self.bricks: Dict[Tuple[int, int, int], Brick] = {}
+        # Bricks live in fixed-size chunks keyed by chunk coordinate, so region
+        # queries and edits only touch the chunks involved.
+        self.chunks: Dict[ChunkKey, Chunk] = {}
+        # Each brick stores a uint16 index into this table instead of its own color.
+        # It starts with the standard COLORS; custom colors are appended.
+        self.palette = Palette()
+        self.brick_count = 0
+        # Bricks per Z layer, for section views stepping through the build
+        self.layer_counts: Dict[int, int] = {}
         self.modified = False
+        # Bumped on every change so caches (e.g. GPU buffers) know when to rebuild
+        self.revision = 0
+        self._bounds_cache = None
+        self._bounds_revision = -1
+        # Change journal subscribers, see subscribe()
+        self._listeners: List[ChangeListener] = []
 
-    def add_brick(self, position: glm.ivec3, color: glm.vec3) -> None:
-        key = (position.x, position.y, position.z)
-        if key not in self.bricks:
-            self.bricks[key] = Brick(position, color)
-            self.modified = True
+    def __len__(self) -> int:
+        return self.brick_count
+
+    def mark_modified(self) -> None:
+        self.modified = True
+        self.revision += 1
+
+    def subscribe(self, listener: ChangeListener) -> None:
+        # Listeners get one ChangeBatch per edit, after the model has been updated
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def unsubscribe(self, listener: ChangeListener) -> None:
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _notify(self, batch: ChangeBatch) -> None:
+        # Stamp every chunk whose mesh the batch can change (see Chunk.revision),
+        # then hand the batch to the listeners
+        batch.revision = self.revision
+        if batch.reset:
+            chunks = self.chunks.values()
+        else:
+            chunks = filter(None, map(self.chunks.get, map(tuple, batch.affected_chunks().tolist())))
+        for chunk in chunks:
+            chunk.revision = self.revision
+        for listener in list(self._listeners):
+            listener(batch)
+
+    def _notify_cell(self, x: int, y: int, z: int, before: int, after: int) -> None:
+        self._notify(ChangeBatch(np.array([(x, y, z)], np.int32), [before], [after]))
+
+    def _insert(self, x: int, y: int, z: int, color_index: int) -> bool:
+        key = chunk_key(x, y, z)
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            chunk = Chunk(key)
+            self.chunks[key] = chunk
+        if chunk.set(x & CHUNK_MASK, y & CHUNK_MASK, z & CHUNK_MASK, color_index):
+            self.brick_count += 1
+            self.layer_counts[z] = self.layer_counts.get(z, 0) + 1
+            return True
+        return False
+
+    def _insert_arrays(self, positions: np.ndarray, color_index: np.ndarray) -> int:
+        # Vectorized insert; cells that are already occupied (or repeated) keep their first brick
+        added = 0
+        for key, idx in group_by_chunk(positions):
+            chunk = self.chunks.get(key)
+            if chunk is None:
+                chunk = Chunk(key)
+                self.chunks[key] = chunk
+            p = positions[idx]
+            local = p & CHUNK_MASK
+            flat = (local[:, 0] * CHUNK_SIZE + local[:, 1]) * CHUNK_SIZE + local[:, 2]
+            _, first = np.unique(flat, return_index=True)
+            first.sort()
+            p, local = p[first], local[first]
+            empty = chunk.slots[local[:, 0], local[:, 1], local[:, 2]] < 0
+            chunk.insert_many(p[empty], color_index[idx][first][empty])
+            self._count_layers(p[empty][:, 2], 1)
+            added += int(empty.sum())
+            if chunk.count == 0:
+                del self.chunks[key]
+        self.brick_count += added
+        return added
+
+    def _apply_cells(self, positions: np.ndarray, values: np.ndarray) -> Optional[ChangeBatch]:
+        # Vectorized write of (N, 3) unique cells: each becomes palette index `values`
+        # or empty (EMPTY). Emits one batch for the cells that actually changed and
+        # returns it (None if nothing changed).
+        positions = np.asarray(positions, dtype=np.int32).reshape(-1, 3)
+        values = np.asarray(values, dtype=np.int32)
+        before = self.lookup(positions)
+        changed = before != values
+        if not changed.any():
+            return None
+        positions, before, values = positions[changed], before[changed], values[changed]
+        for key, idx in group_by_chunk(positions):
+            chunk = self.chunks.get(key)
+            if chunk is None:
+                chunk = Chunk(key)
+                self.chunks[key] = chunk
+            p, b, v = positions[idx], before[idx], values[idx]
+            local = p & CHUNK_MASK
+            removed = v == EMPTY
+            added = b == EMPTY
+            recolored = ~removed & ~added
+            chunk.remove_many(local[removed])
+            chunk.recolor_many(local[recolored], v[recolored])
+            chunk.insert_many(p[added], v[added])
+            if chunk.count == 0:
+                del self.chunks[key]
+        removed = values == EMPTY
+        added = before == EMPTY
+        self._count_layers(positions[removed][:, 2], -1)
+        self._count_layers(positions[added][:, 2], 1)
+        self.brick_count += int(added.sum()) - int(removed.sum())
+        self.mark_modified()
+        batch = ChangeBatch(positions, before, values)
+        self._notify(batch)
+        return batch
+
+    def _count_layers(self, z: np.ndarray, sign: int) -> None:
+        layers, counts = np.unique(z, return_counts=True)
+        for layer, count in zip(layers.tolist(), counts.tolist()):
+            total = self.layer_counts.get(layer, 0) + sign * count
+            if total:
+                self.layer_counts[layer] = total
+            else:
+                del self.layer_counts[layer]
+
+    def layer_range(self) -> Optional[Tuple[int, int]]:
+        # Lowest and highest occupied Z layer
+        if not self.layer_counts:
+            return None
+        return min(self.layer_counts), max(self.layer_counts)
+
+    def _color_index(self, color: Union[glm.vec3, int]) -> int:
+        # Colors can be given as a palette index or as an RGB value to intern
+        if isinstance(color, (int, np.integer)):
+            if not self.palette.is_valid(int(color)):
+                raise IndexError(f"Palette index {color} out of range")
+            return int(color)
+        return self.palette.index_of(color)
+
+    def add_brick(self, position: glm.ivec3, color: Union[glm.vec3, int]) -> None:
+        color_index = self._color_index(color)
+        if self._insert(position.x, position.y, position.z, color_index):
+            self.mark_modified()
+            self._notify_cell(position.x, position.y, position.z, EMPTY, color_index)
 
     def remove_brick(self, position: glm.ivec3) -> None:
-        key = (position.x, position.y, position.z)
-        if key in self.bricks:
-            del self.bricks[key]
-            self.modified = True
+        x, y, z = position.x, position.y, position.z
+        key = chunk_key(x, y, z)
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            return
+        before = chunk.get(x & CHUNK_MASK, y & CHUNK_MASK, z & CHUNK_MASK)
+        if chunk.clear_cell(x & CHUNK_MASK, y & CHUNK_MASK, z & CHUNK_MASK):
+            self.brick_count -= 1
+            self.layer_counts[z] -= 1
+            if not self.layer_counts[z]:
+                del self.layer_counts[z]
+            if chunk.count == 0:
+                del self.chunks[key]
+            self.mark_modified()
+            self._notify_cell(x, y, z, before, EMPTY)
+
+    def _color_indices(self, colors, count: int) -> np.ndarray:
+        # Bulk version of _color_index: one color (index or RGB) for every cell,
+        # (N,) palette indices or (N, 3) RGB values -> (N,) int32 indices
+        if isinstance(colors, (int, np.integer, glm.vec3)):
+            return np.full(count, self._color_index(colors), dtype=np.int32)
+        colors = np.asarray(colors)
+        if colors.ndim == 2:
+            if colors.shape != (count, 3):
+                raise ValueError("Expected one RGB color per position")
+            return self.palette.intern_array(colors).astype(np.int32)
+        if colors.shape != (count,):
+            raise ValueError("Expected one palette index per position")
+        indices = colors.astype(np.int64)
+        if count and (indices.min() < 0 or indices.max() >= len(self.palette)):
+            raise IndexError("Palette index out of range")
+        return indices.astype(np.int32)
+
+    @staticmethod
+    def _box(min_corner, max_corner) -> Tuple[np.ndarray, Tuple[int, int, int]]:
+        # Inclusive box corners (in any order) -> lowest corner and shape
+        a = np.array(tuple(min_corner), dtype=np.int64)
+        b = np.array(tuple(max_corner), dtype=np.int64)
+        lo = np.minimum(a, b)
+        return lo, tuple((np.maximum(a, b) - lo + 1).tolist())
+
+    def add_bricks(self, positions: np.ndarray, colors) -> int:
+        # Bulk add_brick for (N, 3) positions. Occupied cells are left alone and a
+        # repeated position keeps its first color, like calling add_brick in order.
+        # Emits a single change batch; returns the number of bricks added.
+        positions, color_index = self._unique_cells(positions, colors)
+        empty = self.lookup(positions) < 0
+        batch = self._apply_cells(positions[empty], color_index[empty])
+        return 0 if batch is None else len(batch)
+
+    def paint_bricks(self, positions: np.ndarray, colors) -> int:
+        # Bulk set_brick_color for (N, 3) positions; empty cells are skipped.
+        # Emits a single change batch; returns the number of bricks recoloured.
+        positions, color_index = self._unique_cells(positions, colors)
+        occupied = self.lookup(positions) >= 0
+        batch = self._apply_cells(positions[occupied], color_index[occupied])
+        return 0 if batch is None else len(batch)
+
+    def remove_bricks(self, positions: np.ndarray) -> int:
+        # Bulk remove_brick for (N, 3) positions; empty cells are skipped.
+        # Emits a single change batch; returns the number of bricks removed.
+        positions, _ = self._unique_cells(positions, 0)
+        batch = self._apply_cells(positions, np.full(len(positions), EMPTY, dtype=np.int32))
+        return 0 if batch is None else len(batch)
+
+    def _unique_cells(self, positions: np.ndarray, colors) -> Tuple[np.ndarray, np.ndarray]:
+        # Positions as (N, 3) int32 with their palette indices, first occurrence kept
+        positions = np.asarray(positions, dtype=np.int32).reshape(-1, 3)
+        color_index = self._color_indices(colors, len(positions))
+        _, first = np.unique(pack_positions(positions), return_index=True)
+        return positions[first], color_index[first]
+
+    def fill_box(self, min_corner, max_corner, color: Union[glm.vec3, int], replace: bool = False) -> int:
+        # Fill the inclusive box with one color. Existing bricks are kept unless
+        # replace is set, in which case they are recoloured. Returns cells changed.
+        lo, shape = self._box(min_corner, max_corner)
+        return self.apply_mask(lo, np.ones(shape, dtype=bool), color, replace)
+
+    def remove_region(self, min_corner, max_corner) -> int:
+        # Remove every brick in the inclusive box; returns the number removed
+        lo, shape = self._box(min_corner, max_corner)
+        return self.apply_mask(lo, np.ones(shape, dtype=bool), None)
+
+    def paint_region(self, min_corner, max_corner, color: Union[glm.vec3, int]) -> int:
+        # Recolour the existing bricks in the inclusive box; returns the number recoloured
+        lo, shape = self._box(min_corner, max_corner)
+        region = self.read_region(lo, shape)
+        return self.apply_mask(lo, region >= 0, color, replace=True)
+
+    def apply_mask(self, origin, mask: np.ndarray, color: Optional[Union[glm.vec3, int]],
+                   replace: bool = False) -> int:
+        # Write a 3D boolean mask whose [0, 0, 0] cell sits at `origin`: True cells
+        # are filled with `color` (only empty ones unless replace is set), or removed
+        # when color is None. Emits a single change batch; returns cells changed.
+        mask = np.asarray(mask, dtype=bool)
+        if mask.ndim != 3:
+            raise ValueError("Mask must be 3D")
+        lo = np.array(tuple(origin), dtype=np.int64)
+        if color is None:
+            mask = mask & (self.read_region(lo, mask.shape) >= 0)
+        elif not replace:
+            mask = mask & (self.read_region(lo, mask.shape) < 0)
+        positions = (np.argwhere(mask) + lo).astype(np.int32)
+        if color is None:
+            values = np.full(len(positions), EMPTY, dtype=np.int32)
+        else:
+            values = np.full(len(positions), self._color_index(color), dtype=np.int32)
+        batch = self._apply_cells(positions, values)
+        return 0 if batch is None else len(batch)
 
     def get_brick(self, position: glm.ivec3) -> Optional[Brick]:
-        key = (position.x, position.y, position.z)
-        return self.bricks.get(key)
-    
-    def get_all_bricks(self) -> Any:
-        # Returns dict_values, typehint as Any or Collection[Brick]
-        return self.bricks.values()
+        x, y, z = position.x, position.y, position.z
+        chunk = self.chunks.get(chunk_key(x, y, z))
+        if chunk is None:
+            return None
+        index = chunk.get(x & CHUNK_MASK, y & CHUNK_MASK, z & CHUNK_MASK)
+        if index < 0:
+            return None
+        return Brick(glm.ivec3(x, y, z), self.palette.color(index), index)
+
+    def set_brick_color(self, position: glm.ivec3, color: Union[glm.vec3, int]) -> bool:
+        # Bricks handed out by get_brick are copies, so recolouring goes through here.
+        # With palette indices this is a single uint16 write.
+        x, y, z = position.x, position.y, position.z
+        chunk = self.chunks.get(chunk_key(x, y, z))
+        if chunk is None:
+            return False
+        color_index = self._color_index(color)
+        before = chunk.get(x & CHUNK_MASK, y & CHUNK_MASK, z & CHUNK_MASK)
+        if before < 0:
+            return False
+        if before != color_index:
+            chunk.recolor(x & CHUNK_MASK, y & CHUNK_MASK, z & CHUNK_MASK, color_index)
+            self.mark_modified()
+            self._notify_cell(x, y, z, before, color_index)
+        return True
+
+    def get_all_bricks(self) -> Iterator[Brick]:
+        # Lightweight Brick views for callers that want objects; bulk consumers
+        # should use iter_arrays/get_arrays instead.
+        color = self.palette.color
+        for positions, color_index in self.iter_arrays():
+            for p, c in zip(positions.tolist(), color_index.tolist()):
+                yield Brick(glm.ivec3(*p), color(c), c)
+
+    def iter_arrays(self) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        # Per-chunk (positions, palette index) views, no per-brick Python objects
+        for chunk in self.chunks.values():
+            yield chunk.arrays()
+
+    def get_arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        # All bricks as (N, 3) int32 positions and (N,) uint16 palette indices
+        if not self.chunks:
+            return np.zeros((0, 3), np.int32), np.zeros(0, np.uint16)
+        parts = list(self.iter_arrays())
+        return np.concatenate([p for p, _ in parts]), np.concatenate([c for _, c in parts])
+
+    def lookup(self, positions: np.ndarray) -> np.ndarray:
+        # Vectorized get_brick: palette index per (N, 3) position, -1 where empty
+        result = np.full(len(positions), -1, dtype=np.int32)
+        for key, idx in group_by_chunk(positions):
+            chunk = self.chunks.get(key)
+            if chunk is None:
+                continue
+            local = positions[idx] & CHUNK_MASK
+            rows = chunk.slots[local[:, 0], local[:, 1], local[:, 2]]
+            hit = rows >= 0
+            result[idx[hit]] = chunk.color_index[rows[hit]]
+        return result
+
+    def nbytes(self) -> int:
+        # Bytes held by the brick arrays (excluding the palette)
+        return sum(chunk.nbytes for chunk in self.chunks.values())
+
+    def read_region(self, min_corner, shape) -> np.ndarray:
+        # Dense int32 grid of palette indices (-1 = empty) for the box [min_corner, min_corner + shape)
+        lo = np.asarray(min_corner, dtype=np.int64)
+        shape = tuple(int(s) for s in shape)
+        hi = lo + np.array(shape)
+        grid = np.full(shape, -1, dtype=np.int32)
+        k_lo = lo >> CHUNK_SHIFT
+        k_hi = (hi - 1) >> CHUNK_SHIFT
+        for kx in range(k_lo[0], k_hi[0] + 1):
+            for ky in range(k_lo[1], k_hi[1] + 1):
+                for kz in range(k_lo[2], k_hi[2] + 1):
+                    chunk = self.chunks.get((kx, ky, kz))
+                    if chunk is None:
+                        continue
+                    src_lo = np.maximum(lo, chunk.origin)
+                    src_hi = np.minimum(hi, chunk.origin + CHUNK_SIZE)
+                    dst = tuple(slice(a, b) for a, b in zip(src_lo - lo, src_hi - lo))
+                    src = tuple(slice(a, b) for a, b in zip(src_lo - chunk.origin, src_hi - chunk.origin))
+                    rows = chunk.slots[src]
+                    occupied = rows >= 0
+                    block = np.full(rows.shape, -1, dtype=np.int32)
+                    block[occupied] = chunk.color_index[rows[occupied]]
+                    grid[dst] = block
+        return grid
+
+    def bounds(self) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        # Inclusive (min, max) cell coordinates of all bricks, cached per revision
+        if self._bounds_revision == self.revision:
+            return self._bounds_cache
+        lo = hi = None
+        for chunk in self.chunks.values():
+            b = chunk.bounds()
+            if b is None:
+                continue
+            lo = b[0] if lo is None else np.minimum(lo, b[0])
+            hi = b[1] if hi is None else np.maximum(hi, b[1])
+        self._bounds_cache = None if lo is None else (lo, hi)
+        self._bounds_revision = self.revision
+        return self._bounds_cache
+
+    def snapshot(self) -> "Model":
+        # Independent copy of the bricks and palette, e.g. to save on another thread
+        # while this model keeps being edited. Listeners are not copied.
+        copy = Model()
+        copy.palette = self.palette.copy()
+        copy.chunks = {key: chunk.copy() for key, chunk in self.chunks.items()}
+        copy.brick_count = self.brick_count
+        copy.layer_counts = dict(self.layer_counts)
+        copy.revision = self.revision
+        copy.modified = self.modified
+        return copy
 
     def clear(self) -> None:
-        self.bricks.clear()
-        self.modified = True # Clearing makes it modified relative to previous state? 
-        # Usually New -> Clears -> Modified=False (fresh state). 
-        # But if we call clear() blindly it modifies. 
+        self.chunks.clear()
+        self.brick_count = 0
+        self.layer_counts = {}
+        self.mark_modified() # Clearing makes it modified relative to previous state?
+        # Usually New -> Clears -> Modified=False (fresh state).
+        # But if we call clear() blindly it modifies.
         # Application logic should reset modified after "New" action.
+        self._notify(ChangeBatch.full_reset(self.revision))
 
     def to_dict(self) -> Dict[str, Any]:
+        # Version 2: colors are written once in the palette, bricks only carry an index
+        positions, color_index = self.get_arrays()
         brick_list: List[Dict[str, Any]] = []
-        for brick in self.bricks.values():
+        for (x, y, z), c in zip(positions.tolist(), color_index.tolist()):
             brick_data = {
-                "x": brick.position.x,
-                "y": brick.position.y,
-                "z": brick.position.z,
-                "r": brick.color.x,
-                "g": brick.color.y,
-                "b": brick.color.z
+                "x": x,
+                "y": y,
+                "z": z,
+                "c": c
             }
             brick_list.append(brick_data)
-        
+
         return {
-            "version": 1,
+            "version": 2,
+            "palette": self.palette.to_list(),
             "bricks": brick_list
         }
 
     def from_dict(self, data: Dict[str, Any]) -> None:
-        self.clear()
-        if "bricks" in data:
-            for b_data in data["bricks"]:
-                pos = glm.ivec3(b_data["x"], b_data["y"], b_data["z"])
-                col = glm.vec3(b_data["r"], b_data["g"], b_data["b"])
-                # Bypass add_brick to avoid setting modified=True for every brick?
-                # Or just reset at end.
-                key = (pos.x, pos.y, pos.z)
-                self.bricks[key] = Brick(pos, col)
+        # Replaces the contents directly; _finish_load sends the one reset
+        self.chunks = {}
+        bricks = data.get("bricks", [])
+        if "palette" in data:
+            self.palette = Palette.from_list(data["palette"])
+        else:
+            self.palette = Palette()
+        if bricks:
+            # Bypass add_brick: gather columns once and insert them vectorized,
+            # then stamp chunks once below
+            positions = np.array([(b["x"], b["y"], b["z"]) for b in bricks], dtype=np.int32)
+            if "palette" in data:
+                color_index = np.array([b["c"] for b in bricks], dtype=np.int64)
+                if color_index.min() < 0 or color_index.max() >= len(self.palette):
+                    raise ValueError("Brick color index out of palette range")
+                color_index = color_index.astype(np.uint16)
+            else:
+                # Version 1 files store RGB per brick
+                colors = np.array([(b["r"], b["g"], b["b"]) for b in bricks], dtype=np.float32)
+                color_index = self.palette.intern_array(colors)
+            self._insert_arrays(positions, color_index)
+        self._finish_load()
+
+    def _finish_load(self) -> None:
+        self.brick_count = sum(chunk.count for chunk in self.chunks.values())
+        self.layer_counts = {}
+        for positions, _ in self.iter_arrays():
+            self._count_layers(positions[:, 2], 1)
+        self.revision += 1
         self.modified = False # Loaded state is clean
+        self._notify(ChangeBatch.full_reset(self.revision))
 
-    def save_to_file(self, filename: str) -> None:
-        data = self.to_dict()
-        with open(filename, 'w') as f:
-            json.dump(data, f, indent=4)
+    def save_to_file(self, filename: str, progress: Optional[ProgressCallback] = None) -> None:
+        # Written through a temporary file (see core.files), so a failed or cancelled
+        # save never leaves a truncated file behind.
+        # Format follows the extension: .bbm is the compact binary format, anything else JSON.
+        with replacing_file(filename) as temp:
+            if filename.lower().endswith(binary_format.EXTENSION):
+                binary_format.save_binary(self, temp, progress=progress)
+            else:
+                json_format.save_json(self, temp, progress)
         self.modified = False
 
-    def load_from_file(self, filename: str) -> None:
-        with open(filename, 'r') as f:
-            data = json.load(f)
-        self.from_dict(data)
+    def load_from_file(self, filename: str, progress: Optional[ProgressCallback] = None) -> None:
+        # Load into a scratch model so a bad file leaves this one untouched.
+        # Sniff the magic rather than trusting the extension.
+        loaded = Model()
+        if binary_format.is_binary_model(filename):
+            loaded.palette, loaded.chunks = binary_format.load_binary(filename, progress)
+        else:
+            json_format.load_json(loaded, filename, progress)
+        # Swap the contents in directly; _finish_load recounts and sends the one reset
+        self.palette = loaded.palette
+        self.chunks = loaded.chunks
+        self._finish_load()
@@ -0,0 +1,118 @@
+import glm
+import numpy as np
+from typing import Any, Dict, List, Optional, Tuple
+from brickbuilder.core.colors import COLORS
+
+# Indices are stored as uint16 per brick
+MAX_PALETTE_SIZE = 0xFFFF
+
+ColorKey = Tuple[float, float, float]
+
+
+def color_key(color) -> ColorKey:
+    # Round through float32 so colors from JSON (float64) and glm (float32) intern together
+    c = glm.vec3(color)
+    return (c.x, c.y, c.z)
+
+
+class Palette:
+    # Interned color table. Bricks store a small integer index into it instead of
+    # their own color, so equal colors are shared and comparisons are integer compares.
+    # The standard COLORS always come first; custom colors are appended after them.
+    def __init__(self, seed: Optional[Dict[str, glm.vec3]] = COLORS) -> None:
+        self._colors: List[ColorKey] = []
+        self._names: List[Optional[str]] = []
+        self._index: Dict[ColorKey, int] = {}
+        self._array = np.zeros((0, 3), dtype=np.float32)
+        self.builtin_count = 0
+        if seed:
+            for name, color in seed.items():
+                self.add_custom(color, name)
+            self.builtin_count = len(self._colors)
+
+    def __len__(self) -> int:
+        return len(self._colors)
+
+    def index_of(self, color) -> int:
+        # Returns the index of the color, adding it as an unnamed custom entry if needed
+        key = color_key(color)
+        index = self._index.get(key)
+        if index is None:
+            if len(self._colors) >= MAX_PALETTE_SIZE:
+                raise ValueError("Palette is full")
+            index = len(self._colors)
+            self._colors.append(key)
+            self._names.append(None)
+            self._index[key] = index
+            self._array = np.array(self._colors, dtype=np.float32)
+        return index
+
+    def find(self, color) -> Optional[int]:
+        # Like index_of, but never adds an entry
+        return self._index.get(color_key(color))
+
+    def add_custom(self, color, name: Optional[str] = None) -> int:
+        index = self.index_of(color)
+        if name and not self._names[index]:
+            self._names[index] = name
+        return index
+
+    def intern_array(self, colors: np.ndarray) -> np.ndarray:
+        # Vectorized index_of for (N, 3) float colors -> (N,) uint16 indices
+        if len(colors) == 0:
+            return np.zeros(0, dtype=np.uint16)
+        unique, inverse = np.unique(np.asarray(colors, dtype=np.float32), axis=0, return_inverse=True)
+        lut = np.array([self.index_of(tuple(c)) for c in unique.tolist()], dtype=np.uint16)
+        return lut[inverse.reshape(-1)]
+
+    def color(self, index: int) -> glm.vec3:
+        return glm.vec3(*self._colors[index])
+
+    def name(self, index: int) -> str:
+        name = self._names[index]
+        if name:
+            return name
+        r, g, b = (int(round(c * 255)) for c in self._colors[index])
+        return f"#{r:02X}{g:02X}{b:02X}"
+
+    def is_custom(self, index: int) -> bool:
+        return index >= self.builtin_count
+
+    def is_valid(self, index: int) -> bool:
+        return 0 <= index < len(self._colors)
+
+    @property
+    def colors(self) -> np.ndarray:
+        # (len, 3) float32 RGB table, indexable by the per-brick indices
+        return self._array
+
+    def copy(self) -> "Palette":
+        return Palette.from_list(self.to_list())
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        entries = []
+        for (r, g, b), name in zip(self._colors, self._names):
+            entry: Dict[str, Any] = {"r": r, "g": g, "b": b}
+            if name:
+                entry["name"] = name
+            entries.append(entry)
+        return entries
+
+    @classmethod
+    def from_list(cls, entries: List[Dict[str, Any]]) -> "Palette":
+        # Rebuild a saved table with its indices unchanged
+        palette = cls(seed=None)
+        for entry in entries:
+            key = color_key((entry["r"], entry["g"], entry["b"]))
+            palette._index.setdefault(key, len(palette._colors))
+            palette._colors.append(key)
+            palette._names.append(entry.get("name"))
+        palette._array = np.array(palette._colors, dtype=np.float32).reshape(-1, 3)
+        # Entries matching the standard colors in order still count as built-in
+        builtin = 0
+        for (name, color), key in zip(COLORS.items(), palette._colors):
+            if color_key(color) != key:
+                break
+            builtin += 1
+        palette.builtin_count = builtin
+        return palette
@@ -1,8 +1,10 @@
 import glm
 import math
+import numpy as np
 from typing import Optional, Tuple
 from brickbuilder.core.camera import Camera
 from brickbuilder.core.model import Model
+from brickbuilder.core.chunk import CHUNK_MASK, CHUNK_SHIFT
 
 class Ray:
     def __init__(self, origin: glm.vec3, direction: glm.vec3):
@@ -15,35 +17,12 @@ def get_mouse_ray(mouse_x: float, mouse_y: float, width: float, height: float, c
     ndc_x = (2.0 * mouse_x) / width - 1.0
     ndc_y = 1.0 - (2.0 * mouse_y) / height # Flip Y
     
-    # Clip coordinates
-    clip_coords = glm.vec4(ndc_x, ndc_y, -1.0, 1.0)
-    
-    # Inverse Projection
-    inv_proj = glm.inverse(camera.get_projection_matrix())
-    eye_coords = inv_proj * clip_coords
-    
-    # Inverse View
-    inv_view = glm.inverse(camera.get_view_matrix())
-    
-    # For Orthographic:
-    # Ray direction is the Camera's Forward vector (negative Z axis of View Space).
-    # Ray origin depends on the screen coordinate.
-    
-    # The world space position of the "mouse on near plane":
-    # (ndc_x, ndc_y, -1, 1) transformed by inv(Proj * View)
-    
-    # Let's do it fully with matrices which handles both Ortho and Persp generic cases usually.
-    # World position of near plane point
-    inv_prod = glm.inverse(camera.get_projection_matrix() * camera.get_view_matrix())
-    
-    # Near point (z = -1 in NDC)
-    near_point_ndc = glm.vec4(ndc_x, ndc_y, -1.0, 1.0)
-    world_near = inv_prod * near_point_ndc
+    # Unproject the near (z = -1) and far (z = 1) points with the camera's cached
+    # inverse(Proj * View); works for ortho and perspective alike
+    inv_prod = camera.inverse_view_projection_matrix
+    world_near = inv_prod * glm.vec4(ndc_x, ndc_y, -1.0, 1.0)
     world_near /= world_near.w
-    
-    # Far point (z = 1 in NDC)
-    far_point_ndc = glm.vec4(ndc_x, ndc_y, 1.0, 1.0)
-    world_far = inv_prod * far_point_ndc
+    world_far = inv_prod * glm.vec4(ndc_x, ndc_y, 1.0, 1.0)
     world_far /= world_far.w
     
     origin = glm.vec3(world_near)
@@ -134,44 +113,260 @@ def intersect_aabb(ray: Ray, box_min: glm.vec3, box_max: glm.vec3) -> Optional[T
 
     return t_min, normal
 
-def intersect_model(ray: Ray, model: Model) -> Tuple[Optional[glm.ivec3], Optional[glm.vec3], Optional[glm.ivec3]]:
+# Largest rays x boxes block the batch kernel evaluates at once
+KERNEL_BLOCK = 1 << 20
+# Marquee selection casts at most this many rays, in tiles of MARQUEE_TILE^2 rays
+MARQUEE_MAX_RAYS = 1 << 16
+MARQUEE_TILE = 8
+
+def intersect_boxes(origins: np.ndarray, directions: np.ndarray, box_min: np.ndarray, box_max: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # Batch slab test: (R, 3) rays against (B, 3) boxes. Returns per ray the distance
+    # to the nearest box (inf if none), its index (-1 if none) and the (R, 3) normal of
+    # the entry face (zero when the origin is inside the box). Rays x boxes are
+    # evaluated in blocks of KERNEL_BLOCK so memory stays bounded.
+    origins = np.asarray(origins, dtype=np.float64).reshape(-1, 3)
+    directions = np.asarray(directions, dtype=np.float64).reshape(-1, 3)
+    box_min = np.asarray(box_min, dtype=np.float64).reshape(-1, 3)
+    box_max = np.asarray(box_max, dtype=np.float64).reshape(-1, 3)
+    rays = len(origins)
+    best_t = np.full(rays, np.inf)
+    best_index = np.full(rays, -1, dtype=np.int64)
+    best_axis = np.full(rays, -1, dtype=np.int64)
+    # Axis-parallel rays: a tiny direction keeps the slab math finite and puts
+    # origins outside the slab at a huge entry distance
+    d = np.where(np.abs(directions) < 1e-12, 1e-12, directions)
+    inv = (1.0 / d)[:, None, :]
+    o = origins[:, None, :]
+    block = max(1, KERNEL_BLOCK // max(rays, 1))
+    rows = np.arange(rays)
+    for start in range(0, len(box_min), block):
+        t1 = (box_min[None, start:start + block] - o) * inv
+        t2 = (box_max[None, start:start + block] - o) * inv
+        t_lo = np.minimum(t1, t2)
+        t_enter = t_lo.max(axis=2)
+        t_exit = np.maximum(t1, t2).min(axis=2)
+        t_enter[(t_enter > t_exit) | (t_exit < 0)] = np.inf
+        nearest = t_enter.argmin(axis=1)
+        t = t_enter[rows, nearest]
+        closer = t < best_t
+        # Entry face: the axis whose slab was entered last, none if the origin is inside
+        lo = t_lo[rows[closer], nearest[closer]]
+        best_axis[closer] = np.where(t[closer] < 0, -1, lo.argmax(axis=1))
+        best_t[closer] = np.maximum(t[closer], 0.0)
+        best_index[closer] = nearest[closer] + start
+    normals = np.zeros((rays, 3), dtype=np.float32)
+    rows = np.flatnonzero(best_axis >= 0)
+    normals[rows, best_axis[rows]] = -np.sign(directions[rows, best_axis[rows]])
+    return best_t, best_index, normals
+
+def _brick_boxes(positions: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # World-space boxes of bricks: (x, y, z) spans x/y +-0.5 and z..z+1
+    lo = positions.astype(np.float64) - (0.5, 0.5, 0.0)
+    return lo, lo + 1.0
+
+def _layer_positions(model: Model, max_layer: Optional[int]) -> np.ndarray:
+    positions, _ = model.get_arrays()
+    if max_layer is not None:
+        positions = positions[positions[:, 2] <= max_layer]
+    return positions
+
+def _clip_ray_to_box(origin, direction, box_min, box_max) -> Optional[Tuple[float, float, int]]:
+    # Slab test returning (t_enter, t_exit, entry_axis); entry_axis is -1 if the origin is inside
+    t_enter = 0.0
+    t_exit = math.inf
+    axis = -1
+    for i in range(3):
+        o = origin[i]
+        d = direction[i]
+        if abs(d) < 1e-12:
+            if o < box_min[i] or o > box_max[i]:
+                return None
+            continue
+        t1 = (box_min[i] - o) / d
+        t2 = (box_max[i] - o) / d
+        if t1 > t2:
+            t1, t2 = t2, t1
+        if t1 > t_enter:
+            t_enter = t1
+            axis = i
+        t_exit = min(t_exit, t2)
+        if t_enter > t_exit:
+            return None
+    return t_enter, t_exit, axis
+
+def intersect_model(ray: Ray, model: Model, max_layer: Optional[int] = None) -> Tuple[Optional[glm.ivec3], Optional[glm.vec3], Optional[glm.ivec3]]:
     # Returns (intersected_brick_pos, intersection_normal, neighbor_pos)
-    closest_t = 100000.0
-    hit_brick = None
-    hit_normal = None
-    
-    # Optimization: Grid traversal is better, but iterating all bricks is okay for start < 1000 bricks
-    for brick in model.get_all_bricks():
-        # AABB: Brick is at brick.position (integer), size 1x1x1
-        # Renderer shifts bricks by (0, 0, 0.5), so the visual center is at z+0.5.
-        # This means the vertical range is [z, z+1].
-        # X and Y are still centered at integer coordinates: [x-0.5, x+0.5].
-        
-        pos = glm.vec3(brick.position)
-        box_min = pos + glm.vec3(-0.5, -0.5, 0.0)
-        box_max = pos + glm.vec3(0.5, 0.5, 1.0)
-        
-        result = intersect_aabb(ray, box_min, box_max)
-        if result:
-            t, normal = result
-            if t < closest_t:
-                closest_t = t
-                hit_brick = brick
-                hit_normal = normal
-                
-    if hit_brick:
-        # Determine neighbor pos
-        # normal should be mostly axis aligned
-        # e.g. (1, 0, 0) -> neighbor is pos + (1, 0, 0)
-        
-        # Snap normal to grid integer
-        nx, ny, nz = 0, 0, 0
-        if abs(hit_normal.x) > 0.9: nx = int(math.copysign(1, hit_normal.x))
-        if abs(hit_normal.y) > 0.9: ny = int(math.copysign(1, hit_normal.y))
-        if abs(hit_normal.z) > 0.9: nz = int(math.copysign(1, hit_normal.z))
-        
-        neighbor_pos = hit_brick.position + glm.ivec3(nx, ny, nz)
-        
-        return hit_brick.position, hit_normal, neighbor_pos
-        
+    # Amanatides-Woo grid traversal: walk the ray cell by cell through the occupancy
+    # lookup, so the cost depends on the path length through the model, not on brick count.
+    # max_layer ignores bricks above that Z layer (cut away by a section view).
+    bounds = model.bounds()
+    if bounds is None:
+        return None, None, None
+
+    # Grid space: brick (x, y, z) spans [x-0.5, x+0.5] x [y-0.5, y+0.5] x [z, z+1] in world
+    # space (the renderer lifts bricks by 0.5), so shift X/Y by half a cell to get unit cells.
+    origin = (ray.origin.x + 0.5, ray.origin.y + 0.5, ray.origin.z)
+    direction = (ray.direction.x, ray.direction.y, ray.direction.z)
+    box_min = [int(v) for v in bounds[0]]
+    box_max = [int(v) + 1 for v in bounds[1]]
+    if max_layer is not None:
+        box_max[2] = min(box_max[2], max_layer + 1)
+        if box_max[2] <= box_min[2]:
+            return None, None, None
+
+    clip = _clip_ray_to_box(origin, direction, box_min, box_max)
+    if clip is None:
+        return None, None, None
+    t, t_exit, axis = clip
+
+    cell = []
+    step = []
+    t_max = []
+    t_delta = []
+    for i in range(3):
+        o, d = origin[i], direction[i]
+        # Clamp so rounding at the box faces cannot start us outside the box
+        c = min(max(math.floor(o + d * t), box_min[i]), box_max[i] - 1)
+        cell.append(c)
+        if abs(d) < 1e-12:
+            step.append(0)
+            t_max.append(math.inf)
+            t_delta.append(math.inf)
+        else:
+            s = 1 if d > 0 else -1
+            step.append(s)
+            t_max.append(((c + (1 if s > 0 else 0)) - o) / d)
+            t_delta.append(abs(1.0 / d))
+
+    cx, cy, cz = cell
+    sx, sy, sz = step
+    tmx, tmy, tmz = t_max
+    tdx, tdy, tdz = t_delta
+    chunks = model.chunks
+    current_key = None
+    chunk = None
+
+    while True:
+        key = (cx >> CHUNK_SHIFT, cy >> CHUNK_SHIFT, cz >> CHUNK_SHIFT)
+        if key != current_key:
+            current_key = key
+            chunk = chunks.get(key)
+        if chunk is not None and chunk.slots[cx & CHUNK_MASK, cy & CHUNK_MASK, cz & CHUNK_MASK] >= 0:
+            break
+
+        if tmx <= tmy and tmx <= tmz:
+            if tmx > t_exit:
+                return None, None, None
+            cx += sx
+            tmx += tdx
+            axis = 0
+        elif tmy <= tmz:
+            if tmy > t_exit:
+                return None, None, None
+            cy += sy
+            tmy += tdy
+            axis = 1
+        else:
+            if tmz > t_exit:
+                return None, None, None
+            cz += sz
+            tmz += tdz
+            axis = 2
+
+    # The hit face is the one we stepped (or entered the box) through
+    normal_i = [0, 0, 0]
+    if axis >= 0:
+        normal_i[axis] = -step[axis]
+    hit_pos = glm.ivec3(cx, cy, cz)
+    hit_normal = glm.vec3(*normal_i)
+    neighbor_pos = hit_pos + glm.ivec3(*normal_i)
+
+    return hit_pos, hit_normal, neighbor_pos
+
+def pick_placement(ray: Ray, model: Model, max_layer: Optional[int] = None) -> Tuple[Optional[glm.ivec3], Optional[glm.vec3], Optional[glm.ivec3]]:
+    # Like intersect_model, but falls back to the ground grid (Z=0) when no brick is hit.
+    # On the ground the hit position is None and the neighbor is the cell resting on the grid.
+    hit_pos, normal, neighbor = intersect_model(ray, model, max_layer)
+    if neighbor is not None:
+        return hit_pos, normal, neighbor
+
+    # Check ground plane (Z=0) intersection ONLY if looking down
+    if ray.direction.z < -1e-6:
+        t = intersect_plane(ray, glm.vec3(0, 0, 1), glm.vec3(0, 0, 0))
+        if t:
+            hit_point = ray.origin + ray.direction * t
+            # Bricks sit ON the grid: index Z=0 is the layer spanning [0, 1]
+            return None, glm.vec3(0, 0, 1), glm.ivec3(round(hit_point.x), round(hit_point.y), 0)
+
     return None, None, None
+
+def pick_rect(x0: float, y0: float, x1: float, y1: float, width: float, height: float, camera: Camera, model: Model,
+              max_layer: Optional[int] = None, max_rays: int = MARQUEE_MAX_RAYS) -> np.ndarray:
+    # Marquee selection: (K, 3) positions of the bricks visible inside the screen
+    # rectangle. Rays are cast on a pixel grid over the rectangle (coarser if it would
+    # exceed max_rays) and grouped in tiles; each tile is tested with the batch kernel
+    # against only the bricks whose screen footprint overlaps it.
+    x0, x1 = sorted((x0, x1))
+    y0, y1 = sorted((y0, y1))
+    positions = _layer_positions(model, max_layer)
+    if len(positions) == 0:
+        return np.zeros((0, 3), dtype=np.int32)
+
+    # Screen footprint of each brick. The camera is orthographic, so a box maps to its
+    # projected center plus the projected half extents.
+    m = np.array(camera.view_projection_matrix, dtype=np.float64)
+    centers = positions + np.array((0.0, 0.0, 0.5))
+    ndc = centers @ m[:2, :3].T + m[:2, 3]
+    half = np.abs(m[:2, :3]) @ np.full(3, 0.5)
+    scale = np.array((width / 2.0, -height / 2.0))
+    screen = (ndc + (1.0, -1.0)) * scale
+    half_px = half * np.abs(scale)
+    lo, hi = screen - half_px, screen + half_px
+    overlap = (hi[:, 0] >= x0) & (lo[:, 0] <= x1) & (hi[:, 1] >= y0) & (lo[:, 1] <= y1)
+    positions, lo, hi = positions[overlap], lo[overlap], hi[overlap]
+    if len(positions) == 0:
+        return np.zeros((0, 3), dtype=np.int32)
+
+    # Ray grid at pixel centers, spaced so the count stays within max_rays
+    spacing = max(1.0, math.sqrt((x1 - x0 + 1) * (y1 - y0 + 1) / max_rays))
+    xs = np.arange(x0 + 0.5, x1 + 1, spacing)
+    ys = np.arange(y0 + 0.5, y1 + 1, spacing)
+    inv = np.array(camera.inverse_view_projection_matrix, dtype=np.float64)
+    px, py = np.meshgrid(xs, ys, indexing="ij")
+    ndc_xy = np.stack((2.0 * px / width - 1.0, 1.0 - 2.0 * py / height), axis=-1).reshape(-1, 2)
+    near = np.concatenate((ndc_xy, np.full((len(ndc_xy), 1), -1.0), np.ones((len(ndc_xy), 1))), axis=1) @ inv.T
+    far = np.concatenate((ndc_xy, np.ones((len(ndc_xy), 2))), axis=1) @ inv.T
+    origins = near[:, :3] / near[:, 3:]
+    directions = far[:, :3] / far[:, 3:] - origins
+    directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+
+    # Bin bricks into the tiles their footprint overlaps (tiles are in ray-grid units)
+    tile_px = MARQUEE_TILE * spacing
+    tiles_x = (len(xs) + MARQUEE_TILE - 1) // MARQUEE_TILE
+    tiles_y = (len(ys) + MARQUEE_TILE - 1) // MARQUEE_TILE
+    t_lo = np.clip(np.floor((lo - (x0, y0)) / tile_px).astype(np.int64), 0, (tiles_x - 1, tiles_y - 1))
+    t_hi = np.clip(np.floor((hi - (x0, y0)) / tile_px).astype(np.int64), 0, (tiles_x - 1, tiles_y - 1))
+    span = t_hi - t_lo + 1
+    counts = span[:, 0] * span[:, 1]
+    brick = np.repeat(np.arange(len(positions)), counts)
+    k = np.arange(len(brick)) - np.repeat(np.cumsum(counts) - counts, counts)
+    tile = (t_lo[brick, 0] + k // span[brick, 1]) * tiles_y + t_lo[brick, 1] + k % span[brick, 1]
+    order = np.argsort(tile, kind="stable")
+    brick, tile = brick[order], tile[order]
+    starts = np.flatnonzero(np.r_[True, tile[1:] != tile[:-1]])
+    ends = np.r_[starts[1:], len(tile)]
+
+    box_min, box_max = _brick_boxes(positions)
+    ray_tile = ((np.arange(len(xs)) // MARQUEE_TILE)[:, None] * tiles_y + (np.arange(len(ys)) // MARQUEE_TILE)[None, :]).reshape(-1)
+    ray_order = np.argsort(ray_tile, kind="stable")
+    ray_bounds = np.searchsorted(ray_tile[ray_order], np.arange(tiles_x * tiles_y + 1))
+    hits = []
+    for s, e in zip(starts.tolist(), ends.tolist()):
+        t = int(tile[s])
+        rays = ray_order[ray_bounds[t]:ray_bounds[t + 1]]
+        candidates = brick[s:e]
+        _, index, _ = intersect_boxes(origins[rays], directions[rays], box_min[candidates], box_max[candidates])
+        hits.append(candidates[index[index >= 0]])
+    if not hits:
+        return np.zeros((0, 3), dtype=np.int32)
+    return positions[np.unique(np.concatenate(hits))]
@@ -0,0 +1,83 @@
+import struct
+import zlib
+import numpy as np
+from typing import BinaryIO, Optional
+
+# Minimal RGBA8 PNG encoder for exports, so core does not need an imaging library.
+# Rows are filtered and compressed as they arrive and written out in IDAT chunks,
+# so an image never has to be held whole in memory.
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# Compressed bytes collected before an IDAT chunk is written
+IDAT_SIZE = 1 << 16
+# zlib level (its default speed/size trade-off)
+COMPRESSION_LEVEL = 6
+# Row filter 2 ("Up"): difference with the row above, cheap to vectorize and good
+# on the flat colors of rendered bricks
+_FILTER_UP = 2
+
+
+def _chunk(tag: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(data, zlib.crc32(tag)))
+
+
+class PngWriter:
+    # Streams an RGBA8 image to a file top row first: write_rows() any number of
+    # times with (k, width, 4) uint8 strips until `height` rows were given, then close().
+    def __init__(self, file: BinaryIO, width: int, height: int) -> None:
+        self.file = file
+        self.width = width
+        self.height = height
+        self.rows_written = 0
+        self._previous = np.zeros((width, 4), dtype=np.uint8)
+        self._compressor = zlib.compressobj(COMPRESSION_LEVEL)
+        self._pending = []
+        self._pending_size = 0
+        file.write(PNG_SIGNATURE)
+        # 8 bits per channel, color type 6 (RGBA), no interlace
+        file.write(_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)))
+
+    def write_rows(self, rows: np.ndarray) -> None:
+        rows = np.ascontiguousarray(rows, dtype=np.uint8).reshape(-1, self.width, 4)
+        if self.rows_written + len(rows) > self.height:
+            raise ValueError("More rows than the image height")
+        if not len(rows):
+            return
+        above = np.concatenate([self._previous[None], rows[:-1]])
+        filtered = np.empty((len(rows), 1 + self.width * 4), dtype=np.uint8)
+        filtered[:, 0] = _FILTER_UP
+        filtered[:, 1:] = (rows - above).reshape(len(rows), -1)  # uint8 wraps as PNG expects
+        self._previous = rows[-1].copy()
+        self.rows_written += len(rows)
+        self._queue(self._compressor.compress(filtered.tobytes()))
+
+    def _queue(self, data: bytes, flush: bool = False) -> None:
+        if data:
+            self._pending.append(data)
+            self._pending_size += len(data)
+        if self._pending_size >= IDAT_SIZE or (flush and self._pending_size):
+            self.file.write(_chunk(b"IDAT", b"".join(self._pending)))
+            self._pending = []
+            self._pending_size = 0
+
+    def close(self) -> None:
+        if self.rows_written != self.height:
+            raise ValueError(f"Expected {self.height} rows, got {self.rows_written}")
+        self._queue(self._compressor.flush(), flush=True)
+        self.file.write(_chunk(b"IEND", b""))
+
+    def __enter__(self) -> "PngWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+
+
+def write_png(filename: str, image: np.ndarray, rows_per_strip: Optional[int] = 64) -> None:
+    # Write an (height, width, 4) uint8 RGBA image
+    height, width = image.shape[:2]
+    step = rows_per_strip or height
+    with open(filename, "wb") as f, PngWriter(f, width, height) as writer:
+        for y in range(0, height, step):
+            writer.write_rows(image[y:y + step])
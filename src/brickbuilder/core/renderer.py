@@ -2,10 +2,32 @@ import OpenGL.GL as gl
 import glm
 import numpy as np
 import math
+from brickbuilder.core.framebuffer import Framebuffer
+from brickbuilder.core.frustum import boxes_visible
+from brickbuilder.core.lod import MAX_LOD_LEVEL, build_chunk_lod_mesh, choose_level, draws_outlines
+from brickbuilder.core.mesh_buffer import MeshBuffer
 
 class Renderer:
     def __init__(self):
-        pass
+        # Retained mode keeps the brick geometry in GPU buffers, one per model chunk,
+        # and only re-uploads chunks the model's change journal reported as affected.
+        # Immediate mode is the glBegin/glEnd fallback.
+        self.use_buffers = True
+        self.chunk_buffers = {}
+        self._built = set()
+        self._mesh_model = None
+        # Offscreen copy of the grid + bricks, reused while _scene_key is unchanged
+        self.use_scene_cache = True
+        self.scene_cache = Framebuffer()
+        self._scene_key = None
+        self.scene_renders = 0
+        # Chunk AABBs for frustum culling, and what the last scene render culled
+        self._boxes = None
+        self._boxes_state = None
+        self.cull_stats = {"chunks_drawn": 0, "chunks_culled": 0, "bricks_drawn": 0, "bricks_culled": 0}
+        self.lod_level = 0
+        # (selection array, line vertices) for render_selection_set
+        self._selection_lines = None
 
     def initialize(self):
         gl.glClearColor(0.2, 0.2, 0.2, 1.0)
@@ -14,26 +36,68 @@ class Renderer:
         gl.glEnable(gl.GL_LIGHT0)
         gl.glEnable(gl.GL_COLOR_MATERIAL)
         gl.glEnable(gl.GL_NORMALIZE)
+
+        # Buffer objects are core since GL 1.5; fall back if the driver does not expose them.
+        self.use_buffers = self.use_buffers and bool(gl.glGenBuffers)
+        self.release_buffers()
+        self.use_scene_cache = self.use_scene_cache and Framebuffer.is_supported()
+        self.scene_cache = Framebuffer()
+        self._scene_key = None
         
         # Light position (fixed relative to camera if not transformed, or world if transformed? 
         # Light position is transformed by current ModelView when specified.
         # We can set it in render loop to be fixed relative to world/camera.
 
-    def render(self, camera, model, ghost_position, width, height, selected_brick_pos=None, show_grid=True, show_gizmo=True, section_z=None):
-        gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
+    def render(self, camera, model, ghost_position, width, height, selected_brick_pos=None, show_grid=True, show_gizmo=True, section_z=None, target_fbo=0,
+               selection=None, marquee=None):
+        # The grid and bricks only change with the camera, the model or the viewport,
+        # so they are rendered into an offscreen cache and reused. Frames where only
+        # the ghost or selection moved just copy the cache and draw the overlays.
+        scene_key = (self._camera_state(camera), id(model), model.revision, width, height, show_grid, section_z)
+        if self._use_scene_cache(width, height):
+            if scene_key != self._scene_key:
+                self.scene_cache.bind()
+                self._render_scene(camera, model, show_grid, section_z, height)
+                self._scene_key = scene_key
+                self.scene_renders += 1
+            try:
+                self.scene_cache.blit_to(target_fbo)
+            except gl.GLError:
+                # Depth formats did not match the target; stop caching
+                self.use_scene_cache = False
+                self.scene_cache.release()
+                gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, target_fbo)
+                self._render_scene(camera, model, show_grid, section_z, height)
+        else:
+            self._render_scene(camera, model, show_grid, section_z, height)
+            self.scene_renders += 1
 
-        view = camera.get_view_matrix()
-        proj = camera.get_projection_matrix()
+        self._render_overlays(camera, ghost_position, selected_brick_pos, section_z, selection)
+        if marquee is not None:
+            self.render_marquee(marquee, width, height)
 
-        w = camera.scale * camera.aspect_ratio
-        h = camera.scale
-        
+        # Draw Gizmo
+        if show_gizmo:
+            self.draw_orientation_gizmo(camera, width, height)
+
+    def _use_scene_cache(self, width, height):
+        if not self.use_scene_cache:
+            return False
+        if not self.scene_cache.resize(width, height):
+            self.use_scene_cache = False
+            return False
+        return True
+
+    def _camera_state(self, camera):
+        return (id(camera), camera.revision)
+
+    def _setup_camera(self, camera, section_z):
+        # Matrices come from the camera's cache, recomputed only when it moved
         gl.glMatrixMode(gl.GL_PROJECTION)
-        gl.glLoadIdentity()
-        gl.glOrtho(-w/2, w/2, -h/2, h/2, camera.near_plane, camera.far_plane)
+        gl.glLoadTransposeMatrixf(np.array(camera.projection_matrix, dtype=np.float32).flatten())
         
         gl.glMatrixMode(gl.GL_MODELVIEW)
-        gl.glLoadTransposeMatrixf(np.array(view, dtype=np.float32).flatten())
+        gl.glLoadTransposeMatrixf(np.array(camera.view_matrix, dtype=np.float32).flatten())
         
         # Section View (Clipping Plane)
         if section_z is not None:
@@ -51,6 +115,11 @@ class Renderer:
              plane = [0.0, 0.0, -1.0, float(section_z)]
              gl.glClipPlane(gl.GL_CLIP_PLANE0, plane)
              gl.glEnable(gl.GL_CLIP_PLANE0)
+
+    def _render_scene(self, camera, model, show_grid, section_z, height):
+        # Static layer: grid and bricks
+        gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
+        self._setup_camera(camera, section_z)
         
         gl.glDisable(gl.GL_LIGHTING)
         if show_grid:
@@ -60,23 +129,32 @@ class Renderer:
         # Render Bricks
         gl.glPushMatrix()
         gl.glTranslatef(0, 0, 0.5)
+        self.render_bricks(model, camera, section_z, height / camera.scale)
+        gl.glPopMatrix()
         
-        self.render_bricks(model)
+        if section_z is not None:
+            gl.glDisable(gl.GL_CLIP_PLANE0)
+
+    def _render_overlays(self, camera, ghost_position, selected_brick_pos, section_z, selection=None):
+        # Drawn on top of the (possibly cached) scene every frame
+        self._setup_camera(camera, section_z)
+
+        gl.glPushMatrix()
+        gl.glTranslatef(0, 0, 0.5)
         
         if ghost_position:
             self.render_ghost(ghost_position)
             
         if selected_brick_pos:
             self.render_selection(selected_brick_pos)
+
+        if selection is not None and len(selection):
+            self.render_selection_set(selection)
             
         gl.glPopMatrix()
         
         if section_z is not None:
             gl.glDisable(gl.GL_CLIP_PLANE0)
-        
-        # Draw Gizmo
-        if show_gizmo:
-            self.draw_orientation_gizmo(camera, width, height)
 
     def render_selection(self, pos):
         # Draw a wireframe box around the selected brick
@@ -96,6 +174,49 @@ class Renderer:
         gl.glEnable(gl.GL_DEPTH_TEST)
         gl.glEnable(gl.GL_LIGHTING)
 
+    def render_selection_set(self, positions):
+        # Wireframe boxes around many selected bricks, drawn from one line array that
+        # is rebuilt only when the selection array changes
+        if self._selection_lines is None or self._selection_lines[0] is not positions:
+            corners = np.array([(x, y, z) for x in (-0.5, 0.5) for y in (-0.5, 0.5) for z in (-0.5, 0.5)], dtype=np.float32)
+            edges = [(a, b) for a in range(8) for b in range(a + 1, 8) if bin(a ^ b).count("1") == 1]
+            segment = corners[np.array(edges).reshape(-1)]
+            lines = (positions[:, None, :].astype(np.float32) + segment[None, :, :]).reshape(-1, 3)
+            self._selection_lines = (positions, np.ascontiguousarray(lines))
+        lines = self._selection_lines[1]
+
+        gl.glDisable(gl.GL_LIGHTING)
+        gl.glDisable(gl.GL_DEPTH_TEST) # See selection through walls
+        gl.glLineWidth(2.0)
+        gl.glColor3f(1.0, 1.0, 0.0) # Yellow
+        gl.glEnableClientState(gl.GL_VERTEX_ARRAY)
+        gl.glVertexPointer(3, gl.GL_FLOAT, 0, lines)
+        gl.glDrawArrays(gl.GL_LINES, 0, len(lines))
+        gl.glDisableClientState(gl.GL_VERTEX_ARRAY)
+        gl.glLineWidth(1.0)
+        gl.glEnable(gl.GL_DEPTH_TEST)
+        gl.glEnable(gl.GL_LIGHTING)
+
+    def render_marquee(self, rect, width, height):
+        # Selection rectangle in widget pixels (x0, y0, x1, y1), origin top-left
+        x0, y0, x1, y1 = rect
+        gl.glPushAttrib(gl.GL_ENABLE_BIT)
+        gl.glDisable(gl.GL_LIGHTING)
+        gl.glDisable(gl.GL_DEPTH_TEST)
+        gl.glMatrixMode(gl.GL_PROJECTION)
+        gl.glLoadIdentity()
+        gl.glOrtho(0, width, height, 0, -1, 1)
+        gl.glMatrixMode(gl.GL_MODELVIEW)
+        gl.glLoadIdentity()
+        gl.glColor3f(1.0, 1.0, 0.0)
+        gl.glBegin(gl.GL_LINE_LOOP)
+        gl.glVertex2f(x0, y0)
+        gl.glVertex2f(x1, y0)
+        gl.glVertex2f(x1, y1)
+        gl.glVertex2f(x0, y1)
+        gl.glEnd()
+        gl.glPopAttrib()
+
     def draw_orientation_gizmo(self, camera, width, height):
         gizmo_size = 150
         padding = 10
@@ -114,25 +235,8 @@ class Renderer:
         gl.glOrtho(-2, 2, -2, 2, -10, 10)
         
         gl.glMatrixMode(gl.GL_MODELVIEW)
-        # Create a rotation-only view matrix
-        # We can extract rotation from camera view matrix
-        view = camera.get_view_matrix()
-        
-        # In GLM view matrix, the top-left 3x3 is the rotation (if no scaling)
-        # We want to place the camera at some distance looking at 0,0,0
-        # But easier: just load the view rotation.
-        # However, lookAt(eye, target, up) creates translation too.
-        # Let's recreate a matrix with only rotation logic.
-        
-        # Actually simplest: Use the same rotation angles but fixed distance.
-        gizmo_cam_pos = glm.vec3(
-            3.0 * math.cos(camera.pitch) * math.cos(camera.yaw),
-            3.0 * math.cos(camera.pitch) * math.sin(camera.yaw),
-            3.0 * math.sin(camera.pitch)
-        )
-        gizmo_view = glm.lookAt(gizmo_cam_pos, glm.vec3(0,0,0), camera.world_up)
-        
-        gl.glLoadTransposeMatrixf(np.array(gizmo_view, dtype=np.float32).flatten())
+        # Rotation-only view (same angles, fixed distance), cached by the camera
+        gl.glLoadTransposeMatrixf(np.array(camera.gizmo_view_matrix, dtype=np.float32).flatten())
         
         # Draw Axis with Labels
         self.draw_gizmo_axis_with_labels()
@@ -228,15 +332,149 @@ class Renderer:
         gl.glVertex3f(center.x + hs, center.y + hs, center.z)
         gl.glVertex3f(center.x - hs, center.y - hs, center.z)
 
-    def render_bricks(self, model):
+    def render_bricks(self, model, camera=None, section_z=None, pixels_per_unit=None):
+        if self.use_buffers:
+            self._render_bricks_buffered(model, camera, section_z, pixels_per_unit)
+        else:
+            self._render_bricks_immediate(model, section_z)
+
+    def release_buffers(self):
+        for buffer in self.chunk_buffers.values():
+            buffer.release()
+        self.chunk_buffers = {}
+        self._built = set()
+        if self._mesh_model is not None:
+            self._mesh_model.unsubscribe(self._model_changed)
+        self._mesh_model = None
+
+    def _model_changed(self, batch):
+        # Change journal listener: forget the buffers of every chunk the edit can affect
+        if batch.reset:
+            self._built.clear()
+            return
+        for key in map(tuple, batch.affected_chunks().tolist()):
+            for level in range(MAX_LOD_LEVEL + 1):
+                self._built.discard((key, level))
+
+    def _update_brick_buffers(self, model, keys, level=0):
+        # Buffers are keyed by (chunk key, LOD level)
+        if model is not self._mesh_model:
+            self.release_buffers()
+            self._mesh_model = model
+            model.subscribe(self._model_changed)
+
+        for buffer_key in [k for k in self.chunk_buffers if k[0] not in model.chunks]:
+            self.chunk_buffers.pop(buffer_key).release()
+            self._built.discard(buffer_key)
+
+        # Only chunks edited since their last upload are rebuilt; chunks outside
+        # `keys` (culled) keep their old buffer until they come into view
+        for key in keys:
+            chunk = model.chunks[key]
+            buffer_key = (key, level)
+            if buffer_key in self._built:
+                continue
+            buffer = self.chunk_buffers.get(buffer_key)
+            if buffer is None:
+                buffer = MeshBuffer()
+                self.chunk_buffers[buffer_key] = buffer
+            buffer.upload(build_chunk_lod_mesh(model, chunk, level))
+            self._built.add(buffer_key)
+
+    def _chunk_boxes(self, model):
+        # World-space AABBs of every chunk's bricks, rebuilt when the model changes
+        state = (id(model), model.revision)
+        if self._boxes_state != state:
+            keys = []
+            lo = np.zeros((len(model.chunks), 3))
+            hi = np.zeros((len(model.chunks), 3))
+            counts = np.zeros(len(model.chunks), dtype=np.int64)
+            for i, (key, chunk) in enumerate(model.chunks.items()):
+                b = chunk.bounds()
+                keys.append(key)
+                # Brick (x, y, z) spans x +-0.5, y +-0.5 and z..z+1
+                lo[i] = b[0] - (0.5, 0.5, 0.0)
+                hi[i] = b[1] + (0.5, 0.5, 1.0)
+                counts[i] = chunk.count
+            self._boxes = (keys, lo, hi, counts)
+            self._boxes_state = state
+        return self._boxes
+
+    def _visible_chunks(self, model, camera, section_z):
+        keys, lo, hi, counts = self._chunk_boxes(model)
+        if camera is None:
+            return keys
+        visible = boxes_visible(camera.frustum_planes, lo, hi)
+        if section_z is not None:
+            # Chunks entirely above the cut would be clipped away anyway
+            visible &= lo[:, 2] <= section_z
+        drawn = int(counts[visible].sum())
+        self.cull_stats = {
+            "chunks_drawn": int(visible.sum()),
+            "chunks_culled": int(len(keys) - visible.sum()),
+            "bricks_drawn": drawn,
+            "bricks_culled": int(counts.sum()) - drawn,
+        }
+        return [keys[i] for i in np.flatnonzero(visible)]
+
+    def _render_bricks_buffered(self, model, camera=None, section_z=None, pixels_per_unit=None):
+        keys = self._visible_chunks(model, camera, section_z)
+        # Zoomed out, a brick is smaller than a pixel: draw coarser voxel mips and
+        # leave out outlines that would only turn the surface black
+        level = 0
+        outlines = True
+        if pixels_per_unit is not None:
+            level = choose_level(pixels_per_unit)
+            outlines = draws_outlines(pixels_per_unit, level)
+        self.lod_level = level
+        self._update_brick_buffers(model, keys, level)
+        buffers = [self.chunk_buffers[(key, level)] for key in keys]
+
+        # Buffers are sorted by layer, so a section view draws an index prefix up to
+        # the last layer below the cut (the clip plane still trims taller side faces)
+        # plus the caps that close that layer's cut surface
+        max_layer = None
+        cap_layer = None
+        if section_z is not None:
+            max_layer = math.ceil(section_z) - 1
+            if section_z == max_layer + 1:
+                cap_layer = max_layer
+
+        # Same two passes as immediate mode, but one draw call per chunk and pass.
+        gl.glEnable(gl.GL_POLYGON_OFFSET_FILL)
+        gl.glPolygonOffset(1.0, 1.0)
+        for buffer in buffers:
+            buffer.draw_faces(max_layer)
+            if cap_layer is not None:
+                buffer.draw_caps(cap_layer)
+        gl.glDisable(gl.GL_POLYGON_OFFSET_FILL)
+
+        if not outlines:
+            return
+        gl.glDisable(gl.GL_LIGHTING)
+        gl.glLineWidth(2.0)
+        gl.glColor3f(0.0, 0.0, 0.0)
+        for buffer in buffers:
+            buffer.draw_edges(max_layer)
+            if cap_layer is not None:
+                buffer.draw_cap_edges(cap_layer)
+        gl.glLineWidth(1.0)
+        gl.glEnable(gl.GL_LIGHTING)
+
+    def _render_bricks_immediate(self, model, section_z=None):
         # Draw outlines first or last? 
         # Trick: Draw filled polys with offset (pushes them back), then lines (at normal depth).
-        
+        bricks = list(model.get_all_bricks())
+        if section_z is not None:
+            # Same cut as the buffered path: layers up to ceil(section_z) - 1
+            max_layer = math.ceil(section_z) - 1
+            bricks = [brick for brick in bricks if brick.position.z <= max_layer]
+
         gl.glEnable(gl.GL_POLYGON_OFFSET_FILL)
         gl.glPolygonOffset(1.0, 1.0)
         
         gl.glBegin(gl.GL_QUADS)
-        for brick in model.get_all_bricks():
+        for brick in bricks:
             pos = brick.position
             gl.glColor3f(brick.color.x, brick.color.y, brick.color.z)
             self.draw_cube(pos.x, pos.y, pos.z)
@@ -250,7 +488,7 @@ class Renderer:
         gl.glLineWidth(2.0)
         gl.glBegin(gl.GL_QUADS)
         gl.glColor3f(0.0, 0.0, 0.0)
-        for brick in model.get_all_bricks():
+        for brick in bricks:
             pos = brick.position
             self.draw_cube(pos.x, pos.y, pos.z)
         gl.glEnd()
@@ -0,0 +1,262 @@
+import math
+import numpy as np
+from typing import Dict, Optional, Tuple
+from brickbuilder.core.frustum import boxes_visible, frustum_planes
+from brickbuilder.core.lod import build_chunk_lod_mesh, choose_level, draws_outlines
+
+# Headless counterpart of Renderer: rasterizes the same chunk meshes with NumPy,
+# without Qt or OpenGL, for thumbnails and snapshots on machines with no display.
+
+# Renderer.initialize clear color
+BACKGROUND = (0.2, 0.2, 0.2, 1.0)
+# Fixed-function lighting as set up by Renderer: the default GL_LIGHT0 shines along
+# the view direction, plus the default global ambient, with glColor as material
+AMBIENT = 0.2
+# Outlines are drawn 2 pixels wide, like glLineWidth(2.0)
+LINE_WIDTH = 2
+# Upper bound on (quad, pixel) candidates rasterized per batch
+FRAGMENT_BATCH = 1 << 22
+# With a highlighted layer, everything else keeps this much of its color and
+# takes the rest from the background
+DIM_WEIGHT = 0.35
+
+# Pixel window (x, y, width, height) of the full image, y down from the top row
+Window = Tuple[int, int, int, int]
+
+
+def _project(points: np.ndarray, view_projection: np.ndarray, width: int, height: int) -> np.ndarray:
+    # World (N, 3) -> (N, 3) of pixel x, pixel y (row 0 at the top) and window depth 0..1
+    clip = points @ view_projection[:, :3].T + view_projection[:, 3]
+    ndc = clip[:, :3] / clip[:, 3:]
+    return np.stack(((ndc[:, 0] + 1.0) * 0.5 * width, (1.0 - ndc[:, 1]) * 0.5 * height, (ndc[:, 2] + 1.0) * 0.5), axis=1)
+
+
+def _expand(lo: np.ndarray, hi: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # For (N, 2) inclusive integer pixel boxes, the owner index and x/y of every pixel
+    span = np.maximum(hi - lo + 1, 0)
+    counts = span[:, 0] * span[:, 1]
+    owner = np.repeat(np.arange(len(lo)), counts)
+    k = np.arange(len(owner)) - np.repeat(np.cumsum(counts) - counts, counts)
+    x = lo[owner, 0] + k % span[owner, 0]
+    y = lo[owner, 1] + k // span[owner, 0]
+    return owner, x, y
+
+
+def _batches(counts: np.ndarray):
+    # Consecutive index ranges whose summed counts stay near FRAGMENT_BATCH
+    total = np.cumsum(counts)
+    start = 0
+    while start < len(counts):
+        base = total[start - 1] if start else 0
+        end = int(np.searchsorted(total, base + FRAGMENT_BATCH, side="right"))
+        end = max(end, start + 1)
+        yield start, end
+        start = end
+
+
+def _resolve(pixel: np.ndarray, depth: np.ndarray, zbuffer: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # Nearest fragment per pixel that also passes the depth test; returns fragment indices and pixels
+    if not len(pixel):
+        return pixel, pixel
+    order = np.lexsort((depth, pixel))
+    first = np.r_[True, pixel[order][1:] != pixel[order][:-1]]
+    nearest = order[first]
+    passed = depth[nearest] < zbuffer[pixel[nearest]]
+    return nearest[passed], pixel[nearest[passed]]
+
+
+def _rasterize_quads(corners: np.ndarray, colors: np.ndarray, color_buffer: np.ndarray, zbuffer: np.ndarray,
+                     window: Window, layer_z: Optional[np.ndarray] = None,
+                     highlight: Optional[int] = None, dimmed: Optional[np.ndarray] = None) -> None:
+    # corners: (Q, 4, 3) projected quads (parallelograms under orthographic projection)
+    # in rect_corners order, so corner 1 - corner 0 and corner 3 - corner 0 span the quad.
+    # Only pixels inside the window are drawn; the buffers cover just the window.
+    # With a highlight layer, layer_z holds (Q, 4) world heights half a cell inside the
+    # brick behind each corner; fragments whose layer differs take the dimmed color.
+    origin = corners[:, 0]
+    e1 = corners[:, 1] - origin
+    e2 = corners[:, 3] - origin
+    det = e1[:, 0] * e2[:, 1] - e1[:, 1] * e2[:, 0]
+    keep = np.abs(det) > 1e-9  # edge-on quads cover no pixel centers
+    corners, colors, origin, e1, e2, det = corners[keep], colors[keep], origin[keep], e1[keep], e2[keep], det[keep]
+    if not len(corners):
+        return
+    if highlight is not None:
+        layer_z, dimmed = layer_z[keep], dimmed[keep]
+        z1 = layer_z[:, 1] - layer_z[:, 0]
+        z2 = layer_z[:, 3] - layer_z[:, 0]
+    # Pixel centers (i + 0.5) inside each quad's screen box, clipped to the window
+    x0, y0, width, height = window
+    lo = np.maximum(np.ceil(corners[:, :, :2].min(axis=1) - 0.5), (x0, y0)).astype(np.int64)
+    hi = np.minimum(np.floor(corners[:, :, :2].max(axis=1) - 0.5), (x0 + width - 1, y0 + height - 1)).astype(np.int64)
+    counts = np.maximum(hi - lo + 1, 0).prod(axis=1)
+    for start, end in _batches(counts):
+        owner, x, y = _expand(lo[start:end], hi[start:end])
+        owner += start
+        # Solve p = origin + a * e1 + b * e2 for the pixel center
+        px = x + 0.5 - origin[owner, 0]
+        py = y + 0.5 - origin[owner, 1]
+        inv = 1.0 / det[owner]
+        a = (px * e2[owner, 1] - py * e2[owner, 0]) * inv
+        b = (py * e1[owner, 0] - px * e1[owner, 1]) * inv
+        inside = (a >= 0) & (a < 1) & (b >= 0) & (b < 1)
+        owner, x, y, a, b = owner[inside], x[inside], y[inside], a[inside], b[inside]
+        depth = origin[owner, 2] + a * e1[owner, 2] + b * e2[owner, 2]
+        fragment, pixel = _resolve((y - y0) * width + (x - x0), depth, zbuffer)
+        zbuffer[pixel] = depth[fragment]
+        quad = owner[fragment]
+        if highlight is None:
+            color_buffer[pixel] = colors[quad]
+            continue
+        a, b = a[fragment], b[fragment]
+        layer = np.floor(layer_z[quad, 0] + a * z1[quad] + b * z2[quad])
+        color_buffer[pixel] = np.where((layer == highlight)[:, None], colors[quad], dimmed[quad])
+
+
+def _rasterize_lines(start: np.ndarray, end: np.ndarray, color_buffer: np.ndarray, zbuffer: np.ndarray,
+                     drawn: np.ndarray, window: Window, bias: float,
+                     heights: Optional[np.ndarray] = None, highlight: Optional[int] = None,
+                     dimmed: Optional[np.ndarray] = None) -> None:
+    # Black outlines: points every half pixel along each projected segment, splatted
+    # LINE_WIDTH pixels wide and depth tested with a bias in place of polygon offset.
+    # With a highlight layer, heights holds (S, 2) world z of the segment ends and
+    # points outside that layer are drawn in the dimmed color.
+    x0, y0, width, height = window
+    length = np.abs(end[:, :2] - start[:, :2]).max(axis=1)
+    steps = np.ceil(length * 2).astype(np.int64) + 1
+    for first, last in _batches(steps * LINE_WIDTH * LINE_WIDTH):
+        n = steps[first:last]
+        owner = np.repeat(np.arange(first, last), n)
+        k = np.arange(len(owner)) - np.repeat(np.cumsum(n) - n, n)
+        t = (k / np.maximum(steps[owner] - 1, 1))[:, None]
+        points = start[owner] + (end[owner] - start[owner]) * t
+        base = np.floor(points[:, :2] - LINE_WIDTH / 2.0 + 0.5).astype(np.int64)
+        color = np.zeros((len(points), 3), dtype=np.float32)
+        if highlight is not None:
+            z = heights[owner, 0] + (heights[owner, 1] - heights[owner, 0]) * t[:, 0]
+            # A point at height h lies on the brick below it (tops belong to their layer)
+            color[np.ceil(z - 1e-6) - 1 != highlight] = dimmed
+        for dx in range(LINE_WIDTH):
+            for dy in range(LINE_WIDTH):
+                x = base[:, 0] + dx - x0
+                y = base[:, 1] + dy - y0
+                ok = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+                pixel = y[ok] * width + x[ok]
+                visible = points[ok, 2] <= zbuffer[pixel] + bias
+                color_buffer[pixel[visible]] = color[ok][visible]
+                drawn[pixel[visible]] = True
+
+
+def render_model(model, camera, width: int, height: int, background=BACKGROUND,
+                 outlines: Optional[bool] = None, section_z: Optional[float] = None,
+                 highlight_layer: Optional[int] = None, meshes: Optional[Dict] = None,
+                 window: Optional[Window] = None) -> Tuple[np.ndarray, np.ndarray]:
+    # Render the model as the viewport would (without grid and gizmo) and return an
+    # (height, width, 4) uint8 RGBA image and an (height, width) float32 window depth
+    # buffer (1.0 where nothing was drawn). The camera's aspect ratio should match
+    # width / height. Outlines follow the viewport's zoom rule unless forced.
+    # section_z cuts the model like the viewport's section view; highlight_layer dims
+    # every other layer towards the background. `meshes` is an optional cache of
+    # chunk meshes by (chunk key, level) for repeated renders of an unchanged model.
+    # With a window, only that part of the width x height image is rendered and
+    # returned; it is pixel-identical to the same part of a full render.
+    if window is None:
+        window = (0, 0, width, height)
+    x0, y0, window_width, window_height = window
+    view_projection = np.array(camera.view_projection_matrix, dtype=np.float64)
+    color_buffer = np.empty((window_width * window_height, 3), dtype=np.float32)
+    color_buffer[:] = background[:3]
+    zbuffer = np.ones(window_width * window_height, dtype=np.float64)
+    drawn = np.zeros(window_width * window_height, dtype=bool)
+
+    pixels_per_unit = height / camera.scale
+    level = choose_level(pixels_per_unit)
+    if outlines is None:
+        outlines = draws_outlines(pixels_per_unit, level)
+    chunks = list(model.chunks.values())
+    if chunks:
+        # Frustum-cull chunks like Renderer._visible_chunks, against the window's
+        # sub-frustum widened by the outline width (outlines just outside a chunk's
+        # box can still reach into the window)
+        margin = LINE_WIDTH
+        projection = camera.window_projection(x0 - margin, y0 - margin, x0 + window_width + margin,
+                                              y0 + window_height + margin, width, height)
+        bounds = [chunk.bounds() for chunk in chunks]
+        lo = np.array([b[0] for b in bounds], dtype=np.float64) - (0.5, 0.5, 0.0)
+        hi = np.array([b[1] for b in bounds], dtype=np.float64) + (0.5, 0.5, 1.0)
+        visible = boxes_visible(frustum_planes(projection * camera.view_matrix), lo, hi)
+        if section_z is not None:
+            visible &= lo[:, 2] <= section_z
+        chunks = [chunks[i] for i in np.flatnonzero(visible)]
+
+    # Same index ranges as Renderer._render_bricks_buffered: faces and outlines up to
+    # the last layer below the cut, plus the caps closing that layer's cut surface
+    max_layer = cap_layer = None
+    if section_z is not None:
+        max_layer = math.ceil(section_z) - 1
+        if section_z == max_layer + 1:
+            cap_layer = max_layer
+    light = -np.array(camera.forward, dtype=np.float64)
+    quads, normals, colors, segments = [], [], [], []
+    for chunk in chunks:
+        key = (chunk.key, level)
+        mesh = meshes.get(key) if meshes is not None else None
+        if mesh is None:
+            mesh = build_chunk_lod_mesh(model, chunk, level)
+            if meshes is not None:
+                meshes[key] = mesh
+        face_count = len(mesh.face_layers)
+        line_count = len(mesh.line_layers)
+        selected = np.arange(face_count)
+        if max_layer is not None:
+            selected = selected[:int(np.searchsorted(mesh.face_layers, max_layer, side="right"))]
+            line_count = int(np.searchsorted(mesh.line_layers, max_layer, side="right"))
+        if cap_layer is not None:
+            first, last = np.searchsorted(mesh.cap_layers, (cap_layer, cap_layer + 1))
+            selected = np.r_[selected, np.arange(face_count + first, face_count + last)]
+        line_vertex_count = 2 * (len(mesh.line_layers) + len(mesh.cap_line_layers))
+        quad_vertices = mesh.vertices[:len(mesh.vertices) - line_vertex_count].reshape(-1, 4, 3)[selected]
+        quad_normals = mesh.normals[selected * 4].astype(np.float64)
+        facing = quad_normals @ light
+        front = facing > 0
+        quads.append(quad_vertices[front])
+        normals.append(quad_normals[front])
+        shade = AMBIENT + facing[front]
+        colors.append(np.clip(mesh.colors[selected * 4][front] * shade[:, None], 0.0, 1.0))
+        segments.append(mesh.vertices[mesh.lines[:2 * line_count]].reshape(-1, 2, 3))
+        if cap_layer is not None:
+            first, last = np.searchsorted(mesh.cap_line_layers, (cap_layer, cap_layer + 1)) + len(mesh.line_layers)
+            segments.append(mesh.vertices[mesh.lines[2 * first:2 * last]].reshape(-1, 2, 3))
+
+    if quads and sum(len(q) for q in quads):
+        # Bricks are drawn lifted by half a cell (glTranslatef(0, 0, 0.5)). The cut
+        # trims side faces reaching above it, like the renderer's clip plane.
+        corners = np.concatenate(quads).astype(np.float64).reshape(-1, 3) + (0.0, 0.0, 0.5)
+        if section_z is not None:
+            np.minimum(corners[:, 2], section_z, out=corners[:, 2])
+        quad_colors = np.concatenate(colors)
+        layer_z = dimmed = None
+        if highlight_layer is not None:
+            # Half a cell inward from tops and bottoms lands in the face's own brick
+            layer_z = corners[:, 2].reshape(-1, 4) - 0.5 * np.concatenate(normals)[:, 2:]
+            dimmed = quad_colors * DIM_WEIGHT + np.array(background[:3], np.float32) * (1 - DIM_WEIGHT)
+        projected = _project(corners, view_projection, width, height).reshape(-1, 4, 3)
+        _rasterize_quads(projected, quad_colors, color_buffer, zbuffer, window, layer_z, highlight_layer, dimmed)
+        drawn = zbuffer < 1.0
+        if outlines:
+            lines = np.concatenate(segments).astype(np.float64).reshape(-1, 3) + (0.0, 0.0, 0.5)
+            if section_z is not None:
+                np.minimum(lines[:, 2], section_z, out=lines[:, 2])
+            heights = lines[:, 2].reshape(-1, 2)
+            dimmed = np.array(background[:3], np.float32) * (1 - DIM_WEIGHT)
+            lines = _project(lines, view_projection, width, height).reshape(-1, 2, 3)
+            # Depth of about two bricks' worth of slope over one pixel, in window units
+            bias = 2.0 * camera.scale / height / (camera.far_plane - camera.near_plane)
+            _rasterize_lines(lines[:, 0], lines[:, 1], color_buffer, zbuffer, drawn, window, bias,
+                             heights, highlight_layer, dimmed)
+
+    shape = (window_height, window_width)
+    rgba = np.empty(shape + (4,), dtype=np.uint8)
+    rgba[..., :3] = np.round(color_buffer.reshape(shape + (3,)) * 255).astype(np.uint8)
+    rgba[..., 3] = np.where(drawn.reshape(shape), 255, int(round(background[3] * 255)))
+    return rgba, zbuffer.reshape(shape).astype(np.float32)
@@ -0,0 +1,120 @@
+import threading
+from typing import Any, Callable
+from PySide6.QtCore import QObject, QRunnable, Signal
+from brickbuilder.core import image_export, instructions, mesh_export
+from brickbuilder.core.camera import Camera
+from brickbuilder.core.model import Model
+
+
+class Cancelled(Exception):
+    pass
+
+
+class FileTaskSignals(QObject):
+    # Emitted from the worker thread; slots on GUI objects receive them queued
+    progress = Signal(int)
+    finished = Signal(object)
+    failed = Signal(str)
+    cancelled = Signal()
+
+
+class FileTask(QRunnable):
+    # Runs job(progress) on a QThreadPool thread. The job reports through the
+    # progress callback, which is also where a requested cancellation is raised.
+    def __init__(self, job: Callable[[Callable[[int, int], None]], Any]) -> None:
+        super().__init__()
+        self.setAutoDelete(False)
+        self.job = job
+        self.signals = FileTaskSignals()
+        self._cancel = threading.Event()
+        self._percent = -1
+
+    def cancel(self) -> None:
+        self._cancel.set()
+
+    @property
+    def is_cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def _progress(self, done: int, total: int) -> None:
+        if self._cancel.is_set():
+            raise Cancelled()
+        percent = min(100, done * 100 // total) if total else 100
+        # Only cross threads when the visible value changes
+        if percent != self._percent:
+            self._percent = percent
+            self.signals.progress.emit(percent)
+
+    def run(self) -> None:
+        try:
+            result = self.job(self._progress)
+        except Cancelled:
+            self.signals.cancelled.emit()
+            return
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+            return
+        self.signals.finished.emit(result)
+
+
+def load_task(filename: str) -> FileTask:
+    # Loads into a fresh Model; the GUI thread swaps it in when finished
+    def job(progress):
+        model = Model()
+        model.load_from_file(filename, progress)
+        return model
+    return FileTask(job)
+
+
+def save_task(model: Model, filename: str) -> FileTask:
+    # Saves a snapshot taken now, so the model can keep being edited meanwhile.
+    # The result is the revision that was written.
+    snapshot = model.snapshot()
+
+    def job(progress):
+        snapshot.save_to_file(filename, progress)
+        return snapshot.revision
+    return FileTask(job)
+
+
+def export_layers_task(model: Model, camera, directory: str) -> FileTask:
+    # Build-instruction pages for a snapshot, viewed from the camera's current angle.
+    # The result is the list of files written.
+    snapshot = model.snapshot()
+    view = Camera()
+    view.yaw, view.pitch = camera.yaw, camera.pitch
+
+    def job(progress):
+        return instructions.export_layers(snapshot, directory, view, progress=progress)
+    return FileTask(job)
+
+
+def export_image_task(model: Model, camera, filename: str, width: int, height: int, section_z=None) -> FileTask:
+    # Tiled PNG of the current view, rendered from a snapshot and a copy of the camera
+    snapshot = model.snapshot()
+    view = camera.copy()
+
+    def job(progress):
+        image_export.export_png(snapshot, view, filename, width, height, section_z, progress=progress)
+        return filename
+    return FileTask(job)
+
+
+def export_svg_task(model: Model, camera, filename: str, width: int, height: int, section_z=None) -> FileTask:
+    # SVG of the current view, from a snapshot and a copy of the camera
+    snapshot = model.snapshot()
+    view = camera.copy()
+
+    def job(progress):
+        image_export.export_svg(snapshot, view, filename, width, height, section_z, progress=progress)
+        return filename
+    return FileTask(job)
+
+
+def export_mesh_task(model: Model, filename: str) -> FileTask:
+    # STL or OBJ (by extension) of a snapshot; the result is the face count
+    snapshot = model.snapshot()
+
+    def job(progress):
+        return mesh_export.export_mesh(snapshot, filename, progress=progress)
+    return FileTask(job)
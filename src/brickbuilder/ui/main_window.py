@@ -1,9 +1,17 @@
-from PySide6.QtWidgets import QMainWindow, QMenuBar, QMenu, QFileDialog, QMessageBox, QToolBar, QDockWidget, QWidget, QVBoxLayout, QPushButton, QGridLayout, QLabel, QDialog, QButtonGroup
+from PySide6.QtWidgets import QMainWindow, QMenuBar, QMenu, QFileDialog, QMessageBox, QToolBar, QDockWidget, QWidget, QVBoxLayout, QPushButton, QGridLayout, QLabel, QDialog, QButtonGroup, QColorDialog, QProgressDialog, QInputDialog
 from PySide6.QtGui import QAction, QKeySequence, QIcon, QColor
-from PySide6.QtCore import Qt, QSize
+from PySide6.QtCore import Qt, QSize, QThreadPool
+from typing import Callable, Optional
+import glm
+from brickbuilder.ui import file_io
 from brickbuilder.ui.viewport import Viewport
 from brickbuilder.core.tools import Tool
-from brickbuilder.core.colors import COLORS, DEFAULT_COLOR
+from brickbuilder.core.colors import DEFAULT_COLOR
+
+MODEL_FILTERS = "BrickBuilder Models (*.bbm *.json);;Binary Model (*.bbm);;JSON Files (*.json)"
+# Image export: default width as a multiple of the viewport's, and the largest allowed
+IMAGE_EXPORT_SCALE = 4
+IMAGE_EXPORT_MAX_SIZE = 32768
 
 class MainWindow(QMainWindow):
     def __init__(self) -> None:
@@ -13,6 +21,11 @@ class MainWindow(QMainWindow):
 
         self.viewport = Viewport()
         self.setCentralWidget(self.viewport)
+
+        # Background load/save in progress, if any
+        self.file_task: Optional[file_io.FileTask] = None
+        self.progress_dialog: Optional[QProgressDialog] = None
+        self._on_saved: Optional[Callable[[], None]] = None
         
         self.create_menus()
         self.create_toolbar()
@@ -39,8 +52,35 @@ class MainWindow(QMainWindow):
         # Save
         save_action = QAction("Save As...", self)
         save_action.setShortcut(QKeySequence.Save)
-        save_action.triggered.connect(self.save_file)
+        save_action.triggered.connect(lambda: self.save_file())
         file_menu.addAction(save_action)
+
+        # Export
+        export_menu = file_menu.addMenu("Export")
+        image_action = QAction("Image...", self)
+        image_action.triggered.connect(self.export_image)
+        export_menu.addAction(image_action)
+        svg_action = QAction("Vector Image (SVG)...", self)
+        svg_action.triggered.connect(self.export_svg)
+        export_menu.addAction(svg_action)
+        mesh_action = QAction("Mesh (STL/OBJ)...", self)
+        mesh_action.triggered.connect(self.export_mesh)
+        export_menu.addAction(mesh_action)
+        instructions_action = QAction("Layer Instructions...", self)
+        instructions_action.triggered.connect(self.export_instructions)
+        export_menu.addAction(instructions_action)
+        
+        # Edit Menu
+        edit_menu = menu_bar.addMenu("Edit")
+        undo_action = QAction("Undo", self)
+        undo_action.setShortcut(QKeySequence.Undo)
+        undo_action.triggered.connect(self.viewport.undo)
+        edit_menu.addAction(undo_action)
+
+        redo_action = QAction("Redo", self)
+        redo_action.setShortcuts([QKeySequence.Redo, QKeySequence("Ctrl+Y")])
+        redo_action.triggered.connect(self.viewport.redo)
+        edit_menu.addAction(redo_action)
         
         # Help Menu
         help_menu = menu_bar.addMenu("Help")
@@ -101,17 +141,39 @@ class MainWindow(QMainWindow):
         widget = QWidget()
         # Set dark background for the container to act as the "inner border" color when using padding+clip
         widget.setStyleSheet("background-color: #222222;") 
-        layout = QGridLayout(widget)
-        
-        row = 0
-        col = 0
-        cols_per_row = 2
+        self.color_layout = QGridLayout(widget)
         
         self.color_buttons = {}
+        self.add_color_button = None
         self.color_group = QButtonGroup(self)
         self.color_group.setExclusive(True)
         
-        for name, color in COLORS.items():
+        self.populate_color_buttons()
+        dock.setWidget(widget)
+        self.addDockWidget(Qt.DockWidgetArea.RightDockWidgetArea, dock)
+        
+        # Select default
+        self.set_active_color(self.viewport.model.palette.index_of(DEFAULT_COLOR))
+
+    def populate_color_buttons(self):
+        # One button per palette entry (standard colors first, then custom ones)
+        layout = self.color_layout
+        for btn in self.color_buttons.values():
+            self.color_group.removeButton(btn)
+            layout.removeWidget(btn)
+            btn.deleteLater()
+        if self.add_color_button is not None:
+            layout.removeWidget(self.add_color_button)
+            self.add_color_button.deleteLater()
+        self.color_buttons = {}
+        
+        row = 0
+        col = 0
+        cols_per_row = 2
+        palette = self.viewport.model.palette
+        
+        for index in range(len(palette)):
+            color = palette.color(index)
             btn = QPushButton()
             btn.setFixedSize(40, 40)
             btn.setCheckable(True)
@@ -137,35 +199,57 @@ class MainWindow(QMainWindow):
                 }}
             """
             btn.setStyleSheet(style)
-            btn.setToolTip(name)
+            btn.setToolTip(palette.name(index))
             
             # Connect click to set active color
-            btn.clicked.connect(lambda _, c=color: self.set_active_color(c))
+            btn.clicked.connect(lambda _, i=index: self.set_active_color(i))
             
             self.color_group.addButton(btn)
-            self.color_buttons[tuple(color)] = btn
+            self.color_buttons[index] = btn
             
             layout.addWidget(btn, row, col)
             col += 1
             if col >= cols_per_row:
                 col = 0
                 row += 1
+        
+        # Custom colors are added to the palette of the current model
+        add_btn = QPushButton("+")
+        add_btn.setFixedSize(40, 40)
+        add_btn.setStyleSheet("QPushButton { color: white; border: 1px solid #666666; font-size: 18px; }")
+        add_btn.setToolTip("Add custom color...")
+        add_btn.clicked.connect(self.add_custom_color)
+        layout.addWidget(add_btn, row, col)
+        self.add_color_button = add_btn
                 
         layout.setRowStretch(row + 1, 1) # Push to top
-        dock.setWidget(widget)
-        self.addDockWidget(Qt.DockWidgetArea.RightDockWidgetArea, dock)
-        
-        # Select default
-        self.set_active_color(DEFAULT_COLOR)
 
-    def set_active_color(self, color):
-        self.viewport.set_current_color(color)
+    def add_custom_color(self):
+        current = self.viewport.model.palette.color(self.viewport.current_color_index)
+        initial = QColor.fromRgbF(current.x, current.y, current.z)
+        color = QColorDialog.getColor(initial, self, "Add Custom Color")
+        if not color.isValid():
+            return
+        index = self.viewport.model.palette.add_custom(glm.vec3(color.redF(), color.greenF(), color.blueF()))
+        self.populate_color_buttons()
+        self.set_active_color(index)
+
+    def set_active_color(self, color_index: int):
+        self.viewport.set_current_color(color_index)
         
         # QButtonGroup handles the exclusivity and checking state visually via stylesheet
         # We just need to ensure the correct button is checked if set programmatically
-        c_tuple = tuple(color)
-        if c_tuple in self.color_buttons:
-            self.color_buttons[c_tuple].setChecked(True)
+        if color_index in self.color_buttons:
+            self.color_buttons[color_index].setChecked(True)
+
+    def refresh_palette(self):
+        # The loaded model brings its own palette; keep the active color if it still exists
+        palette = self.viewport.model.palette
+        color = self.viewport.current_color_index
+        if not palette.is_valid(color):
+            color = palette.index_of(DEFAULT_COLOR)
+        self.populate_color_buttons()
+        self.set_active_color(color)
 
     def show_help(self):
         d = QDialog(self)
@@ -177,12 +261,20 @@ class MainWindow(QMainWindow):
         - Orbit: Middle Mouse (or Alt + Left)<br>
         - Pan: Shift + Middle Mouse (or Shift + Alt + Left)<br>
         - Zoom: Scroll Wheel<br>
+        - Section view: Page Down / Page Up<br>
+        <br>
+        <b>Edit:</b><br>
+        - Undo: Ctrl + Z<br>
+        - Redo: Ctrl + Y (or Ctrl + Shift + Z)<br>
         <br>
         <b>Tools:</b><br>
         - Place (Q): Left Click to place brick.<br>
           (Ctrl + Left Click removes in Place mode)<br>
-        - Select (W): Click to select brick.<br>
+        - Select (W): Click to select brick, drag to select the visible bricks in a rectangle.<br>
+          (Shift adds to the selection, Delete removes the selected bricks)<br>
         - Paint (E): Click to color brick.<br>
+          (Shift + Click fills connected bricks of the same color,<br>
+          Ctrl + Shift + Click only those on the surface)<br>
         - Erase (R): Click to remove brick.<br>
         """
         
@@ -195,7 +287,9 @@ class MainWindow(QMainWindow):
         
         d.exec()
 
-    def check_unsaved_changes(self) -> bool:
+    def check_unsaved_changes(self, proceed: Callable[[], None]) -> None:
+        # Calls proceed() once it is safe to drop the current model. Saving runs in
+        # the background, so "Save" continues only after the save has finished.
         if self.viewport.model.modified:
             msg = QMessageBox()
             msg.setIcon(QMessageBox.Warning)
@@ -206,35 +300,174 @@ class MainWindow(QMainWindow):
             ret = msg.exec()
             
             if ret == QMessageBox.Save:
-                return self.save_file()
-            elif ret == QMessageBox.Cancel:
-                return False
-        return True
+                self.save_file(on_saved=proceed)
+            elif ret == QMessageBox.Discard:
+                proceed()
+            return
+        proceed()
 
     def new_file(self) -> None:
-        if self.check_unsaved_changes():
-            self.viewport.reset_scene()
-            self.viewport.model.modified = False
+        if self.file_task is None:
+            self.check_unsaved_changes(self._new_scene)
+
+    def _new_scene(self) -> None:
+        self.viewport.reset_scene()
+        self.viewport.model.modified = False
 
     def open_file(self) -> None:
-        if not self.check_unsaved_changes():
+        if self.file_task is None:
+            self.check_unsaved_changes(self._choose_and_open)
+
+    def _choose_and_open(self) -> None:
+        filename, _ = QFileDialog.getOpenFileName(self, "Open Model", "", MODEL_FILTERS)
+        if not filename:
             return
-            
-        filename, _ = QFileDialog.getOpenFileName(self, "Open Model", "", "JSON Files (*.json)")
-        if filename:
-            try:
-                self.viewport.model.load_from_file(filename)
-                self.viewport.update()
-            except Exception as e:
-                QMessageBox.critical(self, "Error", f"Could not load file:\n{e}")
-
-    def save_file(self) -> bool:
-        filename, _ = QFileDialog.getSaveFileName(self, "Save Model", "", "JSON Files (*.json)")
-        if filename:
-            try:
-                self.viewport.model.save_to_file(filename)
-                return True
-            except Exception as e:
-                QMessageBox.critical(self, "Error", f"Could not save file:\n{e}")
-                return False
-        return False
+        task = file_io.load_task(filename)
+        task.signals.finished.connect(self._load_finished)
+        task.signals.failed.connect(self._load_failed)
+        # Loading replaces the model, so block editing until it is done
+        self._start_file_task(task, "Loading model...", Qt.WindowModality.WindowModal)
+
+    def _load_finished(self, model) -> None:
+        cancelled = self.file_task.is_cancelled
+        self._end_file_task()
+        if cancelled:
+            return
+        # Swap the whole model in one step; the renderer drops the old GPU buffers
+        self.viewport.set_model(model)
+        self.refresh_palette()
+
+    def _load_failed(self, message: str) -> None:
+        self._end_file_task()
+        QMessageBox.critical(self, "Error", f"Could not load file:\n{message}")
+
+    def save_file(self, on_saved: Optional[Callable[[], None]] = None) -> None:
+        if self.file_task is not None:
+            return
+        filename, selected = QFileDialog.getSaveFileName(self, "Save Model", "", "Binary Model (*.bbm);;JSON Files (*.json)")
+        if not filename:
+            return
+        if not filename.lower().endswith((".bbm", ".json")):
+            filename += ".bbm" if selected.startswith("Binary") else ".json"
+        task = file_io.save_task(self.viewport.model, filename)
+        self._on_saved = on_saved
+        task.signals.finished.connect(self._save_finished)
+        task.signals.failed.connect(self._save_failed)
+        # The viewport stays editable while the snapshot is written
+        self._start_file_task(task, "Saving model...", Qt.WindowModality.NonModal)
+
+    def _save_finished(self, revision: int) -> None:
+        on_saved = self._on_saved
+        self._end_file_task()
+        model = self.viewport.model
+        # Edits made during the save are still unsaved
+        if model.revision == revision:
+            model.modified = False
+        if on_saved is not None:
+            on_saved()
+
+    def _save_failed(self, message: str) -> None:
+        self._end_file_task()
+        QMessageBox.critical(self, "Error", f"Could not save file:\n{message}")
+
+    def export_image(self) -> None:
+        if self.file_task is not None:
+            return
+        filename, _ = QFileDialog.getSaveFileName(self, "Export Image", "", "PNG Images (*.png)")
+        if not filename:
+            return
+        if not filename.lower().endswith(".png"):
+            filename += ".png"
+        # Same framing as the viewport, at a chosen width
+        view_width, view_height = max(self.viewport.width(), 1), max(self.viewport.height(), 1)
+        default = min(view_width * IMAGE_EXPORT_SCALE, IMAGE_EXPORT_MAX_SIZE)
+        width, ok = QInputDialog.getInt(self, "Export Image", "Width in pixels:", default, 16, IMAGE_EXPORT_MAX_SIZE)
+        if not ok:
+            return
+        height = max(1, min(round(width * view_height / view_width), IMAGE_EXPORT_MAX_SIZE))
+        task = file_io.export_image_task(self.viewport.model, self.viewport.camera, filename, width, height,
+                                         self.viewport.section_z())
+        task.signals.finished.connect(self._file_exported)
+        task.signals.failed.connect(self._export_failed)
+        self._start_file_task(task, "Exporting image...", Qt.WindowModality.NonModal)
+
+    def export_svg(self) -> None:
+        if self.file_task is not None:
+            return
+        filename, _ = QFileDialog.getSaveFileName(self, "Export Vector Image", "", "SVG Images (*.svg)")
+        if not filename:
+            return
+        if not filename.lower().endswith(".svg"):
+            filename += ".svg"
+        # One SVG unit per viewport pixel; the file scales losslessly from there
+        width, height = max(self.viewport.width(), 1), max(self.viewport.height(), 1)
+        task = file_io.export_svg_task(self.viewport.model, self.viewport.camera, filename, width, height,
+                                       self.viewport.section_z())
+        task.signals.finished.connect(self._file_exported)
+        task.signals.failed.connect(self._export_failed)
+        self._start_file_task(task, "Exporting vector image...", Qt.WindowModality.NonModal)
+
+    def export_mesh(self) -> None:
+        if self.file_task is not None:
+            return
+        if not len(self.viewport.model):
+            QMessageBox.information(self, "Export", "The model is empty.")
+            return
+        filename, selected = QFileDialog.getSaveFileName(self, "Export Mesh", "", "STL Files (*.stl);;OBJ Files (*.obj)")
+        if not filename:
+            return
+        if not filename.lower().endswith((".stl", ".obj")):
+            filename += ".obj" if selected.startswith("OBJ") else ".stl"
+        task = file_io.export_mesh_task(self.viewport.model, filename)
+        task.signals.finished.connect(self._file_exported)
+        task.signals.failed.connect(self._export_failed)
+        self._start_file_task(task, "Exporting mesh...", Qt.WindowModality.NonModal)
+
+    def export_instructions(self) -> None:
+        if self.file_task is not None:
+            return
+        if not len(self.viewport.model):
+            QMessageBox.information(self, "Export", "The model is empty.")
+            return
+        directory = QFileDialog.getExistingDirectory(self, "Export Layer Instructions")
+        if not directory:
+            return
+        task = file_io.export_layers_task(self.viewport.model, self.viewport.camera, directory)
+        task.signals.finished.connect(self._instructions_exported)
+        task.signals.failed.connect(self._export_failed)
+        # Works on a snapshot, so editing can go on meanwhile
+        self._start_file_task(task, "Exporting layer images...", Qt.WindowModality.NonModal)
+
+    def _file_exported(self, result) -> None:
+        self._end_file_task()
+
+    def _instructions_exported(self, filenames) -> None:
+        self._end_file_task()
+        QMessageBox.information(self, "Export", f"Exported {len(filenames)} layer images.")
+
+    def _export_failed(self, message: str) -> None:
+        self._end_file_task()
+        QMessageBox.critical(self, "Error", f"Could not export:\n{message}")
+
+    def _start_file_task(self, task: file_io.FileTask, label: str, modality: Qt.WindowModality) -> None:
+        self.file_task = task
+        dialog = QProgressDialog(label, "Cancel", 0, 100, self)
+        dialog.setWindowModality(modality)
+        dialog.setMinimumDuration(300)
+        dialog.setAutoClose(False)
+        dialog.setAutoReset(False)
+        dialog.setValue(0)
+        dialog.canceled.connect(task.cancel)
+        self.progress_dialog = dialog
+        task.signals.progress.connect(dialog.setValue)
+        task.signals.cancelled.connect(self._end_file_task)
+        QThreadPool.globalInstance().start(task)
+
+    def _end_file_task(self) -> None:
+        if self.progress_dialog is not None:
+            self.progress_dialog.canceled.disconnect()
+            self.progress_dialog.close()
+            self.progress_dialog.deleteLater()
+        self.progress_dialog = None
+        self.file_task = None
+        self._on_saved = None
@@ -0,0 +1,65 @@
+import time
+from typing import Any, Callable, Dict
+from PySide6.QtCore import QTimer
+from PySide6.QtWidgets import QWidget
+
+
+class RedrawScheduler:
+    # Gatekeeper in front of QWidget.update(). Input handlers call request() as often
+    # as they like; bursts are coalesced into at most one repaint per display refresh,
+    # and the repaint is skipped when the visible state (as returned by state_fn) is
+    # the same as in the last rendered frame.
+    def __init__(self, widget: QWidget, state_fn: Callable[[], Any]) -> None:
+        self.widget = widget
+        self.state_fn = state_fn
+        self.timer = QTimer(widget)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self._flush)
+        self._last_state = None
+        self._last_frame_time = 0.0
+        self._force = False
+
+        # Counters; requested = rendered + coalesced + skipped (+ pending)
+        self.requested = 0
+        self.coalesced = 0
+        self.skipped = 0
+        self.rendered = 0
+
+    def frame_interval(self) -> float:
+        screen = self.widget.screen()
+        rate = screen.refreshRate() if screen is not None else 0
+        return 1.0 / (rate if rate > 0 else 60.0)
+
+    def request(self, force: bool = False) -> None:
+        # force: repaint even if the tracked state looks unchanged
+        self.requested += 1
+        self._force |= force
+        if self.timer.isActive():
+            self.coalesced += 1
+            return
+        # The first request after a quiet period goes out on the next event loop pass;
+        # later ones wait until a refresh interval has passed since the last frame
+        wait = self._last_frame_time + self.frame_interval() - time.perf_counter()
+        self.timer.start(max(0, int(wait * 1000)))
+
+    def _flush(self) -> None:
+        if not self._force and self.state_fn() == self._last_state:
+            self.skipped += 1
+            return
+        self._force = False
+        self.widget.update()
+
+    def frame_rendered(self, state: Any) -> None:
+        # Called from paintGL with the state being drawn (Qt also repaints on its own,
+        # e.g. on resize or expose)
+        self.rendered += 1
+        self._last_state = state
+        self._last_frame_time = time.perf_counter()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "requested": self.requested,
+            "coalesced": self.coalesced,
+            "skipped": self.skipped,
+            "rendered": self.rendered,
+        }
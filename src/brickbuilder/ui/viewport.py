@@ -3,13 +3,20 @@ from PySide6.QtCore import Qt, QTimer
 from PySide6.QtGui import QMouseEvent, QWheelEvent
 import OpenGL.GL as gl
 import glm
+import numpy as np
 from typing import Optional
 from brickbuilder.core.renderer import Renderer
 from brickbuilder.core.camera import Camera
 from brickbuilder.core.model import Model
-from brickbuilder.core import picking
+from brickbuilder.core.history import History
+from brickbuilder.core import fill, picking
 from brickbuilder.core.tools import Tool
 from brickbuilder.core.colors import COLORS, DEFAULT_COLOR
+from brickbuilder.ui.redraw import RedrawScheduler
+
+EMPTY_SELECTION = np.zeros((0, 3), dtype=np.int32)
+# Mouse travel in pixels before a Select click becomes a marquee drag
+MARQUEE_THRESHOLD = 4
 
 class Viewport(QOpenGLWidget):
     def __init__(self, parent=None):
@@ -17,14 +24,27 @@ class Viewport(QOpenGLWidget):
         self.renderer = Renderer()
         self.camera = Camera()
         self.model = Model()
+        # Undo/redo; each tool click is recorded as one step
+        self.history = History(self.model)
         
         self.current_tool = Tool.PLACE
-        self.current_color = DEFAULT_COLOR
+        # Palette index into self.model.palette
+        self.current_color_index = self.model.palette.index_of(DEFAULT_COLOR)
         
         self.ghost_position: Optional[glm.ivec3] = None
         self.ghost_color = glm.vec3(0.0, 1.0, 0.0) # Green ghost
         
         self.selected_brick_pos: Optional[glm.ivec3] = None
+        # Multi-selection from marquee drags in Select mode, as (N, 3) positions.
+        # Every assignment bumps selection_revision (see the property below).
+        self.selection_revision = 0
+        self.selection = EMPTY_SELECTION
+        self.marquee_start = None
+        self.marquee = None
+
+        # Section view: highest Z layer drawn, None shows everything
+        self.section_layer: Optional[int] = None
+        self.setFocusPolicy(Qt.FocusPolicy.StrongFocus)
         
         # Enable mouse tracking for hover effects if needed later
         self.setMouseTracking(True)
@@ -34,6 +54,9 @@ class Viewport(QOpenGLWidget):
         
         self.last_mouse_pos = None
 
+        # Mouse moves and other input ask for frames through this instead of update()
+        self.redraw = RedrawScheduler(self, self._visible_state)
+
     def initializeGL(self):
         self.renderer.initialize()
 
@@ -41,25 +64,111 @@ class Viewport(QOpenGLWidget):
         self.camera.set_aspect_ratio(w / h)
         gl.glViewport(0, 0, w, h)
 
+    @property
+    def selection(self) -> np.ndarray:
+        return self._selection
+
+    @selection.setter
+    def selection(self, positions: np.ndarray) -> None:
+        # Counted rather than compared by id(): a new array can reuse a freed one's id
+        self._selection = positions
+        self.selection_revision += 1
+
+    def _visible_state(self):
+        # Everything paintGL draws from; equal states render identical frames
+        ghost = tuple(self.ghost_position) if self.ghost_position is not None else None
+        selected = tuple(self.selected_brick_pos) if self.selected_brick_pos is not None else None
+        return (ghost, selected, self.selection_revision, self.marquee, self.section_layer, self.camera.revision, id(self.model), self.model.revision)
+
     def paintGL(self):
+        self.redraw.frame_rendered(self._visible_state())
         pixel_ratio = self.devicePixelRatio()
-        self.renderer.render(self.camera, self.model, self.ghost_position, int(self.width() * pixel_ratio), int(self.height() * pixel_ratio), self.selected_brick_pos)
+        marquee = None if self.marquee is None else tuple(v * pixel_ratio for v in self.marquee)
+        self.renderer.render(self.camera, self.model, self.ghost_position, int(self.width() * pixel_ratio), int(self.height() * pixel_ratio), self.selected_brick_pos,
+                             section_z=self.section_z(), target_fbo=self.defaultFramebufferObject(), selection=self.selection, marquee=marquee)
 
     def set_tool(self, tool: Tool):
         self.current_tool = tool
         self.ghost_position = None
-        self.selected_brick_pos = None
-        self.update()
+        self.clear_selection()
+        self.redraw.request()
 
     def reset_scene(self):
         self.model.clear()
         self.camera.reset()
         self.ghost_position = None
+        self.clear_selection()
+        self.section_layer = None
+        self.redraw.request()
+
+    def set_model(self, model: Model):
+        # Replace the edited model wholesale (e.g. after a background load)
+        self.history.detach()
+        self.model = model
+        self.history = History(model)
+        self.ghost_position = None
+        self.clear_selection()
+        self.section_layer = None
+        self.redraw.request()
+
+    def undo(self):
+        if self.history.undo():
+            self.clear_selection()
+            self.redraw.request()
+
+    def redo(self):
+        if self.history.redo():
+            self.clear_selection()
+            self.redraw.request()
+
+    def clear_selection(self):
         self.selected_brick_pos = None
-        self.update()
+        self.selection = EMPTY_SELECTION
+
+    def delete_selection(self):
+        # Remove the selected bricks as one undo step
+        positions = self.selection
+        if self.selected_brick_pos is not None:
+            positions = np.vstack([positions, np.array([tuple(self.selected_brick_pos)], dtype=np.int32)])
+        if len(positions):
+            with self.history.action("Delete"):
+                self.model.remove_bricks(positions)
+            self.clear_selection()
+            self.redraw.request()
 
-    def set_current_color(self, color: glm.vec3):
-        self.current_color = color
+    def section_z(self) -> Optional[float]:
+        # World height of the cut: layer z spans z..z+1
+        if self.section_layer is None:
+            return None
+        return float(self.section_layer + 1)
+
+    def step_section(self, delta: int):
+        # Move the cut one layer down (-1) or up (+1). Stepping above the top layer
+        # turns the section view off; stepping down from off starts at the top.
+        # Only an index range changes per step, so paging is instant.
+        layers = self.model.layer_range()
+        if layers is None:
+            self.section_layer = None
+        elif self.section_layer is None:
+            if delta < 0:
+                self.section_layer = max(layers[1] - 1, layers[0])
+        else:
+            layer = self.section_layer + delta
+            self.section_layer = None if layer >= layers[1] else max(layer, layers[0])
+        self.redraw.request()
+
+    def keyPressEvent(self, event):
+        if event.key() == Qt.Key.Key_PageDown:
+            self.step_section(-1)
+        elif event.key() == Qt.Key.Key_PageUp:
+            self.step_section(1)
+        elif event.key() == Qt.Key.Key_Delete:
+            self.delete_selection()
+        else:
+            super().keyPressEvent(event)
+
+    def set_current_color(self, color_index: int):
+        self.current_color_index = color_index
         # If in Paint mode and something selected, paint it?
         if self.current_tool == Tool.SELECT and self.selected_brick_pos:
              pass
@@ -69,46 +178,79 @@ class Viewport(QOpenGLWidget):
         
         if event.buttons() & Qt.MouseButton.LeftButton:
             self._handle_left_click(event)
-            self.update()
+            self.redraw.request()
 
     def _handle_left_click(self, event: QMouseEvent):
         ray = picking.get_mouse_ray(event.position().x(), event.position().y(), self.width(), self.height(), self.camera)
 
-        if self.current_tool == Tool.PLACE:
-            self._handle_place_tool(event, ray)
-        elif self.current_tool == Tool.SELECT:
-            self._handle_select_tool(ray)
-        elif self.current_tool == Tool.PAINT:
-            self._handle_paint_tool(ray)
-        elif self.current_tool == Tool.ERASE:
-            self._handle_erase_tool(ray)
+        with self.history.action(self.current_tool.name):
+            if self.current_tool == Tool.PLACE:
+                self._handle_place_tool(event, ray)
+            elif self.current_tool == Tool.SELECT:
+                self._handle_select_tool(event, ray)
+            elif self.current_tool == Tool.PAINT:
+                self._handle_paint_tool(event, ray)
+            elif self.current_tool == Tool.ERASE:
+                self._handle_erase_tool(ray)
 
     def _handle_place_tool(self, event: QMouseEvent, ray):
         if self.ghost_position:
             if event.modifiers() & Qt.KeyboardModifier.ControlModifier:
                  # Quick erase override in Place mode
-                hit_pos, _, _ = picking.intersect_model(ray, self.model)
+                hit_pos, _, _ = picking.intersect_model(ray, self.model, self.section_layer)
                 if hit_pos:
                    self.model.remove_brick(hit_pos)
             else:
-                self.model.add_brick(self.ghost_position, self.current_color)
+                self.model.add_brick(self.ghost_position, self.current_color_index)
                 # Refresh ghost immediately
                 self.update_ghost(event.position().x(), event.position().y())
 
-    def _handle_select_tool(self, ray):
-        hit_pos, _, _ = picking.intersect_model(ray, self.model)
-        self.selected_brick_pos = hit_pos
+    def _handle_select_tool(self, event: QMouseEvent, ray):
+        # A click selects one brick; dragging from here draws a marquee (see
+        # mouseMoveEvent/mouseReleaseEvent). Shift adds to the selection.
+        hit_pos, _, _ = picking.intersect_model(ray, self.model, self.section_layer)
+        self.marquee_start = event.position()
+        if event.modifiers() & Qt.KeyboardModifier.ShiftModifier:
+            if hit_pos:
+                self._extend_selection(np.array([tuple(hit_pos)], dtype=np.int32))
+        else:
+            self.selection = EMPTY_SELECTION
+            self.selected_brick_pos = hit_pos
 
-    def _handle_paint_tool(self, ray):
-        hit_pos, _, _ = picking.intersect_model(ray, self.model)
-        if hit_pos:
-            brick = self.model.get_brick(hit_pos)
-            if brick:
-                brick.color = self.current_color
-                self.model.modified = True
+    def _extend_selection(self, positions):
+        # Union with the current selection; a single clicked brick joins it too
+        if self.selected_brick_pos is not None:
+            positions = np.vstack([positions, np.array([tuple(self.selected_brick_pos)], dtype=np.int32)])
+            self.selected_brick_pos = None
+        positions = np.vstack([self.selection, positions.astype(np.int32)])
+        self.selection = np.unique(positions, axis=0)
+
+    def _finish_marquee(self, event: QMouseEvent):
+        x0, y0, x1, y1 = self.marquee
+        self.marquee = None
+        positions = picking.pick_rect(x0, y0, x1, y1, self.width(), self.height(), self.camera, self.model, self.section_layer)
+        if event.modifiers() & Qt.KeyboardModifier.ShiftModifier:
+            self._extend_selection(positions)
+        else:
+            self.selected_brick_pos = None
+            self.selection = positions
+
+    def _handle_paint_tool(self, event: QMouseEvent, ray):
+        hit_pos, _, _ = picking.intersect_model(ray, self.model, self.section_layer)
+        if not hit_pos:
+            return
+        modifiers = event.modifiers()
+        if modifiers & Qt.KeyboardModifier.ShiftModifier:
+            # Bucket fill: every connected brick of the clicked color, as one edit.
+            # Ctrl restricts it to bricks with a visible face.
+            surface_only = bool(modifiers & Qt.KeyboardModifier.ControlModifier)
+            region = fill.connected_region(self.model, hit_pos, surface_only, self.section_layer)
+            self.model.paint_bricks(region, self.current_color_index)
+        else:
+            self.model.set_brick_color(hit_pos, self.current_color_index)
 
     def _handle_erase_tool(self, ray):
-        hit_pos, _, _ = picking.intersect_model(ray, self.model)
+        hit_pos, _, _ = picking.intersect_model(ray, self.model, self.section_layer)
         if hit_pos:
             self.model.remove_brick(hit_pos)
 
@@ -121,6 +263,11 @@ class Viewport(QOpenGLWidget):
         else:
             self.ghost_position = None
 
+        if self.marquee_start is not None and event.buttons() & Qt.MouseButton.LeftButton:
+            start = self.marquee_start
+            if self.marquee is not None or (current_pos - start).manhattanLength() >= MARQUEE_THRESHOLD:
+                self.marquee = (start.x(), start.y(), current_pos.x(), current_pos.y())
+
         if self.last_mouse_pos is not None:
              # Navigation stays same
             delta = current_pos - self.last_mouse_pos
@@ -136,48 +283,24 @@ class Viewport(QOpenGLWidget):
                     sensitivity = 0.01
                     self.camera.orbit(-delta.x() * sensitivity, -delta.y() * sensitivity)
         
-        self.update()
+        self.redraw.request()
+
+    def mouseReleaseEvent(self, event: QMouseEvent):
+        if event.button() == Qt.MouseButton.LeftButton:
+            if self.marquee is not None:
+                self._finish_marquee(event)
+                self.redraw.request()
+            self.marquee_start = None
 
     def update_ghost(self, mouse_x, mouse_y):
         ray = picking.get_mouse_ray(mouse_x, mouse_y, self.width(), self.height(), self.camera)
-        
-        # Check model intersection first
-        hit_pos, normal, neighbor = picking.intersect_model(ray, self.model)
-        
-        if neighbor:
-            # Snap to neighbor
-            self.ghost_position = neighbor
-        elif ray.direction.z < -1e-6:
-            # Check ground plane (Z=0) intersection ONLY if looking down
-            # Normal (0,0,1), Point (0,0,0)
-            t = picking.intersect_plane(ray, glm.vec3(0, 0, 1), glm.vec3(0, 0, 0))
-            if t:
-                hit_point = ray.origin + ray.direction * t
-                # Round to nearest int
-                x = round(hit_point.x)
-                y = round(hit_point.y)
-                # Z should be 0, but for brick center Z=0 means it goes from -0.5 to 0.5. 
-                # If we want it ON the grid, center Z=0.5.
-                # Let's assume Grid is at Z=0, and Bricks sit ON TOP.
-                # So first layer center Z=0.5 (index 0?)
-                # If grid is visual guide at Z=0. 
-                # Let's say brick index (x,y,z) is center (x, y, z+0.5).
-                # Wait, earlier I said center at integer coordinates.
-                # If grid is Z=0, and we want bricks on top, then index Z=0 should mean center Z=0.5 visually?
-                # Or we just use Z=0 as center, so it sinks half way.
-                # User requirement: "placed on the face of the selected block, or on the grid".
-                # Usually on grid means sitting on it.
-                # So Z index 0 center = (x, y, 0.5).
-                
-                # Let's adjust rendering later. For now logic: index 0.
-                self.ghost_position = glm.ivec3(x, y, 0)
-            else:
-                self.ghost_position = None
-        else:
-            self.ghost_position = None
+
+        # Snap to the face of the hit brick, or onto the ground grid
+        _, _, neighbor = picking.pick_placement(ray, self.model, self.section_layer)
+        self.ghost_position = neighbor
 
 
     def wheelEvent(self, event: QWheelEvent):
         delta = event.angleDelta().y()
         self.camera.zoom(delta * 0.005)
-        self.update()
+        self.redraw.request()
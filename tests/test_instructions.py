@@ -0,0 +1,37 @@
+import unittest
+import numpy as np
+from brickbuilder.core.instructions import fit_camera, page_layers, render_page
+from brickbuilder.core.model import Model
+
+
+def truncated(model: Model, layer: int) -> Model:
+    positions, color_index = model.get_arrays()
+    keep = positions[:, 2] <= layer
+    low = Model()
+    low.add_bricks(positions[keep], color_index[keep])
+    return low
+
+
+class RenderPageTest(unittest.TestCase):
+    def assert_pages_ignore_layers_above(self, model: Model) -> None:
+        camera = fit_camera(model, 160, 120)
+        for layer in page_layers(model)[:-1]:
+            page = render_page(model, camera, layer, 160, 120)
+            expected = render_page(truncated(model, layer), camera, layer, 160, 120)
+            self.assertTrue(np.array_equal(page, expected), f"layer {layer}")
+
+    def test_overhang(self):
+        model = Model()
+        model.add_bricks(np.array([[0, 0, 0], [1, 0, 0], [2, 0, 1], [3, 0, 1], [0, 0, 2]]), 0)
+        self.assert_pages_ignore_layers_above(model)
+
+    def test_random_models(self):
+        rng = np.random.default_rng(3)
+        for _ in range(3):
+            model = Model()
+            model.add_bricks(rng.integers(0, 6, (120, 3)), rng.integers(0, 3, 120))
+            self.assert_pages_ignore_layers_above(model)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+import numpy as np
+from brickbuilder.core.mesh import build_chunk_mesh
+from brickbuilder.core.model import Model
+
+
+def section_segments(model: Model, layer: int) -> set:
+    # Unit outline segments (on the corner lattice) a section cut at the top of `layer`
+    # draws: the line prefix up to `layer` plus the cap lines of `layer`, clipped at the cut
+    units = set()
+    for chunk in model.chunks.values():
+        mesh = build_chunk_mesh(model, chunk)
+        count = int(np.searchsorted(mesh.line_layers, layer, side="right"))
+        first, last = np.searchsorted(mesh.cap_line_layers, (layer, layer + 1)) + len(mesh.line_layers)
+        index = np.r_[np.arange(count), np.arange(first, last)]
+        segments = mesh.vertices[mesh.lines.reshape(-1, 2)[index]]
+        for start, end in (segments + 0.5).astype(int).tolist():
+            start, end = np.array(start), np.array(end)
+            step = np.sign(end - start)
+            for i in range(int(np.abs(end - start).sum())):
+                unit = (tuple(start + i * step), tuple(start + (i + 1) * step))
+                if max(unit[0][2], unit[1][2]) <= layer + 1:
+                    units.add(unit)
+    return units
+
+
+def truncated(model: Model, layer: int) -> Model:
+    positions, color_index = model.get_arrays()
+    keep = positions[:, 2] <= layer
+    low = Model()
+    low.add_bricks(positions[keep], color_index[keep])
+    return low
+
+
+class SectionOutlineTest(unittest.TestCase):
+    def test_overhang_outline_not_in_lower_cut(self):
+        model = Model()
+        model.add_bricks(np.array([[0, 0, 0], [3, 0, 1]]), 0)
+        for start, end in section_segments(model, 0):
+            self.assertLessEqual(max(start[0], end[0]), 1)
+
+    def test_cut_ignores_bricks_above(self):
+        rng = np.random.default_rng(1)
+        for _ in range(4):
+            model = Model()
+            model.add_bricks(rng.integers(0, 6, (120, 3)), rng.integers(0, 3, 120))
+            for layer in range(5):
+                self.assertEqual(section_segments(model, layer), section_segments(truncated(model, layer), layer))
+
+
+if __name__ == "__main__":
+    unittest.main()